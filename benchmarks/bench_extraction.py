@@ -0,0 +1,147 @@
+"""
+Compares the single-pass extractor (skill_frame.extraction) with the previous
+regex key-by-key fallback from parse_llm_json_response.
+
+Runs every response in corpus/malformed_scenarios.jsonl through both
+implementations, reports fields where they disagree, then times both on the
+corpus and on responses padded to larger sizes.
+
+    python benchmarks/bench_extraction.py [--repeat N]
+"""
+
+import argparse
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from skill_frame.extraction import extract_fields, extract_success_criteria  # noqa: E402
+
+CORPUS = Path(__file__).resolve().parent / "corpus" / "malformed_scenarios.jsonl"
+
+STRING_FIELDS = [
+    "title", "author", "description", "user_name", "user_role", "user_avatar",
+    "ai_name", "ai_role", "ai_avatar", "ai_description", "chat_prompt",
+]
+
+
+def legacy_extract(response_text):
+    """The regex fallback as it was before the single-pass extractor"""
+    scenario = {}
+    for field in STRING_FIELDS:
+        patterns = [
+            rf'"{field}"\s*:\s*"([^"]*)"',
+            rf"'{field}'\s*:\s*'([^']*)'",
+            rf'"{field}"\s*:\s*([^,}}\n]+)',
+        ]
+        for pattern in patterns:
+            match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
+            if match:
+                scenario[field] = match.group(1).strip().strip('"\'')
+                break
+    success_criteria = legacy_extract_success_criteria(response_text)
+    if success_criteria:
+        scenario["success_criteria"] = success_criteria
+    return scenario
+
+
+def legacy_extract_success_criteria(response_text):
+    success_criteria = []
+    array_patterns = [
+        r'"success_criteria"\s*:\s*\[([^\]]*)\]',
+        r"'success_criteria'\s*:\s*\[([^\]]*)\]",
+        r'"success_criteria"\s*:\s*\[(.*?)\]',
+    ]
+    for pattern in array_patterns:
+        match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
+        if match:
+            array_content = match.group(1)
+            for item_pattern in (r'"([^"]+)"', r"'([^']+)'"):
+                items = re.findall(item_pattern, array_content)
+                if items:
+                    success_criteria = [item.strip() for item in items if item.strip()]
+                    if len(success_criteria) >= 3:
+                        return success_criteria
+    criteria_section = False
+    for line in response_text.split('\n'):
+        line = line.strip()
+        if 'success_criteria' in line.lower() or criteria_section:
+            criteria_section = True
+            if line and (line.startswith('-') or line.startswith('*') or line.startswith('•')):
+                criterion = line.lstrip('-*•').strip().strip('"\'')
+                if criterion and len(criterion) > 5:
+                    success_criteria.append(criterion)
+            elif line.startswith('"') and line.endswith('"'):
+                criterion = line.strip('"')
+                if criterion and len(criterion) > 5:
+                    success_criteria.append(criterion)
+            elif ']' in line or '}' in line:
+                criteria_section = False
+    if not success_criteria:
+        matches = re.findall(r'\d+\.\s*([^\n]+)', response_text)
+        if matches:
+            success_criteria = [m.strip().strip('"\'.,') for m in matches if len(m.strip()) > 10]
+    return success_criteria[:10] if success_criteria else []
+
+
+def single_pass_extract(response_text):
+    """The extraction step parse_llm_json_response runs now"""
+    scenario = extract_fields(response_text, STRING_FIELDS, ("success_criteria",))
+    success_criteria = extract_success_criteria(response_text, scenario.pop("success_criteria", None))
+    if success_criteria:
+        scenario["success_criteria"] = success_criteria
+    return scenario
+
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(corpus):
+    differences = 0
+    for case in corpus:
+        old = legacy_extract(case["response"])
+        new = single_pass_extract(case["response"])
+        for field in sorted(set(old) | set(new)):
+            if old.get(field) != new.get(field):
+                differences += 1
+                print(f"  {case['name']}.{field}:")
+                print(f"    legacy:      {old.get(field)!r}")
+                print(f"    single-pass: {new.get(field)!r}")
+    return differences
+
+
+def bench(label, texts, repeat):
+    legacy = timeit.timeit(lambda: [legacy_extract(t) for t in texts], number=repeat)
+    single = timeit.timeit(lambda: [single_pass_extract(t) for t in texts], number=repeat)
+    per_call = 1e6 / (repeat * len(texts))
+    print(f"{label:<28} legacy {legacy * per_call:9.1f} us   single-pass {single * per_call:9.1f} us   "
+          f"speedup {legacy / single:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus)} responses from {CORPUS.name}")
+    print("Field differences (legacy vs single-pass):")
+    differences = compare(corpus)
+    print(f"  {differences} differing fields\n")
+
+    texts = [case["response"] for case in corpus]
+    bench("corpus", texts, args.repeat)
+    # Long or malformed responses: model prose before the JSON, then a truncated object
+    for size in (10_000, 100_000):
+        padded = [("Sure! " * (size // 6)) + t for t in texts if t]
+        bench(f"corpus + {size // 1000}k chars prose", padded, max(args.repeat // 20, 3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Load test for the websocket bridge and POST /roleplay.
+
+Starts main.py's app under uvicorn through benchmarks/fake_app.py, with
+ROLEPLAY_GENERATION=fake, so no model is called: the fake live runner answers
+each text message, and each second of received audio, with scripted events
+at realistic rates. N simulated clients then drive /ws/{session_id} in text, audio or video mode while others
+post to /roleplay. The report has p50/p99 latency and throughput per workload,
+CPU and memory per session from /sessions/stats, and event-loop lag.
+
+Results are written as JSON under benchmarks/results/; pass --compare with an
+earlier result to flag regressions. Needs the client libraries in
+requirements-bench.txt (httpx on top of requirements.txt):
+
+    pip install -r requirements-bench.txt
+
+    python benchmarks/bench_load.py [--clients 20] [--duration 30] [--modes text,audio,video]
+        [--roleplay 4] [--binary] [--compare benchmarks/results/<earlier>.json]
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(ROOT))
+
+from skill_frame.framing import HEADER_SIZE, decode_frame, encode_frame  # noqa: E402
+
+# Recorder worklet chunks: 128 samples of 16-bit PCM at 16 kHz
+AUDIO_CHUNK = bytes(256)
+AUDIO_CHUNK_S = 0.008
+UTTERANCE_S = 1.0
+
+# Lower is better for every metric compared across runs
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize_latencies(latencies, duration):
+    return {
+        "count": len(latencies),
+        "throughput_per_s": round(len(latencies) / duration, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+    }
+
+
+def test_jpeg(index):
+    """A small JPEG that changes every frame, or random bytes without Pillow"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return os.urandom(8000)
+    image = Image.new("RGB", (320, 240), (index * 37 % 256, 80, 160))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=70)
+    return buffer.getvalue()
+
+
+class Client:
+    """One simulated browser session."""
+
+    def __init__(self, base_url, session_id, mode, binary):
+        self.url = f"{base_url}/ws/{session_id}?is_audio={'true' if mode != 'text' else 'false'}"
+        if binary:
+            self.url += "&binary=true"
+        self.mode = mode
+        self.binary = binary
+        self.latencies = []
+        self.messages_received = 0
+        self.errors = 0
+        self._turn_started = None
+        self._turn_done = None
+        self._admitted = asyncio.Event()
+        self.rejected = 0
+        self.admission_wait = None
+
+    async def send(self, ws, mime_type, payload, source="unknown"):
+        if self.binary and mime_type != "text/plain":
+            await ws.send(encode_frame(mime_type, payload, source=source))
+        else:
+            data = payload if mime_type == "text/plain" else base64.b64encode(payload).decode("ascii")
+            await ws.send(json.dumps({"mime_type": mime_type, "data": data, "metadata": {"source": source}}))
+
+    async def run(self, deadline):
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                connected = time.monotonic()
+                reader = asyncio.create_task(self._read(ws))
+                try:
+                    # The server drops messages sent before it admits the session
+                    admitted = asyncio.create_task(self._admitted.wait())
+                    await asyncio.wait({admitted, reader}, timeout=max(deadline - time.monotonic(), 0.1),
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    admitted.cancel()
+                    if not self._admitted.is_set():
+                        return
+                    self.admission_wait = time.monotonic() - connected
+                    while time.monotonic() < deadline:
+                        self._turn_done = asyncio.Event()
+                        if self.mode == "text":
+                            self._turn_started = time.monotonic()
+                            await self.send(ws, "text/plain", "Here is my proposal for the budget.")
+                        else:
+                            await self._speak(ws)
+                            self._turn_started = time.monotonic()
+                        try:
+                            await asyncio.wait_for(self._turn_done.wait(), max(deadline - time.monotonic(), 0.1))
+                        except asyncio.TimeoutError:
+                            break
+                finally:
+                    reader.cancel()
+        except (OSError, websockets.WebSocketException):
+            self.errors += 1
+
+    async def _speak(self, ws):
+        """Streams one utterance in realtime, with a camera frame per second in video mode"""
+        chunks = int(UTTERANCE_S / AUDIO_CHUNK_S)
+        start = time.monotonic()
+        for i in range(chunks):
+            await self.send(ws, "audio/pcm", AUDIO_CHUNK)
+            if self.mode == "video" and i % int(1 / AUDIO_CHUNK_S) == 0:
+                await self.send(ws, "image/jpeg", test_jpeg(i), source="camera")
+            await asyncio.sleep(max(start + (i + 1) * AUDIO_CHUNK_S - time.monotonic(), 0))
+
+    async def _read(self, ws):
+        first = True
+        async for message in ws:
+            self.messages_received += 1
+            if isinstance(message, bytes):
+                if len(message) >= HEADER_SIZE:
+                    decode_frame(message)
+                payload = {}
+            else:
+                payload = json.loads(message)
+            if payload.get("mime_type") == "application/x-skill-frame-admission":
+                if payload["status"] == "admitted":
+                    self._admitted.set()
+                elif payload["status"] == "rejected":
+                    self.rejected += 1
+                continue
+            if first and self._turn_started is not None and not payload.get("turn_complete"):
+                # Time to the first reply event of the turn
+                self.latencies.append(time.monotonic() - self._turn_started)
+                first = False
+            if payload.get("turn_complete") or payload.get("interrupted"):
+                first = True
+                self._turn_started = None
+                if self._turn_done is not None:
+                    self._turn_done.set()
+
+
+async def roleplay_worker(client, base_url, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        prompt = f"Negotiating a deadline extension #{random.randrange(1000)}"
+        start = time.monotonic()
+        try:
+            response = await client.post(f"{base_url}/roleplay", json={"prompt": prompt})
+            response.raise_for_status()
+            latencies.append(time.monotonic() - start)
+        except httpx.HTTPError:
+            errors.append(prompt)
+
+
+async def sample_stats(client, base_url, deadline, samples):
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get(f"{base_url}/sessions/stats")
+            samples.append(response.json())
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1.0)
+
+
+async def run_load(port, args):
+    http_url = f"http://127.0.0.1:{port}"
+    ws_url = f"ws://127.0.0.1:{port}"
+    modes = args.modes.split(",")
+    async with httpx.AsyncClient(timeout=30) as http:
+        baseline = (await http.get(f"{http_url}/sessions/stats")).json()
+        deadline = time.monotonic() + args.duration
+        clients = [
+            Client(ws_url, 100000 + i, modes[i % len(modes)], args.binary)
+            for i in range(args.clients)
+        ]
+        roleplay_latencies, roleplay_errors, samples = [], [], []
+        started = time.monotonic()
+        await asyncio.gather(
+            *(client.run(deadline) for client in clients),
+            *(roleplay_worker(http, http_url, deadline, roleplay_latencies, roleplay_errors)
+              for _ in range(args.roleplay)),
+            sample_stats(http, http_url, deadline, samples),
+        )
+        elapsed = time.monotonic() - started
+        final = (await http.get(f"{http_url}/sessions/stats")).json()
+
+    peak_rss = max((sample["rss_bytes"] for sample in samples), default=final["rss_bytes"])
+    cpu = final["cpu_seconds"] - baseline["cpu_seconds"]
+    sessions = max(args.clients, 1)
+    result = {
+        "elapsed_s": round(elapsed, 2),
+        "websocket": {},
+        "roleplay": {**summarize_latencies(roleplay_latencies, elapsed), "errors": len(roleplay_errors)},
+        "process": {
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent_per_session": round(100 * cpu / elapsed / sessions, 3),
+            "peak_rss_bytes": peak_rss,
+            "rss_bytes_per_session": int((peak_rss - baseline["rss_bytes"]) / sessions),
+        },
+        "loop_lag": final.get("loop_lag", {}),
+    }
+    for mode in modes:
+        group = [client for client in clients if client.mode == mode]
+        latencies = [latency for client in group for latency in client.latencies]
+        waits = [client.admission_wait for client in group if client.admission_wait is not None]
+        result["websocket"][mode] = {
+            **summarize_latencies(latencies, elapsed),
+            "clients": len(group),
+            "messages_received": sum(client.messages_received for client in group),
+            "errors": sum(client.errors for client in group),
+            "rejected": sum(client.rejected for client in group),
+            "admission_wait_p99_ms": round(percentile(waits, 0.99) * 1000, 1) if waits else None,
+        }
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    env = {
+        **os.environ,
+        "ROLEPLAY_GENERATION": "fake",
+        # Every client shares one IP; admission limits still apply
+        "RATE_LIMIT_IP_PER_MINUTE": "0",
+        "RATE_LIMIT_USER_PER_MINUTE": "0",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+
+
+async def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            try:
+                # /ready waits for the SDK warm-up, so it isn't part of the measurement
+                if (await http.get(f"http://127.0.0.1:{port}/ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError("server did not start")
+
+
+def flatten(result, prefix=""):
+    flat = {}
+    for key, value in result.items():
+        if key == "config":
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(result, previous):
+    """Prints latency, lag and resource metrics that got worse by more than the threshold"""
+    current, before = flatten(result), flatten(previous)
+    regressions = 0
+    for key in sorted(current):
+        if not key.endswith(("_ms", "_per_session", "_bytes")) or not before.get(key):
+            continue
+        change = (current[key] - before[key]) / before[key]
+        marker = "REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        regressions += bool(marker)
+        print(f"  {key:45} {before[key]:>12} -> {current[key]:>12} ({change:+.1%}) {marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--modes", default="text,audio,video")
+    parser.add_argument("--roleplay", type=int, default=4, help="concurrent POST /roleplay clients")
+    parser.add_argument("--binary", action="store_true", help="use binary websocket framing")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--compare", type=Path, help="earlier result to compare against")
+    args = parser.parse_args()
+
+    port = args.port or free_port()
+    server = start_server(port)
+    try:
+        asyncio.run(wait_ready(port))
+        result = asyncio.run(run_load(port, args))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    result["config"] = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+    print(json.dumps({key: value for key, value in result.items() if key != "config"}, indent=2))
+
+    RESULTS.mkdir(exist_ok=True)
+    path = RESULTS / f"load-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.write_text(json.dumps(result, indent=2))
+    print(f"Saved {path}")
+
+    if args.compare:
+        print(f"Compared with {args.compare}:")
+        regressions = compare(result, json.loads(args.compare.read_text()))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
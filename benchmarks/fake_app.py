@@ -0,0 +1,83 @@
+"""
+main.py's app with live sessions answered by ``FakeLiveRunner``, so
+bench_load.py can drive the websocket bridge without calling a model:
+
+    uvicorn benchmarks.fake_app:app  (from the repository root)
+"""
+
+import asyncio
+
+from main import app, session_pool  # noqa: F401
+
+
+class FakeLiveRunner:
+    """
+    Offline stand-in for Runner.run_live for load tests and local runs.
+    Answers each text message, and each utterance_ms of received audio, with
+    a scripted reply: streamed text in text mode, or realtime 24 kHz audio
+    chunks with output transcription in audio mode.
+    """
+
+    def __init__(self, reply=None, words_per_second=15.0, audio_chunk_ms=40, utterance_ms=1000):
+        self.reply = reply or (
+            "Thanks for walking me through that. Before we agree on anything, "
+            "can you tell me how this affects the timeline and who owns the next step?"
+        )
+        self.words_per_second = words_per_second
+        self.audio_chunk_ms = audio_chunk_ms
+        self.utterance_bytes = int(16000 * 2 * utterance_ms / 1000)
+
+    async def run_live(self, session, live_request_queue, run_config):
+        from google.adk.events import Event
+        from google.genai.types import Content, Part
+
+        modalities = getattr(run_config, "response_modalities", None) or []
+        audio = any(str(modality).upper().endswith("AUDIO") for modality in modalities)
+        pending_audio = 0
+        while True:
+            request = await live_request_queue.get()
+            if request.close:
+                return
+            if request.content is not None:
+                async for event in self._reply(audio):
+                    yield event
+            elif request.blob is not None and request.blob.mime_type.startswith("audio/pcm"):
+                pending_audio += len(request.blob.data)
+                if pending_audio >= self.utterance_bytes:
+                    pending_audio = 0
+                    yield Event(
+                        author="user",
+                        content=Content(role="user", parts=[Part(text="This is what I said.")]),
+                    )
+                    async for event in self._reply(audio):
+                        yield event
+
+    async def _reply(self, audio):
+        from google.adk.events import Event
+        from google.genai.types import Blob, Content, Part
+
+        words = self.reply.split()
+        word_interval = 1.0 / self.words_per_second
+        if audio:
+            chunk = bytes(int(24000 * 2 * self.audio_chunk_ms / 1000))
+            chunks_per_word = max(int(word_interval * 1000 / self.audio_chunk_ms), 1)
+            for word in words:
+                for _ in range(chunks_per_word):
+                    await asyncio.sleep(self.audio_chunk_ms / 1000)
+                    yield Event(
+                        author="agent",
+                        content=Content(
+                            role="model", parts=[Part(inline_data=Blob(mime_type="audio/pcm;rate=24000", data=chunk))]
+                        ),
+                        partial=True,
+                    )
+                yield Event(author="agent", content=Content(role="model", parts=[Part(text=word + " ")]), partial=True)
+        else:
+            for word in words:
+                await asyncio.sleep(word_interval)
+                yield Event(author="agent", content=Content(role="model", parts=[Part(text=word + " ")]), partial=True)
+        yield Event(author="agent", content=Content(role="model", parts=[Part(text=self.reply)]), partial=False)
+        yield Event(author="agent", turn_complete=True)
+
+
+session_pool.runner = FakeLiveRunner()
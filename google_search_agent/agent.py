@@ -1,9 +1,7 @@
 from google.adk.agents import Agent
 from google.adk.tools import google_search  # Import the tool
 
-from dotenv import load_dotenv
-
-load_dotenv()
+# The environment (.env) is loaded by main.py, or by the ADK CLI for `adk web`
 
 root_agent = Agent(
     # A unique name for the agent.
@@ -1,36 +1,51 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import json
 import asyncio
-import base64
-import re
-import os
+import math
 
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import Body
-from json_repair import repair_json
-from jsonschema import validate, ValidationError
-
-from google.genai.types import (
-    Part,
-    Content,
-    Blob,
-)
 
-from google.adk.runners import Runner
-from google.adk.agents import LiveRequestQueue
-from google.adk.agents.run_config import RunConfig
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
-from google.adk.agents import Agent
-from google.adk.tools import google_search
-from google.genai.types import Modality
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request
+from fastapi.websockets import WebSocketState
+from starlette.background import BackgroundTask
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
-
-from google_search_agent.agent import root_agent
-from google import genai
+from skill_frame.admission import (
+    ADMISSION_MIME_TYPE, ADMITTED, QUEUED, RATE_LIMITED, AdmissionController, RateLimiter, Rejected,
+)
+from skill_frame.analysis import AnalysisEngine, transcript_from_events
+from skill_frame.assets import AssetStore
+from skill_frame.audio_out import PCM, audio_encoder
+from skill_frame.cache import ScenarioCache, config_fingerprint
+from skill_frame.generation import SCENARIO_PROMPT, FakeScenarioModel, GenaiScenarioModel, ScenarioEngine, build_scenario_prompt, clean_llm_response
+from skill_frame.documents import DocumentStore
+from skill_frame.flow import ChannelClosed, FlowRegistry, PendingRequests
+from skill_frame.frames import FrameFilter
+from skill_frame.framing import (
+    HELLO_MESSAGE, FrameError, decode_frame, decode_text_message, encode_audio_message, encode_frame,
+)
+from skill_frame.metrics import (
+    FIRST_RESPONSE_SECONDS, REGISTRY, ROLEPLAY_SECONDS, SESSION_SETUP_SECONDS, WS_BYTES, WS_MESSAGES, WS_SESSIONS,
+    FirstResponseTimer, LoopLagMonitor,
+)
+from skill_frame.offload import Offloader
+from skill_frame.parsing import (
+    ANALYSIS_SCHEMA, SCENARIO_SCHEMA, default_scenario, parse_llm_analysis_response, parse_llm_json_response,
+    parse_scenario_response,
+)
+from skill_frame.logs import ROLEPLAY, WS, configure_logging, get_logger, summarize, summarize_event
+from skill_frame.prewarm import PrewarmRegistry
+from skill_frame.transcripts import AGENT, USER, TranscriptStore
+from skill_frame.supervisor import IDLE, SHUTDOWN, SessionSupervisor
+from skill_frame.sessions import SessionLeases, SessionPool, build_session_service
+from skill_frame.validation import SchemaValidationError
+from skill_frame.warmup import FAILED, Warmup
 
 #
 # ADK Streaming
@@ -39,258 +54,290 @@ from google import genai
 # Load Gemini API Key
 load_dotenv()
 
+configure_logging()
+ws_log = get_logger(WS)
+roleplay_log = get_logger(ROLEPLAY)
+
 APP_NAME = "ADK Streaming example"
-session_service = InMemorySessionService()
-
-# JSON Schema for scenario validation
-SCENARIO_SCHEMA = {
-    "type": "object",
-    "properties": {
-        "title": {"type": "string", "minLength": 1},
-        "author": {"type": "string", "minLength": 1},
-        "description": {"type": "string", "minLength": 1},
-        "success_criteria": {
-            "type": "array",
-            "items": {"type": "string", "minLength": 1},
-            "minItems": 3
-        },
-        "user_name": {"type": "string", "minLength": 1},
-        "user_role": {"type": "string", "minLength": 1},
-        "user_avatar": {"type": "string", "minLength": 1},
-        "ai_name": {"type": "string", "minLength": 1},
-        "ai_role": {"type": "string", "minLength": 1},
-        "ai_avatar": {"type": "string", "minLength": 1},
-        "ai_description": {"type": "string", "minLength": 1},
-        "chat_prompt": {"type": "string", "minLength": 1}
+# Conversation transcripts, kept per session and spilled to disk for long sessions
+transcript_store = TranscriptStore(
+    os.environ.get("TRANSCRIPT_DIR", ".cache/transcripts"),
+    max_memory_turns=int(os.environ.get("TRANSCRIPT_MEMORY_TURNS", "200")),
+)
+ANALYSIS_MAX_TURNS = int(os.environ.get("ANALYSIS_MAX_TURNS", "400"))
+
+
+
+def load_root_agent():
+    from google_search_agent.agent import root_agent
+
+    return root_agent
+
+
+# Set SESSION_STORE_URL (e.g. sqlite:///.cache/sessions.db) to share sessions between workers
+SESSION_STORE_URL = os.environ.get("SESSION_STORE_URL")
+# The agent and session service are built by the warm-up below, not at import time
+session_pool = SessionPool(
+    APP_NAME,
+    load_root_agent,
+    lambda: build_session_service(SESSION_STORE_URL),
+    idle_timeout=float(os.environ.get("SESSION_IDLE_TIMEOUT", "300")),
+    leases=SessionLeases(os.environ.get("SESSION_LEASE_PATH", ".cache/session-leases.db")) if SESSION_STORE_URL else None,
+    on_delete=transcript_store.discard,
+)
+loop_monitor = LoopLagMonitor()
+
+
+def import_sdks():
+    import google.genai.types
+    import google.adk.agents
+    import google.adk.runners
+
+
+def import_audio():
+    import skill_frame.audio  # NumPy
+
+
+# Heavy SDK imports and agent construction, in order; see skill_frame/warmup.py
+# for the STARTUP_WARMUP modes (background, lazy or eager)
+warmup = Warmup(
+    [
+        ("sdk_imports", import_sdks),
+        ("root_agent", lambda: session_pool.agent),
+        ("session_service", lambda: session_pool.session_service),
+        ("runner", lambda: session_pool.runner),
+        ("audio", import_audio),
+    ],
+    mode=os.environ.get("STARTUP_WARMUP", "background"),
+)
+if warmup.mode == "eager":
+    warmup.run()
+
+# CPU-heavy parsing and decoding runs in a worker pool once its payload
+# reaches the op's threshold in bytes (see skill_frame/offload.py)
+offloader = Offloader(
+    mode=os.environ.get("OFFLOAD_POOL", "thread"),
+    workers=int(os.environ.get("OFFLOAD_WORKERS", "0")) or None,
+    thresholds={
+        "parse": int(os.environ.get("OFFLOAD_PARSE_MIN_BYTES", "8192")),
+        "decode": int(os.environ.get("OFFLOAD_DECODE_MIN_BYTES", "65536")),
+        "encode": int(os.environ.get("OFFLOAD_ENCODE_MIN_BYTES", "65536")),
+        "frame": int(os.environ.get("OFFLOAD_FRAME_MIN_BYTES", "65536")),
+        # 100 ms of agent audio; PCM passes through and always runs inline
+        "opus": int(os.environ.get("OFFLOAD_OPUS_MIN_BYTES", "4800")),
     },
-    "required": ["title", "author", "description", "success_criteria", "user_name", "user_role", "user_avatar", "ai_name", "ai_role", "ai_avatar", "ai_description", "chat_prompt"]
-}
+)
 
+# Scenario generation: "oneshot" (default), "live" (temporary live session) or "fake" (offline)
+ROLEPLAY_GENERATION = os.environ.get("ROLEPLAY_GENERATION", "oneshot")
+ROLEPLAY_BATCH_LIMIT = int(os.environ.get("ROLEPLAY_BATCH_LIMIT", "20"))
+scenario_model = FakeScenarioModel() if ROLEPLAY_GENERATION == "fake" else GenaiScenarioModel(SCENARIO_SCHEMA)
 
-def parse_llm_json_response(response_text, prompt):
-    """
-    Robust JSON parsing function that extracts fields individually and constructs a clean JSON object.
-    Uses multiple fallback strategies to handle malformed JSON responses.
-    """
-    print(f"[PARSE DEBUG] Starting to parse response of length: {len(response_text)}")
-    
-    # Strategy 1: Try direct JSON parsing
-    try:
-        parsed = json.loads(response_text)
-        # Validate against schema
-        validate(parsed, SCENARIO_SCHEMA)
-        print("[PARSE SUCCESS] Direct JSON parsing successful")
-        return parsed
-    except (json.JSONDecodeError, ValidationError) as e:
-        print(f"[PARSE DEBUG] Direct parsing failed: {e}")
-    
-    # Strategy 2: Try json-repair library
-    try:
-        repaired_json = repair_json(response_text)
-        parsed = json.loads(repaired_json)
-        validate(parsed, SCENARIO_SCHEMA)
-        print("[PARSE SUCCESS] JSON repair successful")
-        return parsed
-    except (json.JSONDecodeError, ValidationError) as e:
-        print(f"[PARSE DEBUG] JSON repair failed: {e}")
-    
-    # Strategy 3: Key-by-key extraction with regex patterns
-    print("[PARSE DEBUG] Attempting key-by-key extraction")
-    scenario = {}
-    
-    # Define extraction patterns for each field
-    field_patterns = {
-        'title': [
-            r'"title"\s*:\s*"([^"]*)"',
-            r"'title'\s*:\s*'([^']*)'",
-            r'"title"\s*:\s*([^,}\n]+)',
-        ],
-        'author': [
-            r'"author"\s*:\s*"([^"]*)"',
-            r"'author'\s*:\s*'([^']*)'",
-            r'"author"\s*:\s*([^,}\n]+)',
-        ],
-        'description': [
-            r'"description"\s*:\s*"([^"]*)"',
-            r"'description'\s*:\s*'([^']*)'",
-            r'"description"\s*:\s*([^,}\n]+)',
-        ],
-        'user_name': [
-            r'"user_name"\s*:\s*"([^"]*)"',
-            r"'user_name'\s*:\s*'([^']*)'",
-            r'"user_name"\s*:\s*([^,}\n]+)',
-        ],
-        'user_role': [
-            r'"user_role"\s*:\s*"([^"]*)"',
-            r"'user_role'\s*:\s*'([^']*)'",
-            r'"user_role"\s*:\s*([^,}\n]+)',
-        ],
-        'user_avatar': [
-            r'"user_avatar"\s*:\s*"([^"]*)"',
-            r"'user_avatar'\s*:\s*'([^']*)'",
-            r'"user_avatar"\s*:\s*([^,}\n]+)',
-        ],
-        'ai_name': [
-            r'"ai_name"\s*:\s*"([^"]*)"',
-            r"'ai_name'\s*:\s*'([^']*)'",
-            r'"ai_name"\s*:\s*([^,}\n]+)',
-        ],
-        'ai_role': [
-            r'"ai_role"\s*:\s*"([^"]*)"',
-            r"'ai_role'\s*:\s*'([^']*)'",
-            r'"ai_role"\s*:\s*([^,}\n]+)',
-        ],
-        'ai_avatar': [
-            r'"ai_avatar"\s*:\s*"([^"]*)"',
-            r"'ai_avatar'\s*:\s*'([^']*)'",
-            r'"ai_avatar"\s*:\s*([^,}\n]+)',
-        ],
-        'ai_description': [
-            r'"ai_description"\s*:\s*"([^"]*)"',
-            r"'ai_description'\s*:\s*'([^']*)'",
-            r'"ai_description"\s*:\s*([^,}\n]+)',
-        ],
-        'chat_prompt': [
-            r'"chat_prompt"\s*:\s*"([^"]*)"',
-            r"'chat_prompt'\s*:\s*'([^']*)'",
-            r'"chat_prompt"\s*:\s*([^,}\n]+)',
-        ]
-    }
-    
-    # Extract simple string fields
-    for field, patterns in field_patterns.items():
-        for pattern in patterns:
-            match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
-            if match:
-                value = match.group(1).strip().strip('"\'')
-                scenario[field] = value
-                print(f"[PARSE DEBUG] Extracted {field}: {value[:50]}...")
-                break
-    
-    # Special handling for success_criteria array - most problematic field
-    success_criteria = extract_success_criteria(response_text)
-    if success_criteria:
-        scenario['success_criteria'] = success_criteria
-        print(f"[PARSE DEBUG] Extracted success_criteria: {len(success_criteria)} items")
-    
-    # Strategy 4: Fill missing fields with defaults based on prompt
-    default_values = {
-        'title': f"Professional Role Play: {prompt}" if prompt else "Role Play Scenario",
-        'author': "AI Learning Coach",
-        'description': f"Practice this important workplace scenario: {prompt}. This exercise will help you develop key communication and professional skills.",
-        'success_criteria': [
-            "Communicate clearly and professionally",
-            "Listen actively and respond appropriately", 
-            "Maintain composure and confidence",
-            "Achieve your conversation objectives",
-            "Build positive rapport with the other party"
-        ],
-        'user_name': "You",
-        'user_role': "Professional",
-        'user_avatar': "👤",
-        'ai_name': "Alex",
-        'ai_role': "Role Play Partner",
-        'ai_avatar': "🧑‍💼",
-        'ai_description': f"Alex is an experienced professional who will help you practice: {prompt}. They provide realistic responses and constructive feedback.",
-        'chat_prompt': f"Let's start a role play about: {prompt}. I'll play the role of your conversation partner. Please set the scene and begin when you're ready."
-    }
-    
-    # Fill in missing fields
-    for field, default_value in default_values.items():
-        if field not in scenario or not scenario[field]:
-            scenario[field] = default_value
-            print(f"[PARSE DEBUG] Using default for {field}")
-    
-    # Final validation
+# Generated scenarios are cached per normalized prompt and generation config
+scenario_cache = ScenarioCache(
+    namespace=config_fingerprint(
+        ROLEPLAY_GENERATION, getattr(scenario_model, "model", None), SCENARIO_PROMPT, SCENARIO_SCHEMA
+    ),
+    max_entries=int(os.environ.get("SCENARIO_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("SCENARIO_CACHE_TTL", "86400")),
+    path=os.environ.get("SCENARIO_CACHE_PATH") or None,
+)
+scenario_engine = ScenarioEngine(
+    scenario_model,
+    parse=parse_scenario_response,
+    fallback=default_scenario,
+    concurrency=int(os.environ.get("ROLEPLAY_CONCURRENCY", "4")),
+    cache=scenario_cache,
+    offload=offloader,
+)
+
+# Role-play analyses: one non-live request per conversation, cached per session
+analysis_model = (
+    FakeScenarioModel(responses=[json.dumps({
+        "strengths": ["Stated the goal of the conversation clearly"],
+        "improvements": ["Ask more clarifying questions before proposing a solution"],
+        "detailed_feedback": "The conversation stayed focused and professional.",
+    })])
+    if ROLEPLAY_GENERATION == "fake"
+    else GenaiScenarioModel(ANALYSIS_SCHEMA)
+)
+analysis_engine = AnalysisEngine(
+    analysis_model,
+    parse=parse_llm_analysis_response,
+    clean=clean_llm_response,
+    concurrency=int(os.environ.get("ROLEPLAY_CONCURRENCY", "4")),
+    offload=offloader,
+    cache=ScenarioCache(
+        namespace=config_fingerprint("analysis", getattr(analysis_model, "model", None), ANALYSIS_SCHEMA),
+        max_entries=int(os.environ.get("ANALYSIS_CACHE_SIZE", "256")),
+        ttl=float(os.environ.get("SCENARIO_CACHE_TTL", "86400")),
+    ),
+)
+
+
+# Flow control for the websocket bridge
+WS_UPSTREAM_QUEUE = int(os.environ.get("WS_UPSTREAM_QUEUE", "32"))
+WS_DOWNSTREAM_QUEUE = int(os.environ.get("WS_DOWNSTREAM_QUEUE", "64"))
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+LIVE_QUEUE_LIMIT = int(os.environ.get("LIVE_QUEUE_LIMIT", "16"))
+flow_registry = FlowRegistry()
+
+# Video frame deduplication
+FRAME_DIFF_THRESHOLD = float(os.environ.get("FRAME_DIFF_THRESHOLD", "0.02"))
+FRAME_KEEPALIVE = float(os.environ.get("FRAME_KEEPALIVE", "15"))
+frame_filters = {}
+
+# Inbound audio coalescing, with optional silence dropping
+AUDIO_WINDOW_MS = int(os.environ.get("AUDIO_WINDOW_MS", "100"))
+AUDIO_VAD = os.environ.get("AUDIO_VAD", "false") == "true"
+AUDIO_VAD_THRESHOLD_DB = float(os.environ.get("AUDIO_VAD_THRESHOLD_DB", "-50"))
+audio_coalescers = {}
+
+# Outbound audio: binary clients may ask for Opus (audio_codec=opus), else PCM
+# (see skill_frame/audio_out.py)
+AUDIO_OPUS = os.environ.get("AUDIO_OPUS", "true") == "true"
+AUDIO_OPUS_BITRATE = int(os.environ.get("AUDIO_OPUS_BITRATE", "24000"))
+audio_encoders = {}
+
+# Text index of the PDFs learners open in the viewer (see skill_frame/documents.py)
+document_store = DocumentStore(os.environ.get("DOCUMENT_DIR", ".cache/documents"))
+DOCUMENT_MAX_BYTES = int(os.environ.get("DOCUMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+DOCUMENT_CONTEXT_CHARS = int(os.environ.get("DOCUMENT_CONTEXT_CHARS", "4000"))
+DOCUMENT_CONTEXT_PROMPT = (
+    "[Context, no reply needed: the learner now has page {page} of {pages} of \"{name}\" on screen. "
+    "Its text:]\n{text}"
+)
+
+# Session task lifecycle: idle sessions are closed after WS_IDLE_TIMEOUT seconds (0 disables)
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT", "600"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+supervisor = SessionSupervisor(
+    idle_timeout=WS_IDLE_TIMEOUT,
+    cancel_timeout=float(os.environ.get("WS_CANCEL_TIMEOUT", "5")),
+    expected=(WebSocketDisconnect, ChannelClosed),
+)
+
+# Admission control: concurrent live sessions per pool and in total, with a
+# fair wait queue, plus per-user (user_id query parameter) and per-IP rate
+# limits on starting sessions and generations. Limits of 0 disable a check.
+admission = AdmissionController(
+    {
+        "audio": int(os.environ.get("AUDIO_SESSION_LIMIT", "60")),
+        "text": int(os.environ.get("TEXT_SESSION_LIMIT", "60")),
+        "roleplay": int(os.environ.get("ROLEPLAY_LIMIT", "16")),
+        # Speculative sessions (see skill_frame/prewarm.py); they hold live connections too
+        "prewarm": int(os.environ.get("PREWARM_LIMIT", "8")),
+    },
+    total_limit=int(os.environ.get("LIVE_SESSION_LIMIT", "100")),
+    # One-shot generation doesn't hold a live session
+    total_pools=(
+        ("audio", "text", "prewarm", "roleplay") if ROLEPLAY_GENERATION == "live" else ("audio", "text", "prewarm")
+    ),
+    queue_limit=int(os.environ.get("ADMISSION_QUEUE_LIMIT", "100")),
+    wait_timeout=float(os.environ.get("ADMISSION_WAIT_TIMEOUT", "60")),
+)
+ROLEPLAY_WAIT_TIMEOUT = float(os.environ.get("ROLEPLAY_WAIT_TIMEOUT", "20"))
+user_rate_limiter = RateLimiter(
+    float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "30")), int(os.environ.get("RATE_LIMIT_USER_BURST", "10"))
+)
+ip_rate_limiter = RateLimiter(
+    float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "120")), int(os.environ.get("RATE_LIMIT_IP_BURST", "30"))
+)
+# Take the client IP from X-Forwarded-For behind a trusted proxy
+TRUST_PROXY = os.environ.get("TRUST_PROXY", "false") == "true"
+
+
+def client_identity(connection):
+    """(user, ip) of an HTTP request or websocket, for rate limiting"""
+    ip = connection.client.host if connection.client else None
+    forwarded = connection.headers.get("x-forwarded-for")
+    if TRUST_PROXY and forwarded:
+        ip = forwarded.split(",")[0].strip()
+    return connection.query_params.get("user_id"), ip
+
+
+def check_rate_limits(connection, pool):
+    """Raises Rejected if the user or IP started too much recently"""
+    user, ip = client_identity(connection)
+    retry_after = max(user_rate_limiter.check(user), ip_rate_limiter.check(ip))
+    if retry_after:
+        raise admission.reject(pool, RATE_LIMITED, retry_after)
+
+
+async def admit_request(request, pool, timeout=None):
+    """Admits an HTTP request to pool; sheds load with 429/503 and Retry-After"""
     try:
-        validate(scenario, SCENARIO_SCHEMA)
-        print("[PARSE SUCCESS] Key-by-key extraction with defaults successful")
-        return scenario
-    except ValidationError as e:
-        print(f"[PARSE ERROR] Final validation failed: {e}")
-        # Return the constructed scenario anyway - it's better than nothing
-        return scenario
+        check_rate_limits(request, pool)
+        return await admission.acquire(pool, timeout=timeout)
+    except Rejected as e:
+        roleplay_log.warning("Rejected %s request: %s", pool, e.reason)
+        raise HTTPException(
+            status_code=429 if e.reason == RATE_LIMITED else 503,
+            detail={"error": e.reason, "retry_after": e.retry_after},
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
 
 
-def extract_success_criteria(response_text):
+async def admit_websocket(websocket, pool):
     """
-    Extract success_criteria array from response text using multiple strategies.
-    This is the most problematic field due to array formatting issues.
+    Admits a websocket to pool, sending queue positions while it waits.
+    Returns the slot, or None if the client was turned away or left.
+    Client messages that arrive before admission are dropped.
     """
-    success_criteria = []
-    
-    # Strategy 1: Try to find complete array
-    array_patterns = [
-        r'"success_criteria"\s*:\s*\[([^\]]*)\]',
-        r"'success_criteria'\s*:\s*\[([^\]]*)\]",
-        r'"success_criteria"\s*:\s*\[(.*?)\]',
-    ]
-    
-    for pattern in array_patterns:
-        match = re.search(pattern, response_text, re.DOTALL | re.IGNORECASE)
-        if match:
-            array_content = match.group(1)
-            print(f"[PARSE DEBUG] Found success_criteria array content: {array_content[:100]}...")
-            
-            # Try to extract individual items from the array content
-            item_patterns = [
-                r'"([^"]+)"',  # Double quoted strings
-                r"'([^']+)'",  # Single quoted strings
-            ]
-            
-            for item_pattern in item_patterns:
-                items = re.findall(item_pattern, array_content)
-                if items:
-                    success_criteria = [item.strip() for item in items if item.strip()]
-                    if len(success_criteria) >= 3:  # Minimum acceptable
-                        return success_criteria
-    
-    # Strategy 2: Look for success criteria as individual lines or bullet points
-    lines = response_text.split('\n')
-    criteria_section = False
-    for line in lines:
-        line = line.strip()
-        if 'success_criteria' in line.lower() or criteria_section:
-            criteria_section = True
-            if line and (line.startswith('-') or line.startswith('*') or line.startswith('•')):
-                criterion = line.lstrip('-*•').strip().strip('"\'')
-                if criterion and len(criterion) > 5:  # Avoid very short items
-                    success_criteria.append(criterion)
-            elif line.startswith('"') and line.endswith('"'):
-                criterion = line.strip('"')
-                if criterion and len(criterion) > 5:
-                    success_criteria.append(criterion)
-            elif ']' in line or '}' in line:
-                criteria_section = False
-    
-    # Strategy 3: Extract from context if we found criteria-related text
-    if not success_criteria:
-        # Look for numbered lists or other patterns
-        numbered_pattern = r'\d+\.\s*([^\n]+)'
-        matches = re.findall(numbered_pattern, response_text)
-        if matches:
-            success_criteria = [match.strip().strip('"\'.,') for match in matches if len(match.strip()) > 10]
-    
-    # Return what we found, or empty list if nothing
-    return success_criteria[:10] if success_criteria else []  # Limit to 10 items max
+
+    async def send_position(position, queued):
+        await websocket.send_text(json.dumps(
+            {"mime_type": ADMISSION_MIME_TYPE, "status": QUEUED, "position": position, "queued": queued}
+        ))
+
+    acquire = receive = None
+    try:
+        check_rate_limits(websocket, pool)
+        slot = admission.try_acquire(pool)
+        if slot is None:
+            acquire = asyncio.ensure_future(admission.acquire(pool, send_position))
+        while acquire is not None and not acquire.done():
+            if receive is None:
+                receive = asyncio.ensure_future(websocket.receive())
+            await asyncio.wait({acquire, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if receive.done():
+                if receive.result()["type"] == "websocket.disconnect":
+                    if acquire.done() and not acquire.cancelled() and acquire.exception() is None:
+                        acquire.result().release()
+                    return None
+                receive = None
+        if acquire is not None:
+            slot = acquire.result()
+    except Rejected as e:
+        ws_log.warning("Rejected %s session: %s", pool, e.reason)
+        try:
+            await websocket.send_text(json.dumps(e.frame()))
+            # 1013: try again later
+            await websocket.close(code=1013)
+        except (RuntimeError, WebSocketDisconnect):
+            pass
+        return None
+    finally:
+        if receive is not None and not receive.done():
+            receive.cancel()
+        if acquire is not None and not acquire.done():
+            acquire.cancel()
+    await websocket.send_text(json.dumps({"mime_type": ADMISSION_MIME_TYPE, "status": ADMITTED}))
+    return slot
 
 
 async def start_agent_session(session_id, is_audio=False):
     """Starts an agent session"""
+    await warmup.wait()
+    from google.adk.agents import LiveRequestQueue
+    from google.adk.agents.run_config import RunConfig
+    from google.genai.types import Modality
 
-    # Create a Session
-    session = await session_service.create_session(
-        app_name=APP_NAME,
-        user_id=session_id,
-        session_id=session_id,
-    )
+    # Get a pooled Session (reused if the client is reconnecting) and the shared Runner
+    session = await session_pool.acquire(session_id)
+    runner = session_pool.runner
 
-    # Create a Runner
-    runner = Runner(
-        app_name=APP_NAME,
-        agent=root_agent,
-        session_service=session_service,
-    )    # Set response modality
+    # Set response modality
     if is_audio:
         modalities = [Modality.AUDIO]  # Use enum instead of string
         run_config = RunConfig(response_modalities=modalities, output_audio_transcription={}, input_audio_transcription={})
@@ -301,8 +348,10 @@ async def start_agent_session(session_id, is_audio=False):
     # modality = "AUDIO" if is_audio else "TEXT"
     # run_config = RunConfig(response_modalities=[modality])
 
-    # Create a LiveRequestQueue for this session
+    # Create a LiveRequestQueue for this session; pending requests are
+    # tracked from the start, before the runner reads any
     live_request_queue = LiveRequestQueue()
+    PendingRequests.of(live_request_queue)
 
     # Start agent session
     live_events = runner.run_live(
@@ -313,82 +362,331 @@ async def start_agent_session(session_id, is_audio=False):
     return live_events, live_request_queue
 
 
-async def agent_to_client_messaging(websocket, live_events):
-    """Agent to client communication"""
-    while True:
-        async for event in live_events:
-            print(f"event: {event}")
-            # If the turn complete or interrupted, send it
-            if event.turn_complete or event.interrupted:
-                message = {
-                    "turn_complete": event.turn_complete,
-                    "interrupted": event.interrupted,
-                }
-                await websocket.send_text(json.dumps(message))
-                print(f"[AGENT TO CLIENT]: {message}")
+# Live sessions started before their websocket connects, e.g. when the
+# learner reaches for Start (see skill_frame/prewarm.py); unclaimed ones are
+# torn down after PREWARM_TTL seconds (0 disables pre-warming)
+PREWARM_TTL = float(os.environ.get("PREWARM_TTL", "30"))
+prewarms = PrewarmRegistry(start_agent_session, session_pool.release, ttl=PREWARM_TTL)
+
+
+def forget(registry, session_id, value):
+    """Removes a connection's per-session entry unless a newer connection replaced it"""
+    if registry.get(session_id) is value:
+        del registry[session_id]
+
+
+async def send_to_client(websocket, payload):
+    """Sends a prepared payload: bytes as a binary frame, str as a text frame"""
+    if isinstance(payload, bytes):
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_text(payload)
+
+
+async def agent_to_client_messaging(
+    websocket, live_events, binary=False, downstream=None, transcript=None, on_activity=None, audio_out=None
+):
+    """
+    Agent to client communication; messages go through the downstream channel if given.
+    Text and transcriptions are recorded in transcript if given.
+    Audio is encoded, and its bytes counted, by audio_out if given.
+    Returns when the agent stream ends.
+    """
+
+    async def send(mime_type, payload):
+        if on_activity is not None:
+            on_activity()
+        messages, sent_bytes = ws_counters("out", mime_type)
+        messages.inc()
+        size = wire_size(payload)
+        sent_bytes.inc(size)
+        if audio_out is not None and mime_type.startswith("audio/"):
+            audio_out.sent(size)
+        if downstream is None:
+            await send_to_client(websocket, payload)
+        else:
+            await downstream.put(mime_type, payload)
+
+    async def send_audio(audio_data):
+        nonlocal seq
+        mime_type = audio_out.mime_type if audio_out is not None else "audio/pcm"
+        if binary:
+            await send(mime_type, encode_frame(mime_type, audio_data, seq))
+            seq += 1
+        else:
+            payload = await offloader.run("encode", len(audio_data), encode_audio_message, audio_data)
+            await send(mime_type, payload)
+
+    seq = 0
+    async for event in live_events:
+        ws_log.debug("event: %s", summarize_event(event))
+        # If the turn complete or interrupted, send it
+        if event.turn_complete or event.interrupted:
+            if transcript is not None:
+                transcript.end_turn()
+            if audio_out is not None and event.interrupted:
+                # Buffered audio isn't wanted after an interruption
+                audio_out.reset()
+            elif audio_out is not None:
+                # The end of the turn's audio goes out before turn_complete
+                tail = audio_out.flush()
+                if tail:
+                    await send_audio(tail)
+            message = {
+                "turn_complete": event.turn_complete,
+                "interrupted": event.interrupted,
+            }
+            await send("application/json", json.dumps(message))
+            ws_log.debug("[AGENT TO CLIENT]: %s", message)
+            continue
+
+        # Read the Content and its first Part
+        part = (
+            event.content and event.content.parts and event.content.parts[0]
+        )
+        if not part:
+            continue
+
+        # If it's audio, send raw bytes (binary clients) or Base64 encoded audio data
+        is_audio = part.inline_data and part.inline_data.mime_type.startswith(
+            "audio/pcm"
+        )
+        if is_audio:
+            audio_data = part.inline_data and part.inline_data.data
+            if audio_data:
+                ws_log.debug("[AGENT TO CLIENT]: audio/pcm: %d bytes.", len(audio_data))
+                if audio_out is not None:
+                    # Opus holds back audio until it fills a packet. The op is
+                    # the codec, so Opus chunks go to the offload pool; calls
+                    # stay in order since each is awaited before the next
+                    audio_data = await offloader.run(
+                        audio_out.codec, len(audio_data), audio_out.encode, audio_data
+                    )
+                if audio_data:
+                    await send_audio(audio_data)
                 continue
 
-            # Read the Content and its first Part
-            part: Part = (
-                event.content and event.content.parts and event.content.parts[0]
-            )
-            if not part:
+        if part.text and transcript is not None:
+            # Input transcriptions come back as user content
+            role = USER if event.content.role == "user" else AGENT
+            if event.partial:
+                transcript.partial(role, part.text)
+            else:
+                transcript.final(role, part.text)
+
+        # If it's text and a parial text, send it
+        if part.text and event.partial:
+            message = {"mime_type": "text/plain", "data": part.text}
+            await send("text/plain", json.dumps(message))
+            ws_log.debug("[AGENT TO CLIENT]: text/plain: %s", summarize(part.text))
+    ws_log.debug("Agent stream ended")
+
+
+async def client_sender(websocket, downstream, send_timeout):
+    """
+    Drains the downstream channel to the websocket.
+    A client that can't take a message within send_timeout is disconnected,
+    so a stalled browser can't hold the agent stream forever.
+    """
+    while True:
+        try:
+            _mime_type, payload = await downstream.get()
+        except ChannelClosed:
+            return
+        try:
+            await asyncio.wait_for(send_to_client(websocket, payload), send_timeout)
+        except asyncio.TimeoutError:
+            ws_log.warning("Client send stalled for %.1fs, closing", send_timeout)
+            await websocket.close(code=1013)
+            return
+
+
+# {"document_id": ..., "page": n}: the PDF page the learner has on screen
+DOCUMENT_PAGE_MIME_TYPE = "application/x-skill-frame-page"
+CLIENT_MIME_TYPES = ("text/plain", "audio/pcm", "image/jpeg", DOCUMENT_PAGE_MIME_TYPE)
+
+
+async def receive_client_message(websocket):
+    """
+    Receives one client message from either framing.
+    Returns (mime_type, data, metadata); data is a str for text/plain and
+    bytes for audio/pcm and image/jpeg.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    frame = message.get("bytes")
+    if frame is not None:
+        mime_type, _seq, metadata, payload = decode_frame(frame)
+        count_inbound(mime_type, len(frame))
+        return mime_type, bytes(payload), metadata
+
+    # Decode JSON message; large frames are decoded in the offload pool
+    text = message["text"]
+    mime_type, data, metadata = await offloader.run("decode", len(text), decode_text_message, text)
+    count_inbound(mime_type, wire_size(text))
+    return mime_type, data, metadata
+
+
+def wire_size(payload):
+    """Bytes a websocket payload takes on the wire; text frames are UTF-8"""
+    return len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+
+
+# (messages, bytes) counter children by (direction, mime type), resolved once
+ws_children = {}
+
+
+def ws_counters(direction, mime_type):
+    children = ws_children.get((direction, mime_type))
+    if children is None:
+        children = ws_children[direction, mime_type] = (
+            WS_MESSAGES.labels(direction, mime_type), WS_BYTES.labels(direction, mime_type)
+        )
+    return children
+
+
+def count_inbound(mime_type, size):
+    # Clients choose the mime type; don't let them create label values
+    if mime_type not in CLIENT_MIME_TYPES:
+        mime_type = "other"
+    messages, received_bytes = ws_counters("in", mime_type)
+    messages.inc()
+    received_bytes.inc(size)
+
+
+def send_to_agent(live_request_queue, mime_type, data, metadata):
+    """Sends one client message to the agent"""
+    from google.genai.types import Blob, Content, Part
+
+    if mime_type == "text/plain":
+        # Send a text message
+        content = Content(role="user", parts=[Part.from_text(text=data)])
+        live_request_queue.send_content(content=content)
+        ws_log.debug("[CLIENT TO AGENT]: %s", summarize(data))
+    elif mime_type == "audio/pcm":
+        # Send an audio data
+        live_request_queue.send_realtime(
+            Blob(data=data, mime_type=mime_type)
+        )
+    elif mime_type == "image/jpeg":
+        # Send image data
+        live_request_queue.send_realtime(
+            Blob(data=data, mime_type=mime_type)
+        )
+        source = metadata.get("source", "unknown")
+        ws_log.debug("[CLIENT TO AGENT]: image/jpeg from %s: %d bytes", source, len(data))
+    else:
+        raise ValueError(f"Mime type not supported: {mime_type}")
+
+
+async def client_to_agent_messaging(
+    websocket, live_request_queue, upstream=None, frame_filter=None, transcript=None, audio=None, on_activity=None
+):
+    """
+    Client to agent communication; messages go through the upstream channel if given.
+    Near-duplicate image/jpeg frames are dropped by frame_filter if given,
+    typed text is recorded in transcript if given, and audio/pcm chunks are
+    coalesced into windows by audio if given. on_activity() is called for
+    every client message. Document page messages are sent to the agent as
+    the page's text, once per page change.
+    """
+
+    async def forward(mime_type, data, metadata):
+        if upstream is None:
+            send_to_agent(live_request_queue, mime_type, data, metadata)
+        elif not await upstream.put(mime_type, (data, metadata)):
+            ws_log.debug("[CLIENT TO AGENT]: dropped stale %s", mime_type)
+
+    async def flush_audio():
+        for window in audio.flush():
+            await forward("audio/pcm", window, {})
+
+    receive = None
+    page_shown = None
+    try:
+        while True:
+            if receive is None:
+                receive = asyncio.ensure_future(receive_client_message(websocket))
+            if audio is not None and audio.pending:
+                # Don't hold a partial window when the client goes quiet
+                done, _ = await asyncio.wait({receive}, timeout=audio.window_ms / 1000)
+                if not done:
+                    await flush_audio()
+                    continue
+            try:
+                mime_type, data, metadata = await receive
+            except FrameError as e:
+                ws_log.warning("[CLIENT TO AGENT]: dropping bad binary frame: %s", e)
                 continue
+            finally:
+                receive = None
+            if on_activity is not None:
+                on_activity()
 
-            # If it's audio, send Base64 encoded audio data
-            is_audio = part.inline_data and part.inline_data.mime_type.startswith(
-                "audio/pcm"
-            )
-            if is_audio:
-                audio_data = part.inline_data and part.inline_data.data
-                if audio_data:
-                    message = {
-                        "mime_type": "audio/pcm",
-                        "data": base64.b64encode(audio_data).decode("ascii"),
-                    }
-                    await websocket.send_text(json.dumps(message))
-                    print(f"[AGENT TO CLIENT]: audio/pcm: {len(audio_data)} bytes.")
+            if mime_type not in CLIENT_MIME_TYPES:
+                raise ValueError(f"Mime type not supported: {mime_type}")
+
+            if mime_type == "image/jpeg" and frame_filter is not None:
+                accepted = await offloader.run(
+                    "frame", len(data), frame_filter.accept, data, metadata.get("source", "unknown"), time.monotonic()
+                )
+                if not accepted:
+                    continue
+            if mime_type == "text/plain" and transcript is not None:
+                transcript.final(USER, data)
+
+            if mime_type == DOCUMENT_PAGE_MIME_TYPE:
+                page = (data.get("document_id"), data.get("page")) if isinstance(data, dict) else None
+                context = document_page_context(*page) if page and page != page_shown else None
+                if context is None:
                     continue
+                page_shown = page
+                mime_type, data, metadata = "text/plain", context, {}
 
-            # If it's text and a parial text, send it
-            if part.text and event.partial:
-                message = {"mime_type": "text/plain", "data": part.text}
-                await websocket.send_text(json.dumps(message))
-                print(f"abc [AGENT TO CLIENT]: text/plain: {message}")
+            if mime_type == "audio/pcm" and audio is not None:
+                windows = audio.push(data, metadata.get("sample_rate"), metadata.get("channels", 1))
+                for window in windows:
+                    await forward("audio/pcm", window, metadata)
+                continue
+            if mime_type == "text/plain" and audio is not None:
+                # Keep audio that was spoken before the text ahead of it
+                await flush_audio()
+
+            # Send the message to the agent
+            await forward(mime_type, data, metadata)
+    finally:
+        if receive is not None:
+            receive.cancel()
+
+
+def document_page_context(doc_id, page):
+    """The text of a document page as context for the agent, or None if it has no text"""
+    try:
+        index = document_store.get(doc_id)
+        text = index.context(int(page) - 1, DOCUMENT_CONTEXT_CHARS)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    if not text:
+        # Scanned or image-only page: the screen frames carry it
+        return None
+    return DOCUMENT_CONTEXT_PROMPT.format(
+        page=int(page), pages=index.page_count, name=index.name or "the document", text=text
+    )
 
 
-async def client_to_agent_messaging(websocket, live_request_queue):
-    """Client to agent communication"""
+async def agent_forwarder(upstream, live_request_queue, pending_limit):
+    """Drains the upstream channel into the LiveRequestQueue as fast as the model keeps up"""
+    pending = PendingRequests.of(live_request_queue)
     while True:
-        # Decode JSON message
-        message_json = await websocket.receive_text()
-        message = json.loads(message_json)
-        mime_type = message["mime_type"]
-        data = message["data"]
-        metadata = message.get("metadata", {})
-
-        # Send the message to the agent
-        if mime_type == "text/plain":
-            # Send a text message
-            content = Content(role="user", parts=[Part.from_text(text=data)])
-            live_request_queue.send_content(content=content)
-            print(f"[CLIENT TO AGENT]: {data}")
-        elif mime_type == "audio/pcm":
-            # Send an audio data
-            decoded_data = base64.b64decode(data)
-            live_request_queue.send_realtime(
-                Blob(data=decoded_data, mime_type=mime_type)
-            )
-        elif mime_type == "image/jpeg":
-            # Send image data
-            decoded_data = base64.b64decode(data)
-            live_request_queue.send_realtime(
-                Blob(data=decoded_data, mime_type=mime_type)
-            )
-            source = metadata.get("source", "unknown")
-            print(f"[CLIENT TO AGENT]: image/jpeg from {source}: {len(decoded_data)} bytes")
-        else:
-            raise ValueError(f"Mime type not supported: {mime_type}")
+        try:
+            mime_type, (data, metadata) = await upstream.get()
+        except ChannelClosed:
+            return
+        await pending.wait(pending_limit)
+        send_to_agent(live_request_queue, mime_type, data, metadata)
+        pending.sent()
 
 
 #
@@ -397,14 +695,130 @@ async def client_to_agent_messaging(websocket, live_request_queue):
 
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def start_session_pool():
+    if warmup.mode == "background":
+        warmup.start()
+    session_pool.start()
+    prewarms.start()
+    loop_monitor.start()
+    scenario_cache.start()
+    analysis_engine.cache.start()
+
+
+@app.on_event("shutdown")
+async def stop_session_pool():
+    # Close open websockets cleanly before their sessions go away
+    await supervisor.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    await prewarms.stop()
+    await session_pool.stop()
+    await loop_monitor.stop()
+    await scenario_cache.stop()
+    await analysis_engine.cache.stop()
+    scenario_cache.close()
+    transcript_store.close()
+    document_store.close()
+    offloader.close()
+
+
 STATIC_DIR = Path("static")
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+asset_store = AssetStore(
+    STATIC_DIR,
+    cache_dir=os.environ.get("ASSET_CACHE_DIR", ".cache/assets"),
+    brotli_quality=int(os.environ.get("ASSET_BROTLI_QUALITY", "11")),
+    memory_limit=int(os.environ.get("ASSET_MEMORY_LIMIT", str(32 * 1024 * 1024))),
+    memory_entry_limit=int(os.environ.get("ASSET_MEMORY_ENTRY_LIMIT", str(1024 * 1024))),
+    # Dev mode reloads assets when their files change; production serves the startup snapshot
+    dev=os.environ.get("ASSET_DEV", "false") == "true",
+)
+
+
+@app.on_event("startup")
+async def precompress_assets():
+    # Assets are served uncompressed until their compressed copies exist
+    asyncio.get_running_loop().run_in_executor(None, asset_store.compress)
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+def static_asset(path: str, request: Request):
+    """Serves static assets, precompressed and with fingerprinted URLs"""
+    return asset_store.response(path, request.headers)
 
 
 @app.get("/")
-async def root():
-    """Serves the index.html"""
-    return FileResponse(os.path.join(STATIC_DIR, "index.html"))
+def root(request: Request):
+    """Serves the index.html, pointing at fingerprinted assets"""
+    return asset_store.page_response("index.html", request.headers)
+
+
+@app.post("/documents", response_class=JSONResponse)
+async def upload_document(request: Request, name: str = None):
+    """
+    Indexes a PDF sent as the request body, once per distinct file.
+    Returns {"document_id", "name", "pages", "terms"}.
+    """
+    if int(request.headers.get("content-length") or 0) > DOCUMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Document too large")
+    data = await request.body()
+    if len(data) > DOCUMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Document too large")
+    return await index_document(data, name)
+
+
+@app.post("/documents/static/{path:path}", response_class=JSONResponse)
+async def index_static_document(path: str):
+    """Indexes a PDF served from the static directory"""
+    root = STATIC_DIR.resolve()
+    file = (root / path).resolve()
+    if root not in file.parents or file.suffix.lower() != ".pdf" or not file.is_file():
+        raise HTTPException(status_code=404, detail="Not a served PDF")
+    data = await asyncio.to_thread(file.read_bytes)
+    return await index_document(data, file.name)
+
+
+async def index_document(data, name):
+    try:
+        # Parsing is CPU-bound; keep it off the event loop
+        index = await asyncio.to_thread(document_store.build, data, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return index.info()
+
+
+def open_document(document_id):
+    try:
+        return document_store.get(document_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown document")
+
+
+@app.get("/documents/{document_id}", response_class=JSONResponse)
+async def document_info(document_id: str):
+    return open_document(document_id).info()
+
+
+@app.get("/documents/{document_id}/pages/{page}", response_class=JSONResponse)
+async def document_page(document_id: str, page: int):
+    """Text and line layout ([x, y, size, text], x/y as page fractions) of a page, from 1"""
+    index = open_document(document_id)
+    if not 1 <= page <= index.page_count:
+        raise HTTPException(status_code=404, detail="No such page")
+    width, height = index.page_sizes[page - 1]
+    return {
+        "page": page,
+        "width": width,
+        "height": height,
+        "text": index.page_text(page - 1),
+        "lines": index.page_layout(page - 1),
+    }
+
+
+@app.get("/documents/{document_id}/search", response_class=JSONResponse)
+async def document_search(document_id: str, q: str, limit: int = 10):
+    """Pages matching every word of q, best first, with a snippet each"""
+    index = open_document(document_id)
+    return {"query": q, "results": index.search(q, max(1, min(limit, 50)))}
 
 
 @app.get("/roleplay-details", response_class=HTMLResponse)
@@ -440,25 +854,19 @@ async def get_roleplay(prompt: str):
     return scenario
 
 
-@app.post("/roleplay", response_class=JSONResponse)
-async def post_roleplay(data: dict = Body(...)):
-    prompt = data.get("prompt", "")
-    print(f"[ROLEPLAY REQUEST] User prompt: {prompt}")
-    
-    # Generate a detailed role play scenario using the existing agent system
+async def generate_scenario_live(prompt):
+    """Generates a scenario over a temporary live session (ROLEPLAY_GENERATION=live)"""
+    from google.adk.agents import LiveRequestQueue
+    from google.adk.agents.run_config import RunConfig
+    from google.genai.types import Content, Part
+
+    temp_session_id = f"roleplay_{os.urandom(8).hex()}"
+    live_request_queue = None
     try:
         # Create a temporary session to get LLM response
-        temp_session_id = f"roleplay_{os.urandom(8).hex()}"
-        session = await session_service.create_session(
-            app_name=APP_NAME,
-            user_id=temp_session_id,
-            session_id=temp_session_id,
-        )
-        
-        runner = Runner(
-            app_name=APP_NAME,
-            agent=root_agent,
-            session_service=session_service,        )
+        started = time.perf_counter()
+        session = await session_pool.acquire(temp_session_id)
+        runner = session_pool.runner
         
         # Create RunConfig with only essential parameters
         run_config = RunConfig(response_modalities=["TEXT"])
@@ -470,122 +878,472 @@ async def post_roleplay(data: dict = Body(...)):
             live_request_queue=live_request_queue,
             run_config=run_config,
         )
-          # Craft a detailed prompt for generating role play scenario
-        scenario_prompt = f"""
-        Create a detailed Learning-style role play scenario based on this request: \"{prompt}\"
-        
-        IMPORTANT: Respond ONLY with a valid JSON object as described below. Do not include markdown, code blocks, or any text before or after the JSON.
-
-        All array elements (like \"success_criteria\") must be valid, double-quoted strings on a single line. Do not break strings across lines. Ensure the JSON is valid and minified (no unnecessary whitespace or line breaks inside strings).
-
-        Use this format:
-        {{
-            "title": "A professional title for the scenario",
-            "author": "AI Learning Coach",
-            "description": "A detailed 2-3 sentence description of the scenario context and objectives",
-            "success_criteria": ["criterion 1", "criterion 2", "criterion 3", "criterion 4", "criterion 5"],
-            "user_name": "You",
-            "user_role": "A specific professional role relevant to the scenario",
-            "user_avatar": "👤",
-            "ai_name": "A realistic name for the AI character",
-            "ai_role": "The role the AI will play",  
-            "ai_avatar": "An appropriate emoji like 🧑‍💼 or 👩‍💻",
-            "ai_description": "2-3 sentences describing the AI character's personality and approach",
-            "chat_prompt": "A detailed prompt to initialize the role play conversation with context and opening"
-        }}
-        
-        Make it realistic, professional, and engaging for workplace skill development. 
-
-        Response format: Respond ONLY with a valid JSON object as described above.
-        """
         
         # Send the scenario generation request
-        content = Content(role="user", parts=[Part.from_text(text=scenario_prompt)])
+        content = Content(role="user", parts=[Part.from_text(text=build_scenario_prompt(prompt))])
         live_request_queue.send_content(content=content)
+        setup_done = time.perf_counter()
+        ROLEPLAY_SECONDS.labels("session_setup").observe(setup_done - started)
         
-        # Collect the response
-        llm_response = ""
+        # Collect the response; chunks are joined once to avoid quadratic concatenation
+        chunks = []
         async for event in live_events:
             if event.turn_complete or event.interrupted:
                 break
-              # Read the Content and its first Part
+            # Read the Content and its first Part
             part = (
                 event.content and event.content.parts and event.content.parts[0]
             )
             if not part or not part.text:
                 continue
             
-            llm_response += part.text
+            chunks.append(part.text)
+        llm_response = "".join(chunks)
+        llm_done = time.perf_counter()
+        ROLEPLAY_SECONDS.labels("llm").observe(llm_done - setup_done)
         
-        print(f"[ROLEPLAY LLM] Raw response: {llm_response}")
+        roleplay_log.debug("Raw response: %s", summarize(llm_response, 1000))
         
         # Clean LLM response of markdown/code block wrappers before parsing
-        cleaned_response = llm_response.strip()
-        # Remove leading/trailing triple backticks and 'json' if present
-        if cleaned_response.startswith('```json'):
-            cleaned_response = cleaned_response[len('```json'):].strip()
-        if cleaned_response.startswith('```'):
-            cleaned_response = cleaned_response[len('```'):].strip()
-        if cleaned_response.endswith('```'):
-            cleaned_response = cleaned_response[:-3].strip()
-
-
-        print(f"[ROLEPLAY DEBUG] Cleaned response before JSON parse:\n{cleaned_response[:500]}")        # Multi-layered JSON parsing approach
-        scenario = parse_llm_json_response(cleaned_response, prompt)
-
-        # Ensure all required fields exist
-        required_fields = ['title', 'author', 'description', 'success_criteria', 'user_name', 'user_role', 'user_avatar', 'ai_name', 'ai_role', 'ai_avatar', 'ai_description', 'chat_prompt']
-        for field in required_fields:
-            if field not in scenario:
-                scenario[field] = f"[{field} not provided]"
-        
+        cleaned_response = clean_llm_response(llm_response)
+        roleplay_log.debug("Cleaned response before JSON parse:\n%s", summarize(cleaned_response, 500))
+
+        # Multi-layered JSON parsing approach
+        scenario = await offloader.run(
+            "parse", len(cleaned_response), parse_llm_json_response, cleaned_response, prompt
+        )
+        ROLEPLAY_SECONDS.labels("parse").observe(time.perf_counter() - llm_done)
+        return scenario
     except Exception as e:
-        print(f"[ROLEPLAY ERROR] Failed to generate scenario via LLM: {e}")
-        # Fallback scenario
-        scenario = {
-            "title": f"Professional Role Play: {prompt}" if prompt else "Role Play Scenario",
-            "author": "AI Learning Coach",
-            "description": f"Practice this important workplace scenario: {prompt}. This exercise will help you develop key communication and professional skills.",
-            "success_criteria": [
-                "Communicate clearly and professionally",
-                "Listen actively and respond appropriately", 
-                "Maintain composure and confidence",
-                "Achieve your conversation objectives",
-                "Build positive rapport with the other party"
-            ],
-            "user_name": "You",
-            "user_role": "Professional",
-            "user_avatar": "👤",
-            "ai_name": "Alex",
-            "ai_role": "Role Play Partner",
-            "ai_avatar": "🧑‍💼",
-            "ai_description": f"Alex is an experienced professional who will help you practice: {prompt}. They provide realistic responses and constructive feedback.",
-            "chat_prompt": f"Let's start a role play about: {prompt}. I'll play the role of your conversation partner. Please set the scene and begin when you're ready."
-        }
+        roleplay_log.error("Failed to generate scenario via LLM: %s", e)
+        return default_scenario(prompt)
+    finally:
+        # The temporary session is never reused, so close it and drop it from the pool
+        if live_request_queue is not None:
+            live_request_queue.close()
+        await session_pool.release(temp_session_id, discard=True)
+
+
+def ensure_required_fields(scenario):
+    """Ensure all required fields exist"""
+    for field in SCENARIO_SCHEMA["required"]:
+        if field not in scenario:
+            scenario[field] = f"[{field} not provided]"
+    return scenario
+
+
+async def generate_scenario(prompt):
+    """Generates a scenario with the configured generation path"""
+    await warmup.wait()
+    if ROLEPLAY_GENERATION == "live":
+        scenario = await generate_scenario_live(prompt)
+    else:
+        scenario = await scenario_engine.generate(prompt)
+    return ensure_required_fields(scenario)
+
+
+@app.post("/roleplay", response_class=JSONResponse)
+async def post_roleplay(request: Request, data: dict = Body(...)):
+    prompt = data.get("prompt", "")
+    roleplay_log.info("User prompt: %s", summarize(prompt))
     
-    print(f"[ROLEPLAY RESPONSE] Returning scenario: {scenario['title']}")
+    started = time.perf_counter()
+    async with await admit_request(request, "roleplay", ROLEPLAY_WAIT_TIMEOUT):
+        scenario = await generate_scenario(prompt)
+    ROLEPLAY_SECONDS.labels("total").observe(time.perf_counter() - started)
+    
+    roleplay_log.info("Returning scenario: %s", scenario["title"])
     return scenario
 
+
+@app.post("/roleplay/stream")
+async def post_roleplay_stream(request: Request, data: dict = Body(...)):
+    """
+    Streams scenario generation as NDJSON: one {"field": ..., "value": ...}
+    line per top-level field as soon as it is complete, then a final
+    {"scenario": ...} line with the validated scenario.
+    """
+    prompt = data.get("prompt", "")
+    roleplay_log.info("User prompt (stream): %s", summarize(prompt))
+    # Admitted before the response starts, so a rejection is a plain 429/503
+    slot = await admit_request(request, "roleplay", ROLEPLAY_WAIT_TIMEOUT)
+
+    async def events():
+        async with slot:
+            await warmup.wait()
+            if ROLEPLAY_GENERATION == "live":
+                scenario = await generate_scenario(prompt)
+            else:
+                async for event in scenario_engine.generate_stream(prompt):
+                    if event[0] == "field":
+                        yield json.dumps({"field": event[1], "value": event[2]}, ensure_ascii=False) + "\n"
+                        continue
+                    scenario = ensure_required_fields(event[1])
+        roleplay_log.info("Returning scenario: %s", scenario["title"])
+        yield json.dumps({"scenario": scenario}, ensure_ascii=False) + "\n"
+
+    # The background task also releases the slot if the client leaves before the stream starts
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(slot.release))
+
+
+@app.post("/roleplay/{session_id}/analysis", response_class=JSONResponse)
+async def post_roleplay_analysis(session_id: str, request: Request, data: dict = Body(...)):
+    """
+    Analyzes a role-play from the conversation stored with its session, with
+    one non-live request. Body: {"scenario": {...}, "duration": seconds}.
+    """
+    turns = transcript_store.last(session_id, ANALYSIS_MAX_TURNS)
+    if not turns:
+        # Nothing recorded by this worker; fall back to the events stored with the session,
+        # once warm-up has built the session service
+        await warmup.wait()
+        session = await session_pool.lookup(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Unknown session")
+        turns = transcript_from_events(session.events)[-ANALYSIS_MAX_TURNS:]
+    if not turns:
+        raise HTTPException(status_code=409, detail="No conversation to analyze")
+    roleplay_log.info("Analyzing session %s: %d turns", session_id, len(turns))
+    
+    try:
+        async with await admit_request(request, "roleplay", ROLEPLAY_WAIT_TIMEOUT):
+            await warmup.wait()
+            return await analysis_engine.analyze(session_id, data.get("scenario"), turns, data.get("duration"))
+    except SchemaValidationError as e:
+        raise HTTPException(status_code=502, detail=f"Analysis response was invalid: {e}")
+
+
+@app.post("/roleplay/batch", response_class=JSONResponse)
+async def post_roleplay_batch(request: Request, data: dict = Body(...)):
+    """Generates scenarios for many prompts with bounded concurrency."""
+    prompts = data.get("prompts", [])
+    if not isinstance(prompts, list) or not all(isinstance(p, str) for p in prompts):
+        raise HTTPException(status_code=400, detail="'prompts' must be a list of strings")
+    if len(prompts) > ROLEPLAY_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {ROLEPLAY_BATCH_LIMIT} prompts per batch")
+    roleplay_log.info("Batch of %d prompts", len(prompts))
+
+    # One slot per batch; the engine bounds its concurrency within the batch
+    async with await admit_request(request, "roleplay", ROLEPLAY_WAIT_TIMEOUT):
+        await warmup.wait()
+        if ROLEPLAY_GENERATION == "live":
+            scenarios = [await generate_scenario(prompt) for prompt in prompts]
+        else:
+            scenarios = [
+                ensure_required_fields(scenario)
+                for scenario in await scenario_engine.generate_many(prompts)
+            ]
+    return {"scenarios": scenarios}
+
 @app.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: int, is_audio: str):
+async def websocket_endpoint(
+    websocket: WebSocket, session_id: int, is_audio: str, binary: str = "false", audio_codec: str = PCM
+):
     """Client websocket endpoint"""
 
     # Wait for client connection
     await websocket.accept()
-    print(f"Client #{session_id} connected, audio mode: {is_audio}")
+    connected = time.perf_counter()
+    ws_log.info(
+        "Client #%s connected, audio mode: %s, binary: %s, audio codec: %s", session_id, is_audio, binary, audio_codec
+    )
 
-    # Start agent session
+    # Binary framing is opt-in; tell the client we support it
+    use_binary = binary == "true"
+    if use_binary:
+        await websocket.send_text(json.dumps(HELLO_MESSAGE))
+
+    # So is a compressed audio codec; the client learns which one it got
+    audio_out = audio_encoder(audio_codec if AUDIO_OPUS else PCM, use_binary, AUDIO_OPUS_BITRATE)
+    if audio_codec != PCM:
+        await websocket.send_text(json.dumps(audio_out.frame()))
+
+    # Attach to the session pre-warmed for this id if there is one. Its slot
+    # already counts in the live total and becomes the websocket's if the
+    # live pool has room; otherwise the websocket queues like the others
     session_id = str(session_id)
-    live_events, live_request_queue = await start_agent_session(
-        session_id, is_audio == "true"
+    pool = "audio" if is_audio == "true" else "text"
+    prewarmed = await prewarms.claim(session_id, is_audio == "true")
+    slot = None
+    if prewarmed is not None:
+        slot = admission.transfer(prewarmed.slot, pool)
+        if slot is not None:
+            await websocket.send_text(json.dumps({"mime_type": ADMISSION_MIME_TYPE, "status": ADMITTED}))
+        else:
+            prewarmed.slot.release()
+    if slot is None:
+        # Wait for a free live session slot, or turn the client away
+        try:
+            slot = await admit_websocket(websocket, pool)
+        finally:
+            if slot is None and prewarmed is not None:
+                await prewarms.abandon(prewarmed)
+        if slot is None:
+            return
+
+    if prewarmed is not None:
+        live_events, live_request_queue = prewarmed.live_events, prewarmed.live_request_queue
+    else:
+        # Start agent session
+        try:
+            live_events, live_request_queue = await start_agent_session(
+                session_id, is_audio == "true"
+            )
+        except BaseException:
+            slot.release()
+            raise
+    label = "true" if prewarmed is not None else "false"
+    SESSION_SETUP_SECONDS.labels(label).observe(time.perf_counter() - connected)
+
+    # The transcript outlives the connection, so a reconnect continues it
+    transcript = transcript_store.get(session_id)
+
+    # Drop near-duplicate video frames before they reach the model
+    frame_filter = frame_filters[session_id] = FrameFilter(
+        threshold=FRAME_DIFF_THRESHOLD, keepalive=FRAME_KEEPALIVE
     )
 
-    # Start tasks
-    agent_to_client_task = asyncio.create_task(
-        agent_to_client_messaging(websocket, live_events)
+    audio_encoders[session_id] = audio_out
+
+    # Coalesce tiny audio chunks into windows before they reach the model
+    from skill_frame.audio import AudioCoalescer
+
+    audio = audio_coalescers[session_id] = AudioCoalescer(
+        window_ms=AUDIO_WINDOW_MS, vad=AUDIO_VAD, vad_threshold_db=AUDIO_VAD_THRESHOLD_DB
     )
-    client_to_agent_task = asyncio.create_task(
-        client_to_agent_messaging(websocket, live_request_queue)
+
+    # Bounded per-direction channels between the websocket and the agent
+    channels = upstream, downstream = flow_registry.open(
+        session_id, upstream_size=WS_UPSTREAM_QUEUE, downstream_size=WS_DOWNSTREAM_QUEUE
     )
-    await asyncio.gather(agent_to_client_task, client_to_agent_task)    # Disconnected
-    print(f"Client #{session_id} disconnected")
+
+    # Run the session's tasks as one unit: when any of them ends (usually the
+    # client disconnecting), the others are cancelled
+    supervised = supervisor.session(session_id)
+    first_response = FirstResponseTimer(FIRST_RESPONSE_SECONDS.labels(label))
+
+    def on_client_message():
+        supervised.touch()
+        first_response.request()
+
+    def on_agent_message():
+        supervised.touch()
+        first_response.response()
+
+    sessions_gauge = WS_SESSIONS.labels("audio" if is_audio == "true" else "text")
+    sessions_gauge.inc()
+    reason = None
+    try:
+        reason = await supervisor.run(supervised, {
+            "agent_to_client": agent_to_client_messaging(
+                websocket, live_events, use_binary, downstream, transcript, on_agent_message, audio_out
+            ),
+            "client_sender": client_sender(websocket, downstream, WS_SEND_TIMEOUT),
+            "client_to_agent": client_to_agent_messaging(
+                websocket, live_request_queue, upstream, frame_filter, transcript, audio, on_client_message
+            ),
+            "agent_forwarder": agent_forwarder(upstream, live_request_queue, LIVE_QUEUE_LIMIT),
+        })
+    finally:
+        # Free the live connection right away; the session itself is kept
+        # for a reconnect until it idles out
+        live_request_queue.close()
+        try:
+            await live_events.aclose()
+        except Exception as e:
+            ws_log.debug("Closing agent stream: %s", e)
+        await upstream.close()
+        await downstream.close()
+        # A reconnect under the same id may have registered its own by now
+        flow_registry.close(session_id, channels)
+        forget(frame_filters, session_id, frame_filter)
+        forget(audio_coalescers, session_id, audio)
+        forget(audio_encoders, session_id, audio_out)
+        await session_pool.release(session_id)
+        slot.release()
+        sessions_gauge.dec()
+        if websocket.client_state == WebSocketState.CONNECTED:
+            # 1001 going away after an idle timeout, 1012 service restart on shutdown
+            code = {IDLE: 1001, SHUTDOWN: 1012}.get(reason, 1000)
+            try:
+                await websocket.close(code=code)
+            except RuntimeError:
+                pass
+        ws_log.info("Client #%s disconnected (%s)", session_id, reason)
+
+
+@app.get("/roleplay/cache/stats", response_class=JSONResponse)
+async def scenario_cache_stats():
+    """Scenario cache hit/miss counters"""
+    return scenario_cache.stats()
+
+
+@app.get("/sessions/flow", response_class=JSONResponse)
+async def session_flow_stats():
+    """Per-session queue depth, drops and lag in each direction"""
+    return flow_registry.stats()
+
+
+@app.get("/sessions/frames", response_class=JSONResponse)
+async def session_frame_stats():
+    """Per-session image/jpeg frames forwarded vs dropped"""
+    return {session_id: frame_filter.stats() for session_id, frame_filter in frame_filters.items()}
+
+
+@app.get("/static-assets/stats", response_class=JSONResponse)
+async def static_asset_stats():
+    """Precompression savings and bytes saved on the wire"""
+    return asset_store.stats()
+
+
+@app.get("/sessions/{session_id}/transcript", response_class=JSONResponse)
+async def session_transcript(session_id: str, last: int = 50, partial: bool = False):
+    """The last turns of a session's conversation, e.g. to restore the chat after a reconnect"""
+    transcript = transcript_store.get(session_id, create=False)
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="No transcript for this session")
+    return {"turns": transcript.last(last, include_open=partial), **transcript.stats()}
+
+
+@app.get("/offload/stats", response_class=JSONResponse)
+async def offload_stats():
+    """CPU-heavy calls run inline vs in the offload pool, and their time"""
+    return offloader.stats()
+
+
+@app.get("/sessions/audio", response_class=JSONResponse)
+async def session_audio_stats():
+    """Per-session inbound audio chunks vs coalesced windows"""
+    return {session_id: audio.stats() for session_id, audio in audio_coalescers.items()}
+
+
+@app.get("/sessions/audio/out", response_class=JSONResponse)
+async def session_audio_out_stats():
+    """Per-session outbound audio codec and bandwidth"""
+    return {session_id: encoder.stats() for session_id, encoder in audio_encoders.items()}
+
+
+@app.post("/sessions/{session_id}/prewarm", response_class=JSONResponse)
+async def prewarm_session(session_id: int, request: Request, is_audio: bool = True):
+    """
+    Starts the live session for session_id before its websocket connects,
+    e.g. when the learner reaches for Start; the websocket then attaches to
+    it. Speculative, so it only takes a free slot in the "prewarm" pool,
+    which counts against LIVE_SESSION_LIMIT, and never queues. Unclaimed
+    sessions are torn down after PREWARM_TTL seconds.
+    """
+    if PREWARM_TTL <= 0:
+        return {"prewarmed": False, "reason": "disabled"}
+    try:
+        check_rate_limits(request, "prewarm")
+    except Rejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail={"error": e.reason, "retry_after": e.retry_after},
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    slot = admission.try_acquire("prewarm")
+    if slot is None:
+        return {"prewarmed": False, "reason": "no_capacity"}
+    started = await prewarms.prewarm(str(session_id), is_audio, slot)
+    return JSONResponse({"prewarmed": True, "ttl": PREWARM_TTL}, status_code=202 if started else 200)
+
+
+@app.delete("/sessions/{session_id}/prewarm", response_class=JSONResponse)
+async def discard_prewarmed_session(session_id: int):
+    """Tears down session_id's pre-warmed session, e.g. when the learner leaves the details page"""
+    return {"discarded": await prewarms.discard(str(session_id))}
+
+
+@app.get("/sessions/prewarm", response_class=JSONResponse)
+async def prewarm_stats():
+    """Pre-warmed sessions waiting for their websocket, and how past ones ended"""
+    return prewarms.stats()
+
+
+@REGISTRY.collector
+def process_metrics():
+    """Pool, process and event-loop gauges, read only when /metrics is scraped"""
+    pool = session_pool.stats()
+    lag = loop_monitor.stats()
+    tasks = supervisor.stats()
+    admitted = admission.stats()
+    return [
+        ("skill_frame_live_sessions", "Live sessions held by this worker", {(): pool["sessions"]}),
+        ("skill_frame_process_rss_bytes", "Resident memory of this worker", {(): pool["rss_bytes"]}),
+        ("skill_frame_process_cpu_seconds", "CPU time used by this worker", {(): pool["cpu_seconds"]}),
+        ("skill_frame_live_sessions_in_use", "Live sessions with a connected client", {(): pool["in_use"]}),
+        ("skill_frame_supervised_tasks", "Running websocket session tasks", {(): tasks["active_tasks"]}),
+        ("skill_frame_leaked_tasks", "Session tasks that ignored cancellation", {(): tasks["leaked_tasks"]}),
+        (
+            "skill_frame_prewarmed_sessions",
+            "Pre-warmed sessions waiting for their websocket",
+            {(): prewarms.stats()["waiting"]},
+        ),
+        (
+            "skill_frame_admission_active",
+            "Admitted sessions and generations by pool",
+            {(("pool", pool),): stats["active"] for pool, stats in admitted["pools"].items()},
+        ),
+        (
+            "skill_frame_admission_waiting",
+            "Sessions and generations waiting for admission by pool",
+            {(("pool", pool),): stats["waiting"] for pool, stats in admitted["pools"].items()},
+        ),
+        (
+            "skill_frame_event_loop_lag_seconds",
+            "Event-loop lag over the recent window",
+            {
+                (("quantile", quantile),): lag.get(key, 0) / 1000
+                for quantile, key in (("0.5", "p50_ms"), ("0.99", "p99_ms"), ("1", "max_ms"))
+            },
+        ),
+    ]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the counters above"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/sessions/admission", response_class=JSONResponse)
+async def session_admission_stats():
+    """Admission pools, wait queues and rate limiters"""
+    return {
+        **admission.stats(),
+        "rate_limits": {"user": user_rate_limiter.stats(), "ip": ip_rate_limiter.stats()},
+    }
+
+
+@app.get("/healthz", response_class=JSONResponse)
+async def healthz():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 200 once the SDKs are loaded (or will be loaded on demand in
+    lazy mode), 503 while warming up or after a failed warm-up.
+    """
+    stats = warmup.stats()
+    is_ready = warmup.ready or (warmup.mode == "lazy" and warmup.state != FAILED)
+    return JSONResponse(stats, status_code=200 if is_ready else 503)
+
+
+@app.get("/startup/profile", response_class=JSONResponse)
+async def startup_profile():
+    """How long importing main.py and each warm-up step took"""
+    return {"main_import_s": MAIN_IMPORT_SECONDS, "warmup": warmup.stats()}
+
+
+@app.get("/sessions/stats", response_class=JSONResponse)
+async def session_stats():
+    """Live session count, process memory and CPU use, event-loop lag and session tasks"""
+    return {**session_pool.stats(), "loop_lag": loop_monitor.stats(), "tasks": supervisor.stats()}
+
+
+# Everything above runs before uvicorn can accept a connection
+MAIN_IMPORT_SECONDS = round(time.perf_counter() - IMPORT_STARTED, 4)
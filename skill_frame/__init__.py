@@ -0,0 +1 @@
+"""Server-side helpers for the ADK streaming role-play app."""
@@ -0,0 +1,269 @@
+"""
+Admission control for work that holds model capacity.
+
+Live websocket sessions and role-play generation each draw from a named pool
+("audio", "text", "roleplay") with its own concurrency limit, and all pools
+share a total limit. When a pool is full, callers wait in a FIFO queue and
+are told their position as it changes; when the queue is full or the wait
+runs out, they are turned away with ``Rejected`` and a retry hint instead of
+piling onto the model and timing out together.
+
+``RateLimiter`` adds token buckets per user and per client IP, checked
+before anything is queued.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+
+# Control frames sent over the websocket while a session waits for admission
+ADMISSION_MIME_TYPE = "application/x-skill-frame-admission"
+
+QUEUED = "queued"
+ADMITTED = "admitted"
+REJECTED = "rejected"
+
+# Rejection reasons
+RATE_LIMITED = "rate_limited"
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted; retry_after is in seconds."""
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def frame(self):
+        return {"mime_type": ADMISSION_MIME_TYPE, "status": REJECTED, "reason": self.reason, "retry_after": self.retry_after}
+
+
+class RateLimiter:
+    """Token bucket per key: rate_per_minute sustained, up to burst at once."""
+
+    def __init__(self, rate_per_minute, burst, max_keys=10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (tokens, updated), least recently seen first
+        self._buckets = OrderedDict()
+        self.limited = 0
+
+    def check(self, key, now=None):
+        """Takes a token for key; returns 0 if allowed, else seconds until a token is available"""
+        if not self.rate or key is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0
+        else:
+            retry_after = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        # Dropping the oldest bucket only forgets a key that has been quiet the longest
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def stats(self):
+        return {"keys": len(self._buckets), "limited": self.limited, "rate_per_minute": self.rate * 60, "burst": self.burst}
+
+
+class _Waiter:
+    __slots__ = ("pool", "seq", "admitted", "changed")
+
+    def __init__(self, pool, seq):
+        self.pool = pool
+        self.seq = seq
+        self.admitted = False
+        self.changed = asyncio.Event()
+
+
+class Slot:
+    """A held admission; release() is idempotent. Also an async context manager."""
+
+    def __init__(self, controller, pool, waited):
+        self.controller = controller
+        self.pool = pool
+        self.waited = waited
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self.pool)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Per-pool and total concurrency limits with fair FIFO queues.
+    limits maps pool name -> max concurrent; a limit of 0 means unlimited.
+    total_limit caps the pools in total_pools together (all pools by default).
+    """
+
+    def __init__(self, limits, total_limit=0, total_pools=None, queue_limit=50, wait_timeout=60.0, retry_after=5.0):
+        self.limits = dict(limits)
+        self.total_limit = total_limit
+        self.total_pools = tuple(self.limits if total_pools is None else total_pools)
+        self.queue_limit = queue_limit
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._active = {pool: 0 for pool in self.limits}
+        self._queues = {pool: deque() for pool in self.limits}
+        self._seq = itertools.count()
+        self.admitted = {pool: 0 for pool in self.limits}
+        self.rejected = {pool: {} for pool in self.limits}
+        self.max_wait = {pool: 0.0 for pool in self.limits}
+
+    def _has_room(self, pool):
+        limit = self.limits[pool]
+        if limit and self._active[pool] >= limit:
+            return False
+        if not self.total_limit or pool not in self.total_pools:
+            return True
+        return self._total_active() < self.total_limit
+
+    def _total_active(self):
+        return sum(self._active[pool] for pool in self.total_pools)
+
+    def _waiting_for_total(self):
+        """True if a pool sharing the total has waiters that only the total holds back"""
+        return any(
+            self._queues[pool] and not (self.limits[pool] and self._active[pool] >= self.limits[pool])
+            for pool in self.total_pools
+        )
+
+    def reject(self, pool, reason, retry_after=None):
+        """Counts a rejection and returns the Rejected to raise"""
+        self.rejected[pool][reason] = self.rejected[pool].get(reason, 0) + 1
+        return Rejected(reason, round(retry_after if retry_after is not None else self.retry_after, 1))
+
+    def try_acquire(self, pool):
+        """A slot in pool if one is free and nobody is waiting for it, else None"""
+        if self._queues[pool] or not self._has_room(pool):
+            return None
+        if self.total_limit and pool in self.total_pools and self._waiting_for_total():
+            # Room in the total goes to the oldest waiter of the pools sharing it
+            return None
+        self._active[pool] += 1
+        self.admitted[pool] += 1
+        return Slot(self, pool, 0.0)
+
+    def transfer(self, slot, pool):
+        """
+        Moves a held slot to pool without queueing, e.g. a pre-warmed session
+        becoming a live one: its place in the total is kept, so only pool's
+        own limit (and the total, if slot's pool is outside it) must have
+        room. Returns the new slot, or None and slot is left as it was.
+        """
+        if slot._released:
+            return None
+        limit = self.limits[pool]
+        if limit and self._active[pool] >= limit:
+            return None
+        needs_total = pool in self.total_pools and slot.pool not in self.total_pools
+        if self.total_limit and needs_total and self._total_active() >= self.total_limit:
+            return None
+        # Take the new place before giving up the old one, so no waiter slips in between
+        self._active[pool] += 1
+        self.admitted[pool] += 1
+        slot.release()
+        return Slot(self, pool, slot.waited)
+
+    async def acquire(self, pool, on_position=None, timeout=None):
+        """
+        Waits for a slot in pool and returns it. await on_position(position,
+        queued) is called whenever the caller's place in the queue changes.
+        Raises Rejected when the queue is full or the wait times out.
+        """
+        slot = self.try_acquire(pool)
+        if slot is not None:
+            return slot
+        timeout = self.wait_timeout if timeout is None else timeout
+        queue = self._queues[pool]
+        if len(queue) >= self.queue_limit:
+            raise self.reject(pool, QUEUE_FULL)
+
+        started = time.monotonic()
+        waiter = _Waiter(pool, next(self._seq))
+        queue.append(waiter)
+        position = None
+        try:
+            while True:
+                self._dispatch()
+                if waiter.admitted:
+                    break
+                if on_position is not None and queue.index(waiter) + 1 != position:
+                    position = queue.index(waiter) + 1
+                    await on_position(position, len(queue))
+                    if waiter.admitted:
+                        break
+                waiter.changed.clear()
+                remaining = started + timeout - time.monotonic()
+                if remaining <= 0:
+                    raise self.reject(pool, QUEUE_TIMEOUT)
+                try:
+                    await asyncio.wait_for(waiter.changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if waiter.admitted:
+                self._release(pool)
+            else:
+                queue.remove(waiter)
+                for other in queue:
+                    other.changed.set()
+                self._dispatch()
+            raise
+        waited = time.monotonic() - started
+        self.max_wait[pool] = max(self.max_wait[pool], waited)
+        return Slot(self, pool, waited)
+
+    def _release(self, pool):
+        self._active[pool] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admits queued waiters, oldest first, wherever their pool has room"""
+        while True:
+            heads = [queue[0] for pool, queue in self._queues.items() if queue and self._has_room(pool)]
+            if not heads:
+                return
+            waiter = min(heads, key=lambda w: w.seq)
+            self._queues[waiter.pool].popleft()
+            self._active[waiter.pool] += 1
+            self.admitted[waiter.pool] += 1
+            waiter.admitted = True
+            # Everyone behind it moved up a place
+            for other in itertools.chain((waiter,), self._queues[waiter.pool]):
+                other.changed.set()
+
+    def stats(self):
+        return {
+            "total_limit": self.total_limit,
+            "total_active": self._total_active(),
+            "pools": {
+                pool: {
+                    "limit": self.limits[pool],
+                    "active": self._active[pool],
+                    "waiting": len(self._queues[pool]),
+                    "admitted": self.admitted[pool],
+                    "rejected": dict(self.rejected[pool]),
+                    "max_wait_s": round(self.max_wait[pool], 3),
+                }
+                for pool in self.limits
+            },
+        }
@@ -0,0 +1,141 @@
+"""
+Server-side role-play analysis.
+
+Instead of reopening the websocket in text mode and asking the live agent to
+analyze "our conversation" from memory, the analysis is built from the
+conversation stored with the session and generated with one non-live
+request. Results are cached per session and conversation, so retries and
+double clicks don't pay for a second generation.
+"""
+
+import asyncio
+
+from .logs import ROLEPLAY, get_logger, summarize
+
+log = get_logger(ROLEPLAY)
+
+ANALYSIS_PROMPT = """
+**ROLE-PLAY PERFORMANCE ANALYSIS REQUEST**
+
+Analyze the learner's performance in the role-play conversation below.
+
+**Original Scenario Context:**
+- Title: {title}
+- Description: {description}
+- User Role: {user_role} ({user_name})
+- AI Role: {ai_role} ({ai_name})
+
+**Success Criteria for the Role-Play:**
+{success_criteria}
+
+**Session Duration:** {duration}
+
+**Conversation Transcript:**
+{transcript}
+
+**Analysis Focus:**
+- Evaluate communication clarity and effectiveness
+- Assess achievement of the stated success criteria
+- Consider professional presence and confidence level
+- Analyze listening and response quality
+- Identify specific areas for skill development
+- Reference actual moments from the conversation
+- Provide constructive, actionable feedback for improvement
+
+Respond ONLY with a JSON object in this format:
+{{
+  "strengths": ["Specific strength with detailed explanation of what the user did well", "..."],
+  "improvements": ["Specific area for improvement with actionable advice", "..."],
+  "detailed_feedback": "Comprehensive 3-4 paragraph analysis covering overall communication effectiveness, achievement of success criteria, specific examples from the conversation, professional presence, and actionable recommendations for future practice."
+}}
+"""
+
+SPEAKERS = {"user": "Learner", "agent": "Role-play partner"}
+
+
+def transcript_from_events(events):
+    """
+    Builds [{"role": "user"|"agent", "text": ...}] from ADK session events,
+    merging consecutive text from the same speaker. Partial (streaming) events
+    are skipped when the final text was recorded as well.
+    """
+    events = list(events or [])
+    has_final = any(not getattr(event, "partial", False) for event in events)
+    turns = []
+    for event in events:
+        if has_final and getattr(event, "partial", False):
+            continue
+        content = getattr(event, "content", None)
+        if content is None or not content.parts:
+            continue
+        text = "".join(part.text for part in content.parts if getattr(part, "text", None)).strip()
+        if not text:
+            continue
+        role = "user" if getattr(event, "author", None) == "user" else "agent"
+        if turns and turns[-1]["role"] == role:
+            turns[-1]["text"] += " " + text
+        else:
+            turns.append({"role": role, "text": text})
+    return turns
+
+
+def format_transcript(turns):
+    return "\n".join(f"{SPEAKERS.get(turn['role'], turn['role'])}: {turn['text']}" for turn in turns)
+
+
+def format_duration(seconds):
+    if not isinstance(seconds, (int, float)) or seconds < 0:
+        return "unknown"
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def build_analysis_prompt(scenario, turns, duration=None):
+    """Returns the analysis instruction for a scenario and its conversation"""
+    scenario = scenario or {}
+    criteria = scenario.get("success_criteria") or []
+    return ANALYSIS_PROMPT.format(
+        title=scenario.get("title", ""),
+        description=scenario.get("description", ""),
+        user_role=scenario.get("user_role", ""),
+        user_name=scenario.get("user_name", ""),
+        ai_role=scenario.get("ai_role", ""),
+        ai_name=scenario.get("ai_name", ""),
+        success_criteria="\n".join(f"{index}. {criterion}" for index, criterion in enumerate(criteria, 1)),
+        duration=format_duration(duration),
+        transcript=format_transcript(turns),
+    )
+
+
+class AnalysisEngine:
+    """
+    Generates role-play analyses with a one-shot model.
+    parse(cleaned_text) returns the validated analysis or raises ValueError.
+    Large responses are parsed through offload (an Offloader) if given.
+    """
+
+    def __init__(self, model, parse, clean=None, concurrency=4, cache=None, offload=None):
+        self.model = model
+        self.parse = parse
+        self.clean = clean or (lambda text: text)
+        self.cache = cache
+        self.offload = offload
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze(self, session_id, scenario, turns, duration=None):
+        """Analysis of a session's conversation, cached per session and conversation"""
+        prompt = build_analysis_prompt(scenario, turns, duration)
+        if self.cache is None:
+            return await self._generate(prompt)
+        # The duration changes on every request; the conversation is what matters
+        key = f"{session_id}\n{build_analysis_prompt(scenario, turns)}"
+        return await self.cache.get_or_create(key, lambda: self._generate(prompt))
+
+    async def _generate(self, prompt):
+        async with self._semaphore:
+            text = await self.model.generate(prompt)
+        log.debug("Analysis response: %s", summarize(text))
+        text = self.clean(text)
+        if self.offload is None:
+            return self.parse(text)
+        return await self.offload.run("parse", len(text), self.parse, text)
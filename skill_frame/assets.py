@@ -0,0 +1,468 @@
+"""
+Precompressed, fingerprinted static assets.
+
+The PDF viewer bundle (pdf.worker.mjs alone is ~2 MB) used to be served
+uncompressed and without cache headers. ``AssetStore`` indexes the static
+directory once at startup and precompresses text-like assets with gzip and,
+if the ``brotli`` package is installed, brotli. Each request gets the
+smallest encoding the client accepts. Compressed copies are written to a
+cache directory keyed by content hash, so each asset version is only
+compressed once; ``python -m skill_frame.assets`` builds them ahead of time.
+
+Every asset also has a fingerprinted URL (``pdf.worker.<hash>.mjs``) that is
+served as immutable; plain URLs are revalidated with their ETag. Uncompressed
+responses honor Range and If-Range, which PDF.js uses for the sample PDF.
+
+Hot assets (index.html, app.js, the worklets, CSS) are also kept in a
+byte-bounded in-memory LRU together with their compressed variants, so a page
+load is answered without touching the disk. In production the index is
+frozen at startup; in dev mode each request stats the file and reloads it
+when its mtime changes.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+mimetypes.add_type("text/javascript", ".mjs")
+mimetypes.add_type("text/plain", ".ftl")
+mimetypes.add_type("application/octet-stream", ".bcmap")
+
+COMPRESSIBLE_SUFFIXES = {
+    ".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt",
+    ".ftl", ".bcmap", ".pfb", ".ttf", ".otf",
+}
+MIN_COMPRESS_SIZE = 1024
+# A compressed copy is only served if it saves at least this fraction
+MIN_SAVING = 0.1
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+FINGERPRINT_LENGTH = 10
+
+_SUFFIXES = {"gzip": "gz", "br": "br"}
+_FINGERPRINTED = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<suffix>\.[^./]+)$" % FINGERPRINT_LENGTH)
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_STATIC_URL = re.compile(r'((?:src|href)=")/static/([^"?#]+)(")')
+
+
+def compress(data, encoding, gzip_level=9, brotli_quality=11):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding, sizes):
+    """Picks the smallest of sizes ({encoding: bytes}) the client accepts, or None"""
+    if not accept_encoding or not sizes:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    if "*" in accepted:
+        accepted.update(sizes)
+    candidates = [encoding for encoding in sizes if encoding in accepted]
+    return min(candidates, key=sizes.get) if candidates else None
+
+
+def etag_matches(header, digest):
+    """True if an If-None-Match/If-Range header names any representation of digest"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-", 1)[0] == digest:
+            return True
+    return False
+
+
+def fingerprinted_name(relpath, digest):
+    stem, dot, suffix = relpath.rpartition(".")
+    if not dot or "/" in suffix:
+        return f"{relpath}.{digest[:FINGERPRINT_LENGTH]}"
+    return f"{stem}.{digest[:FINGERPRINT_LENGTH]}.{suffix}"
+
+
+class Asset:
+    __slots__ = ("path", "relpath", "size", "mtime_ns", "digest", "media_type", "variants")
+
+    def __init__(self, path, relpath, size, mtime_ns, digest, media_type):
+        self.path = path
+        self.relpath = relpath
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+        self.media_type = media_type
+        # encoding -> (path, size) of compressed copies worth serving
+        self.variants = {}
+
+    @property
+    def compressible(self):
+        return self.size >= MIN_COMPRESS_SIZE and Path(self.relpath).suffix.lower() in COMPRESSIBLE_SUFFIXES
+
+    def etag(self, encoding=None):
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+class Page:
+    """A rendered document (HTML with fingerprinted URLs), held in memory."""
+
+    __slots__ = ("body", "digest", "media_type", "encoded", "sources")
+
+    def __init__(self, body, media_type, encodings, sources):
+        self.body = body
+        # Asset paths the rendering depends on: the page itself and the URLs it points at
+        self.sources = sources
+        self.digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.media_type = media_type
+        self.encoded = {}
+        for encoding in encodings:
+            data = compress(body, encoding)
+            if len(data) <= len(body) * (1 - MIN_SAVING):
+                self.encoded[encoding] = data
+
+
+class MemoryCache:
+    """Thread-safe LRU of response bodies, bounded by total bytes."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = body
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class AssetStore:
+    """Static directory index with precompressed copies and fingerprinted URLs."""
+
+    def __init__(
+        self,
+        directory,
+        cache_dir=".cache/assets",
+        gzip_level=9,
+        brotli_quality=11,
+        memory_limit=32 * 1024 * 1024,
+        memory_entry_limit=1024 * 1024,
+        dev=False,
+    ):
+        self.directory = Path(directory).resolve()
+        self.cache_dir = Path(cache_dir)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.dev = dev
+        self.memory = MemoryCache(memory_limit, memory_entry_limit)
+        self._assets = {}
+        self._pages = {}
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.index()
+
+    def index(self):
+        """Hashes every file under the directory and picks up existing compressed copies"""
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = Path(root, name)
+                relpath = path.relative_to(self.directory).as_posix()
+                assets[relpath] = self._load(path, relpath)
+        self._assets = assets
+        self._pages = {}
+
+    def _load(self, path, relpath):
+        stat = path.stat()
+        digest = hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        asset = Asset(path, relpath, stat.st_size, stat.st_mtime_ns, digest, media_type)
+        for encoding in available_encodings():
+            self._attach(asset, encoding)
+        return asset
+
+    def _refresh(self, asset):
+        """Dev mode: reloads an asset whose file changed; returns the current asset"""
+        try:
+            stat = asset.path.stat()
+        except FileNotFoundError:
+            return asset
+        if stat.st_mtime_ns == asset.mtime_ns and stat.st_size == asset.size:
+            return asset
+        fresh = self._load(asset.path, asset.relpath)
+        self._compress_asset(fresh)
+        self._assets[asset.relpath] = fresh
+        # Rendered pages may point at the old fingerprint
+        self._pages = {}
+        return fresh
+
+    def _variant_path(self, asset, encoding):
+        return self.cache_dir / f"{asset.digest}.{_SUFFIXES[encoding]}"
+
+    def _attach(self, asset, encoding):
+        if not asset.compressible:
+            return
+        path = self._variant_path(asset, encoding)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size <= asset.size * (1 - MIN_SAVING):
+            asset.variants[encoding] = (path, size)
+
+    def compress(self):
+        """Writes missing compressed copies; safe to run in a thread while serving"""
+        for asset in list(self._assets.values()):
+            self._compress_asset(asset)
+
+    def _compress_asset(self, asset):
+        if not asset.compressible:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for encoding in available_encodings():
+            path = self._variant_path(asset, encoding)
+            if path.exists():
+                continue
+            data = compress(
+                asset.path.read_bytes(), encoding,
+                gzip_level=self.gzip_level, brotli_quality=self.brotli_quality,
+            )
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            self._attach(asset, encoding)
+
+    def lookup(self, relpath):
+        """Returns (asset, fingerprinted) for a plain or fingerprinted path; asset is None if missing"""
+        asset = self._assets.get(relpath)
+        if asset is not None:
+            return (self._refresh(asset) if self.dev else asset), False
+        match = _FINGERPRINTED.match(relpath)
+        if match:
+            asset = self._assets.get(match["stem"] + match["suffix"])
+            if asset is not None:
+                if self.dev:
+                    asset = self._refresh(asset)
+                # A stale fingerprint still gets the current file, just not as immutable
+                return asset, asset.digest.startswith(match["hash"])
+        return None, False
+
+    def url(self, relpath):
+        """Fingerprinted /static URL of an asset (the plain URL if it doesn't exist)"""
+        asset = self._assets.get(relpath)
+        if asset is None:
+            return f"/static/{relpath}"
+        return f"/static/{fingerprinted_name(relpath, asset.digest)}"
+
+    def rewrite_html(self, html):
+        """Points src/href attributes at fingerprinted /static URLs"""
+        return _STATIC_URL.sub(lambda m: m.group(1) + self.url(m.group(2)) + m.group(3), html)
+
+    def page(self, relpath):
+        """An HTML asset rendered with fingerprinted URLs, compressed in memory"""
+        page = self._pages.get(relpath)
+        if page is not None and self.dev:
+            for source in page.sources:
+                self._refresh(self._assets[source])
+            page = self._pages.get(relpath)
+        if page is None:
+            asset = self._assets[relpath]
+            html = asset.path.read_text(encoding="utf-8")
+            sources = [relpath] + [m.group(2) for m in _STATIC_URL.finditer(html) if m.group(2) in self._assets]
+            body = self.rewrite_html(html).encode("utf-8")
+            page = self._pages[relpath] = Page(body, asset.media_type, available_encodings(), sources)
+        return page
+
+    def _record(self, size, sent):
+        self.requests += 1
+        self.bytes_sent += sent
+        self.bytes_saved += size - sent
+
+    def page_response(self, relpath, request_headers):
+        page = self.page(relpath)
+        headers = {"etag": f'"{page.digest}"', "cache-control": REVALIDATE}
+        if page.encoded:
+            headers["vary"] = "Accept-Encoding"
+        if etag_matches(request_headers.get("if-none-match"), page.digest):
+            return Response(status_code=304, headers=headers)
+        encoding = negotiate(
+            request_headers.get("accept-encoding"),
+            {encoding: len(data) for encoding, data in page.encoded.items()},
+        )
+        body = page.body
+        if encoding:
+            body = page.encoded[encoding]
+            headers["content-encoding"] = encoding
+            headers["etag"] = f'"{page.digest}-{encoding}"'
+        self._record(len(page.body), len(body))
+        return Response(body, media_type=page.media_type, headers=headers)
+
+    def response(self, relpath, request_headers):
+        """Response for a /static path, honoring Accept-Encoding, ETags and Range"""
+        asset, fingerprinted = self.lookup(relpath)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        headers = {
+            "etag": asset.etag(),
+            "cache-control": IMMUTABLE if fingerprinted and not self.dev else REVALIDATE,
+            "accept-ranges": "bytes",
+        }
+        if asset.variants:
+            headers["vary"] = "Accept-Encoding"
+        if etag_matches(request_headers.get("if-none-match"), asset.digest):
+            return Response(status_code=304, headers=headers)
+
+        range_header = request_headers.get("range")
+        if range_header and (
+            "if-range" not in request_headers or etag_matches(request_headers["if-range"], asset.digest)
+        ):
+            ranged = self._range_response(asset, range_header, headers)
+            if ranged is not None:
+                return ranged
+
+        encoding = negotiate(
+            request_headers.get("accept-encoding"),
+            {encoding: size for encoding, (_, size) in asset.variants.items()},
+        )
+        path, size = asset.path, asset.size
+        if encoding:
+            path, size = asset.variants[encoding]
+            headers["content-encoding"] = encoding
+            headers["etag"] = asset.etag(encoding)
+        self._record(asset.size, size)
+        body = self._body(asset, encoding, path, size)
+        if body is None:
+            return FileResponse(path, media_type=asset.media_type, headers=headers)
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+    def _body(self, asset, encoding, path, size):
+        """Bytes of one representation from the memory cache; None if it's too large to cache"""
+        if size > self.memory.max_entry_bytes:
+            return None
+        key = (asset.digest, encoding)
+        body = self.memory.get(key)
+        if body is None:
+            body = path.read_bytes()
+            self.memory.put(key, body)
+        return body
+
+    def _range_response(self, asset, range_header, headers):
+        """206/416 for a single byte range; None to ignore the header and send the whole asset"""
+        match = _RANGE.match(range_header.strip())
+        if match is None or match.group(1) == match.group(2) == "":
+            return None
+        first, last = match.groups()
+        size = asset.size
+        if first == "":
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        body = self._body(asset, None, asset.path, size)
+        if body is not None:
+            data = body[start:end + 1]
+        else:
+            with open(asset.path, "rb") as f:
+                f.seek(start)
+                data = f.read(end - start + 1)
+        self._record(len(data), len(data))
+        return Response(
+            data,
+            status_code=206,
+            media_type=asset.media_type,
+            headers={**headers, "content-range": f"bytes {start}-{end}/{size}"},
+        )
+
+    def stats(self):
+        assets = self._assets.values()
+        compressible = [asset for asset in assets if asset.compressible]
+        original = sum(asset.size for asset in compressible)
+        best = sum(min((size for _, size in asset.variants.values()), default=asset.size) for asset in compressible)
+        return {
+            "files": len(self._assets),
+            "bytes": sum(asset.size for asset in assets),
+            "compressible": len(compressible),
+            "compressed": sum(1 for asset in compressible if asset.variants),
+            "encodings": list(available_encodings()),
+            "precompressed_bytes_saved": original - best,
+            "precompressed_ratio": round(best / original, 3) if original else 1.0,
+            "requests": self.requests,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_saved,
+            "memory": self.memory.stats(),
+            "dev": self.dev,
+        }
+
+
+if __name__ == "__main__":
+    # Build compressed copies ahead of time: python -m skill_frame.assets [static_dir] [cache_dir]
+    store = AssetStore(*(sys.argv[1:3] or ["static"]))
+    store.compress()
+    print(store.stats())
@@ -0,0 +1,171 @@
+"""
+Inbound audio/pcm pipeline stage.
+
+The recorder worklet posts 128-sample chunks (8 ms at 16 kHz), and each one
+used to become its own LiveRequestQueue message. ``AudioCoalescer`` buffers
+chunks in a preallocated NumPy array and releases fixed windows (100 ms by
+default), so the model connection sees an order of magnitude fewer messages.
+
+Chunks are validated and normalized on the way in: odd trailing bytes are
+dropped, multi-channel audio is downmixed and other sample rates are
+resampled to the 16 kHz the Live API expects. Rates outside 8-48 kHz and
+more than two channels are rejected as malformed, since both come from the
+client. With ``vad=True`` windows
+below an energy threshold are dropped, keeping a short hangover after speech
+so the model's own end-of-turn detection still hears the pause.
+"""
+
+import numpy as np
+
+MODEL_SAMPLE_RATE = 16000
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+MAX_CHANNELS = 2
+FULL_SCALE = 32768.0
+
+
+class AudioCoalescer:
+    """Coalesces 16-bit PCM chunks into fixed windows for the model."""
+
+    def __init__(
+        self,
+        window_ms=100,
+        sample_rate=MODEL_SAMPLE_RATE,
+        vad=False,
+        vad_threshold_db=-50.0,
+        hangover_ms=800,
+        preroll_windows=1,
+    ):
+        self.window_ms = window_ms
+        self.sample_rate = sample_rate
+        self.vad = vad
+        self.vad_threshold_db = vad_threshold_db
+        self.hangover_windows = max(int(hangover_ms / window_ms), 0)
+        self.preroll_windows = preroll_windows
+        self._input_rate = sample_rate
+        self._buffer = np.empty(self._window_samples(sample_rate) * 4, dtype=np.int16)
+        self._fill = 0
+        self._hangover = 0
+        self._preroll = []
+        self.chunks_in = 0
+        self.bytes_in = 0
+        self.windows_out = 0
+        self.bytes_out = 0
+        self.dropped_silence = 0
+        self.malformed = 0
+
+    @property
+    def pending(self):
+        """True if samples are waiting for a full window"""
+        return self._fill > 0
+
+    def _window_samples(self, rate):
+        return max(int(rate * self.window_ms / 1000), 1)
+
+    def push(self, data, sample_rate=None, channels=1):
+        """Adds a chunk of little-endian 16-bit PCM; returns the windows ready to send"""
+        self.chunks_in += 1
+        self.bytes_in += len(data)
+        try:
+            rate = int(sample_rate or self.sample_rate)
+            channels = int(channels or 1)
+        except (TypeError, ValueError):
+            rate = channels = 0
+        if not MIN_SAMPLE_RATE <= rate <= MAX_SAMPLE_RATE or not 1 <= channels <= MAX_CHANNELS:
+            self.malformed += 1
+            return []
+        frame_bytes = 2 * channels
+        if len(data) % frame_bytes:
+            self.malformed += 1
+            data = data[:len(data) - len(data) % frame_bytes]
+        if not data:
+            return []
+
+        samples = np.frombuffer(data, dtype="<i2")
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+        windows = []
+        if rate != self._input_rate:
+            # Don't mix rates within one window
+            windows += self.flush()
+            self._input_rate = rate
+        self._append(samples)
+
+        size = self._window_samples(self._input_rate)
+        start = 0
+        while self._fill - start >= size:
+            windows += self._emit(self._buffer[start:start + size])
+            start += size
+        if start:
+            remaining = self._fill - start
+            self._buffer[:remaining] = self._buffer[start:self._fill]
+            self._fill = remaining
+        return windows
+
+    def flush(self):
+        """Releases buffered samples as a short window, e.g. before text or on disconnect"""
+        if not self._fill:
+            return []
+        windows = self._emit(self._buffer[:self._fill])
+        self._fill = 0
+        return windows
+
+    def _append(self, samples):
+        needed = self._fill + len(samples)
+        if needed > len(self._buffer):
+            grown = np.empty(max(needed, len(self._buffer) * 2), dtype=np.int16)
+            grown[:self._fill] = self._buffer[:self._fill]
+            self._buffer = grown
+        self._buffer[self._fill:needed] = samples
+        self._fill = needed
+
+    def _emit(self, samples):
+        if self._input_rate != self.sample_rate:
+            samples = resample(samples, self._input_rate, self.sample_rate)
+        window = samples.astype("<i2").tobytes()
+        if self.vad and not self._is_speech(samples):
+            if self._hangover > 0:
+                self._hangover -= 1
+            else:
+                # Keep the last silent windows so speech onsets aren't clipped
+                self._preroll.append(window)
+                if len(self._preroll) > self.preroll_windows:
+                    self._preroll.pop(0)
+                    self.dropped_silence += 1
+                return []
+        elif self.vad:
+            self._hangover = self.hangover_windows
+        windows = self._preroll + [window]
+        self._preroll = []
+        self.windows_out += len(windows)
+        self.bytes_out += sum(len(w) for w in windows)
+        return windows
+
+    def _is_speech(self, samples):
+        if not len(samples):
+            return False
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float64)))
+        return 20 * np.log10(max(rms, 1.0) / FULL_SCALE) > self.vad_threshold_db
+
+    def stats(self):
+        return {
+            "chunks_in": self.chunks_in,
+            "bytes_in": self.bytes_in,
+            "windows_out": self.windows_out,
+            "bytes_out": self.bytes_out,
+            "dropped_silence_windows": self.dropped_silence,
+            "malformed_chunks": self.malformed,
+            "window_ms": self.window_ms,
+            "vad": self.vad,
+        }
+
+
+def resample(samples, from_rate, to_rate):
+    """Linear-interpolation resampling of int16 samples"""
+    if from_rate == to_rate or not len(samples):
+        return samples
+    length = max(int(round(len(samples) * to_rate / from_rate)), 1)
+    positions = np.linspace(0, len(samples) - 1, length)
+    resampled = np.interp(positions, np.arange(len(samples)), samples.astype(np.float64))
+    return np.clip(np.round(resampled), -32768, 32767).astype(np.int16)
@@ -0,0 +1,147 @@
+"""
+Outbound agent audio, encoded per connection.
+
+The model speaks 16-bit mono PCM at 24 kHz: 48 KB/s raw, 64 KB/s once base64
+encoded into JSON. Clients on binary framing can ask for Opus with
+``audio_codec=opus``; ``OpusEncoder`` then cuts the stream into 20 ms
+packets at a voice bitrate (24 kbps by default, about 3 KB/s) and sends them
+as "audio/opus" binary frames. The client decodes them with WebCodecs and
+feeds the same player worklet.
+
+A frame's payload holds one or more packets, each prefixed with its length
+as an unsigned 16-bit big-endian integer. Partial frames are padded with
+silence and sent at the end of a turn, and dropped on an interruption.
+
+Opus needs opuslib (in requirements-optional.txt, not requirements.txt)
+and the libopus shared library. Without them, or for clients that don't ask
+for it, audio stays PCM (``PcmEncoder``). Both
+encoders count the PCM they got and the bytes that went out for the
+session, so bandwidth can be compared per codec.
+"""
+
+import struct
+import time
+
+try:
+    import opuslib
+except (ImportError, OSError, AttributeError):  # opuslib and libopus are optional
+    opuslib = None
+
+PCM = "pcm"
+OPUS = "opus"
+
+# Sent as a JSON text frame after the protocol hello when the client asked for a codec
+CODEC_MIME_TYPE = "application/x-skill-frame-codec"
+
+OUTPUT_SAMPLE_RATE = 24000
+PACKET_LENGTH = struct.Struct(">H")
+
+
+def opus_available():
+    return opuslib is not None
+
+
+class PcmEncoder:
+    """Passes PCM through, keeping the session's byte counts."""
+
+    codec = PCM
+    mime_type = "audio/pcm"
+
+    def __init__(self, sample_rate=OUTPUT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.pcm_bytes = 0
+        self.encoded_bytes = 0
+        self.wire_bytes = 0
+        self.started = time.monotonic()
+
+    def encode(self, pcm):
+        """Encoded payload for a PCM chunk; may be empty while a packet fills"""
+        self.pcm_bytes += len(pcm)
+        self.encoded_bytes += len(pcm)
+        return pcm
+
+    def flush(self):
+        """Payload for whatever is buffered, at the end of a turn"""
+        return b""
+
+    def reset(self):
+        """Drops whatever is buffered, on an interruption"""
+
+    def sent(self, size):
+        """Counts size bytes of audio put on the wire, framing included"""
+        self.wire_bytes += size
+
+    def frame(self):
+        """The codec message for the client"""
+        return {"mime_type": CODEC_MIME_TYPE, "audio": self.codec, "sample_rate": self.sample_rate}
+
+    def stats(self):
+        audio_seconds = self.pcm_bytes / (2 * self.sample_rate)
+        return {
+            "codec": self.codec,
+            "audio_seconds": round(audio_seconds, 2),
+            "pcm_bytes": self.pcm_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "wire_bytes": self.wire_bytes,
+            "wire_kbps": round(self.wire_bytes * 8 / audio_seconds / 1000, 1) if audio_seconds else 0,
+            "compression": round(self.pcm_bytes / self.encoded_bytes, 1) if self.encoded_bytes else None,
+        }
+
+
+class OpusEncoder(PcmEncoder):
+    """Packs PCM into length-prefixed Opus packets of frame_ms each."""
+
+    codec = OPUS
+    mime_type = "audio/opus"
+
+    def __init__(self, sample_rate=OUTPUT_SAMPLE_RATE, frame_ms=20, bitrate=24000):
+        super().__init__(sample_rate)
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self._frame_bytes = self.frame_samples * 2
+        self._encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self._encoder.bitrate = bitrate
+        self._pending = bytearray()
+        self.packets = 0
+
+    def encode(self, pcm):
+        self.pcm_bytes += len(pcm)
+        self._pending += pcm
+        complete = len(self._pending) - len(self._pending) % self._frame_bytes
+        payload = self._packets(self._pending[:complete])
+        del self._pending[:complete]
+        return payload
+
+    def flush(self):
+        if not self._pending:
+            return b""
+        # Odd trailing byte included, pad to a whole packet of silence
+        pcm = bytes(self._pending[:len(self._pending) & ~1]).ljust(self._frame_bytes, b"\0")
+        self._pending.clear()
+        return self._packets(pcm)
+
+    def reset(self):
+        self._pending.clear()
+
+    def _packets(self, pcm):
+        out = bytearray()
+        for start in range(0, len(pcm), self._frame_bytes):
+            packet = self._encoder.encode(bytes(pcm[start:start + self._frame_bytes]), self.frame_samples)
+            out += PACKET_LENGTH.pack(len(packet))
+            out += packet
+            self.packets += 1
+        self.encoded_bytes += len(out)
+        return bytes(out)
+
+    def frame(self):
+        return {**super().frame(), "frame_ms": self.frame_ms, "channels": 1}
+
+    def stats(self):
+        return {**super().stats(), "packets": self.packets}
+
+
+def audio_encoder(codec, binary, bitrate=24000):
+    """The encoder for a connection: Opus if asked for, on binary framing and available, else PCM"""
+    if codec == OPUS and binary and opus_available():
+        return OpusEncoder(bitrate=bitrate)
+    return PcmEncoder()
@@ -0,0 +1,231 @@
+"""
+Content-addressed cache for generated role-play scenarios.
+
+Keys are a hash of the normalized prompt plus a namespace describing the
+generation config (model, prompt template, schema), so changing any of them
+never serves stale scenarios. Entries live in an in-memory LRU and,
+optionally, in SQLite so they survive restarts; expired entries are skipped
+on read and swept from both tiers in the background. Concurrent requests for
+the same key share one generation (single-flight).
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+
+from .logs import ROLEPLAY, get_logger
+
+log = get_logger(ROLEPLAY)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """Case-folds, collapses whitespace and drops trailing punctuation"""
+    return _WHITESPACE.sub(" ", prompt).strip().rstrip(".!?").casefold()
+
+
+def config_fingerprint(*parts):
+    """Stable short hash of the generation config, used as the cache namespace"""
+    blob = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+class _SqliteTier:
+    """On-disk tier; every call runs in a worker thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scenarios ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._lock = asyncio.Lock()
+
+    def _get(self, key, min_created):
+        row = self._conn.execute(
+            "SELECT value FROM scenarios WHERE key = ? AND created >= ?", (key, min_created)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, key, value, created, max_entries):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO scenarios (key, value, created) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), created),
+        )
+        self._conn.execute(
+            "DELETE FROM scenarios WHERE key NOT IN "
+            "(SELECT key FROM scenarios ORDER BY created DESC LIMIT ?)",
+            (max_entries,),
+        )
+
+    def _expire(self, min_created):
+        self._conn.execute("DELETE FROM scenarios WHERE created < ?", (min_created,))
+
+    async def get(self, key, min_created):
+        async with self._lock:
+            return await asyncio.to_thread(self._get, key, min_created)
+
+    async def put(self, key, value, created, max_entries):
+        async with self._lock:
+            await asyncio.to_thread(self._put, key, value, created, max_entries)
+
+    async def expire(self, min_created):
+        async with self._lock:
+            await asyncio.to_thread(self._expire, min_created)
+
+    def close(self):
+        self._conn.close()
+
+
+class ScenarioCache:
+    """LRU + optional SQLite scenario cache with TTL and single-flight."""
+
+    def __init__(
+        self, namespace="", max_entries=256, ttl=86400.0, path=None, disk_max_entries=10000, sweep_interval=600.0
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._disk = _SqliteTier(path) if path else None
+        self._inflight = {}
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def key(self, prompt):
+        """Content address of a prompt under this cache's namespace"""
+        blob = f"{self.namespace}\0{normalize_prompt(prompt)}"
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    async def get_or_create(self, prompt, factory):
+        """
+        Returns the cached scenario for prompt, or awaits factory() to build it.
+        Exceptions from factory are not cached and propagate to every waiter.
+        """
+        key = self.key(prompt)
+        value = await self._lookup(key)
+        if value is not None:
+            return copy.deepcopy(value)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return copy.deepcopy(await asyncio.shield(inflight))
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await factory()
+            await self._store(key, value)
+            future.set_result(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure with no other waiters isn't logged as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        return copy.deepcopy(value)
+
+    async def _lookup(self, key):
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            created, value = entry
+            if now - created < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+
+        if self._disk is not None:
+            value = await self._disk.get(key, now - self.ttl)
+            if value is not None:
+                self.disk_hits += 1
+                self._remember(key, value, now)
+                return value
+        return None
+
+    async def _store(self, key, value):
+        now = time.time()
+        self._remember(key, value, now)
+        if self._disk is not None:
+            try:
+                await self._disk.put(key, value, now, self.disk_max_entries)
+            except sqlite3.Error as e:
+                log.warning("Scenario cache disk write failed: %s", e)
+
+    def _remember(self, key, value, created):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    async def expire(self):
+        """Drops expired entries from both tiers"""
+        min_created = time.time() - self.ttl
+        for key in [k for k, (created, _) in self._memory.items() if created < min_created]:
+            del self._memory[key]
+        if self._disk is not None:
+            await self._disk.expire(min_created)
+
+    def start(self):
+        """Starts the background sweeper that drops expired entries"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.expire()
+            except Exception as e:
+                log.error("Scenario cache sweep failed: %s", e)
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        lookups = self.hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "entries": len(self._memory),
+            "inflight": len(self._inflight),
+            "hit_ratio": (lookups - self.misses) / lookups if lookups else 0.0,
+        }
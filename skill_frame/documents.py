@@ -0,0 +1,291 @@
+"""
+Server-side text index for the PDFs learners open in the viewer.
+
+Each PDF is parsed once (with pypdf) into per-page text and line layout and
+written to a single index file named after the PDF's content hash, so the
+same document uploaded twice, or by two learners, is indexed once. The file
+is read through mmap: page text, layout and an inverted index for full-text
+search are located with offset tables and binary search, nothing is loaded
+up front.
+
+Index file layout (little-endian)::
+
+    header      magic "SFPI", version, page count, term count, section offsets
+    meta        JSON: name, page sizes
+    pages       page count x (text offset, text length, layout offset, layout length)
+    terms       term count x (term offset, term length, postings offset, postings count), sorted
+    data        UTF-8 page text, JSON layout, term bytes, postings (page, term frequency)
+
+The live session gets the text of the page on screen as compact context,
+so screen-share frames are only needed for content that isn't text.
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+MAGIC = b"SFPI"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIIQQQQ")
+PAGE_ENTRY = struct.Struct("<QIQI")
+TERM_ENTRY = struct.Struct("<QHQI")
+POSTING = struct.Struct("<IH")
+
+_TOKEN = re.compile(r"\w{2,40}", re.UNICODE)
+_DOCUMENT_ID = re.compile(r"^[0-9a-f]{32}$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def tokenize(text):
+    return [token.lower() for token in _TOKEN.findall(text)]
+
+
+def document_id(data):
+    """Content hash used as the document id and index file name"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def extract_pages(data):
+    """
+    Parses a PDF into [(text, lines, width, height)] per page, where lines
+    is [[x, y, size, text]] with x and y as fractions of the page size
+    (from the top left), in content order, which is usually reading order
+    even for multi-column pages. Raises ValueError if the PDF can't be read.
+    """
+    import io
+
+    from pypdf import PdfReader
+    from pypdf.errors import PyPdfError
+
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        pages = [_extract_page(page) for page in reader.pages]
+    except (PyPdfError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Unreadable PDF: {e}") from e
+    return pages
+
+
+def _extract_page(page):
+    box = page.mediabox
+    width, height = float(box.width) or 1.0, float(box.height) or 1.0
+    fragments = []
+
+    def visit(text, cm, tm, _font, size):
+        if not text.strip():
+            return
+        # Text space -> user space
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        fragments.append((round(1 - y / height, 3), round(x / width, 3), round(size * abs(cm[3] or 1), 1), text))
+
+    page.extract_text(visitor_text=visit)
+
+    # Consecutive fragments on the same baseline form a line
+    lines = []
+    for y, x, size, text in fragments:
+        if lines and abs(lines[-1][1] - y) < 0.004:
+            lines[-1][3] += text
+        else:
+            lines.append([x, y, size, text])
+    for line in lines:
+        line[3] = _WHITESPACE.sub(" ", line[3]).strip()
+    lines = [line for line in lines if line[3]]
+    return "\n".join(line[3] for line in lines), lines, round(width, 1), round(height, 1)
+
+
+def write_index(path, pages, name=None):
+    """Writes the index for extract_pages() output to path, atomically"""
+    meta = json.dumps({
+        "name": name,
+        "pages": [[width, height] for _, _, width, height in pages],
+    }).encode("utf-8")
+
+    postings = {}
+    for number, (text, _, _, _) in enumerate(pages):
+        for term, count in Counter(tokenize(text)).items():
+            postings.setdefault(term, []).append((number, min(count, 0xFFFF)))
+    terms = sorted((term.encode("utf-8"), entries) for term, entries in postings.items())
+
+    meta_offset = HEADER.size
+    pages_offset = meta_offset + len(meta)
+    terms_offset = pages_offset + PAGE_ENTRY.size * len(pages)
+    data_offset = terms_offset + TERM_ENTRY.size * len(terms)
+
+    data = bytearray()
+    page_table = bytearray()
+    for text, lines, _, _ in pages:
+        text_bytes = text.encode("utf-8")
+        layout_bytes = json.dumps(lines, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        text_offset = data_offset + len(data)
+        data += text_bytes
+        layout_offset = data_offset + len(data)
+        data += layout_bytes
+        page_table += PAGE_ENTRY.pack(text_offset, len(text_bytes), layout_offset, len(layout_bytes))
+
+    term_table = bytearray()
+    for term, entries in terms:
+        term_offset = data_offset + len(data)
+        data += term
+        posting_offset = data_offset + len(data)
+        for number, count in entries:
+            data += POSTING.pack(number, count)
+        term_table += TERM_ENTRY.pack(term_offset, len(term), posting_offset, len(entries))
+
+    header = HEADER.pack(MAGIC, VERSION, len(pages), len(terms), meta_offset, pages_offset, terms_offset, data_offset)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(header + meta + page_table + term_table + data)
+    os.replace(tmp, path)
+
+
+class DocumentIndex:
+    """Read-only view of one index file through mmap."""
+
+    def __init__(self, document_id, path):
+        self.document_id = document_id
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.page_count, self.term_count,
+         meta_offset, self._pages_offset, self._terms_offset, _) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"Not a document index: {path}")
+        meta = json.loads(self._map[meta_offset:self._pages_offset])
+        self.name = meta.get("name")
+        self.page_sizes = meta["pages"]
+
+    def _page_entry(self, number):
+        if not 0 <= number < self.page_count:
+            raise IndexError(number)
+        return PAGE_ENTRY.unpack_from(self._map, self._pages_offset + number * PAGE_ENTRY.size)
+
+    def page_text(self, number):
+        """Text of a page, numbered from 0"""
+        text_offset, text_length, _, _ = self._page_entry(number)
+        return self._map[text_offset:text_offset + text_length].decode("utf-8")
+
+    def page_layout(self, number):
+        """[[x, y, size, text]] lines of a page, numbered from 0"""
+        _, _, layout_offset, layout_length = self._page_entry(number)
+        return json.loads(self._map[layout_offset:layout_offset + layout_length])
+
+    def _term(self, index):
+        return TERM_ENTRY.unpack_from(self._map, self._terms_offset + index * TERM_ENTRY.size)
+
+    def _postings(self, term):
+        """[(page, count)] for a term, by binary search over the sorted term table"""
+        key = term.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            term_offset, term_length, posting_offset, count = self._term(middle)
+            found = self._map[term_offset:term_offset + term_length]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return [POSTING.unpack_from(self._map, posting_offset + i * POSTING.size) for i in range(count)]
+        return []
+
+    def search(self, query, limit=10, snippet_chars=160):
+        """Pages containing every term of query, best tf-idf score first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            postings = self._postings(term)
+            idf = math.log(1 + self.page_count / (1 + len(postings)))
+            term_scores = {page: count * idf for page, count in postings}
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {page: score + term_scores[page] for page, score in scores.items() if page in term_scores}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [
+            {"page": page + 1, "score": round(score, 3), "snippet": self._snippet(page, terms, snippet_chars)}
+            for page, score in ranked
+        ]
+
+    def _snippet(self, page, terms, length):
+        text = _WHITESPACE.sub(" ", self.page_text(page))
+        match = re.search("|".join(re.escape(term) for term in terms), text, re.IGNORECASE)
+        start = max((match.start() if match else 0) - length // 3, 0)
+        return text[start:start + length].strip()
+
+    def context(self, number, max_chars=4000):
+        """Compact text of a page for the model: whitespace collapsed, truncated"""
+        text = _WHITESPACE.sub(" ", self.page_text(number)).strip()
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(" ", 1)[0] + " …"
+        return text
+
+    def close(self):
+        self._map.close()
+
+    def info(self):
+        return {"document_id": self.document_id, "name": self.name, "pages": self.page_count, "terms": self.term_count}
+
+
+class DocumentStore:
+    """Index files by document id under directory, with a few kept open."""
+
+    def __init__(self, directory, max_open=32):
+        self.directory = Path(directory)
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        self.built = 0
+        self.reused = 0
+
+    def path(self, doc_id):
+        if not _DOCUMENT_ID.match(doc_id or ""):
+            raise KeyError(doc_id)
+        return self.directory / f"{doc_id}.idx"
+
+    def build(self, data, name=None):
+        """Indexes a PDF unless it already is; returns its DocumentIndex. Blocking; run in a thread."""
+        doc_id = document_id(data)
+        if self.path(doc_id).exists():
+            self.reused += 1
+        else:
+            write_index(self.path(doc_id), extract_pages(data), name)
+            self.built += 1
+        return self.get(doc_id)
+
+    def get(self, doc_id):
+        """The open index for doc_id; raises KeyError if it hasn't been built"""
+        with self._lock:
+            index = self._open.get(doc_id)
+            if index is not None:
+                self._open.move_to_end(doc_id)
+                return index
+            path = self.path(doc_id)
+            if not path.exists():
+                raise KeyError(doc_id)
+            index = self._open[doc_id] = DocumentIndex(doc_id, path)
+            while len(self._open) > self.max_open:
+                # Readers may still hold it; its map is closed with the last reference
+                self._open.popitem(last=False)
+            return index
+
+    def close(self):
+        with self._lock:
+            for index in self._open.values():
+                index.close()
+            self._open.clear()
+
+    def stats(self):
+        return {"open": len(self._open), "built": self.built, "reused": self.reused, "directory": str(self.directory)}
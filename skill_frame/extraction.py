@@ -0,0 +1,185 @@
+"""
+Single-pass field extraction for malformed LLM JSON.
+
+``extract_fields`` walks the response once: one compiled pattern finds every
+quoted key followed by ':' and the value of each requested key is read the
+first time it appears. Values may be quoted strings (double or single
+quotes, backslash escapes), arrays of quoted strings or bare text up to the
+next ',', '}' or newline. A quote only closes a string when it is followed
+by a delimiter, so unescaped inner quotes and apostrophes don't cut values
+short, and unterminated strings stop at the next delimiter instead of
+swallowing the rest of the response.
+
+This replaces running three regexes per field plus more for
+success_criteria; see benchmarks/bench_extraction.py for the comparison.
+"""
+
+import json
+import re
+
+_KEY = re.compile(r"""(["'])([A-Za-z_][\w-]*)\1\s*:""")
+_WHITESPACE = re.compile(r"\s*")
+_BARE_VALUE = re.compile(r"[^,}\n]*")
+_BARE_ITEM = re.compile(r"[^,\]}\n\"']*")
+_CLOSES_STRING = re.compile(r"[ \t\r]*(?:[,}\]:\n]|$)|[ \t\r]+[\"']")
+_UNTERMINATED_END = re.compile(r"[,}\n]")
+_HAS_WORD = re.compile(r"\w")
+_NUMBERED = re.compile(r"\d+\.\s*([^\n]+)")
+_BULLETS = ("-", "*", "•")
+
+MAX_SUCCESS_CRITERIA = 10
+MIN_SUCCESS_CRITERIA = 3
+
+
+def _read_string(text, pos):
+    """
+    Reads a quoted value starting at text[pos].
+    Returns (value, end); end is the index after the closing quote.
+    """
+    quote = text[pos]
+    start = pos + 1
+    first_close = None
+    i = start
+    while True:
+        i = text.find(quote, i)
+        if i == -1:
+            break
+        # A quote preceded by an odd number of backslashes is escaped
+        j = i - 1
+        while j >= start and text[j] == "\\":
+            j -= 1
+        if (i - 1 - j) % 2 == 0:
+            if _CLOSES_STRING.match(text, i + 1):
+                return _unescape(text[start:i], quote), i + 1
+            if first_close is None:
+                first_close = i
+        i += 1
+
+    if first_close is not None:
+        return _unescape(text[start:first_close], quote), first_close + 1
+
+    # Unterminated: stop at the same boundary a bare value would
+    match = _UNTERMINATED_END.search(text, start)
+    end = match.start() if match else len(text)
+    return text[start:end], end
+
+
+def _unescape(raw, quote):
+    if "\\" not in raw:
+        return raw
+    if quote == '"':
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            pass
+    return raw.replace("\\" + quote, quote)
+
+
+def _read_array(text, pos):
+    """Reads the quoted items of an array starting at text[pos] == '['"""
+    items = []
+    n = len(text)
+    i = pos + 1
+    while i < n:
+        i = _WHITESPACE.match(text, i).end()
+        if i >= n:
+            break
+        ch = text[i]
+        if ch == "]" or ch == "}":
+            return items, i + 1
+        if ch == ",":
+            i += 1
+        elif ch == '"' or ch == "'":
+            value, end = _read_string(text, i)
+            # A quoted token followed by ':' is the next key; the array was never closed
+            after = _WHITESPACE.match(text, end).end()
+            if after < n and text[after] == ":":
+                return items, i
+            items.append(value)
+            i = end
+        else:
+            # Bare items are ignored, like the old item patterns did
+            i = _BARE_ITEM.match(text, i).end()
+            if i < n and text[i] == "\n":
+                i += 1
+    return items, n
+
+
+def extract_fields(text, string_fields, array_fields=()):
+    """
+    Extracts string and array fields from possibly malformed JSON text in one pass.
+    Keys match case-insensitively; the first occurrence of a key wins.
+    Returns {field: str} for string fields and {field: [str, ...]} for array fields.
+    """
+    wanted = {field.lower(): field for field in string_fields}
+    wanted_arrays = {field.lower(): field for field in array_fields}
+    remaining = len(wanted) + len(wanted_arrays)
+    found = {}
+    n = len(text)
+    pos = 0
+    for match in _KEY.finditer(text):
+        # Skip key-like text inside a value that was already read
+        if match.start() < pos:
+            continue
+        key = match.group(2).lower()
+        field = wanted.get(key) or wanted_arrays.get(key)
+        if field is None or field in found:
+            continue
+
+        start = _WHITESPACE.match(text, match.end()).end()
+        if start >= n:
+            break
+        ch = text[start]
+        if key in wanted_arrays:
+            if ch != "[":
+                continue
+            items, pos = _read_array(text, start)
+            found[field] = [item.strip() for item in items if _HAS_WORD.search(item)]
+        elif ch == '"' or ch == "'":
+            value, pos = _read_string(text, start)
+            found[field] = value.strip().strip("\"'")
+        else:
+            pos = _BARE_VALUE.match(text, start).end()
+            found[field] = text[start:pos].strip().strip("\"'")
+
+        remaining -= 1
+        if not remaining:
+            break
+    return found
+
+
+def extract_success_criteria(response_text, array_items=None):
+    """
+    Extracts success_criteria, starting from the array items found by
+    extract_fields (if any) and falling back to bullet and numbered lines.
+    """
+    success_criteria = list(array_items or [])
+    if len(success_criteria) >= MIN_SUCCESS_CRITERIA:
+        return success_criteria
+
+    # Look for success criteria as individual lines or bullet points
+    criteria_section = False
+    for line in response_text.split("\n"):
+        line = line.strip()
+        if criteria_section or "success_criteria" in line.lower():
+            criteria_section = True
+            if line.startswith(_BULLETS):
+                criterion = line.lstrip("-*•").strip().strip("\"'")
+                if len(criterion) > 5:  # Avoid very short items
+                    success_criteria.append(criterion)
+            elif line.startswith('"') and line.endswith('"'):
+                criterion = line.strip('"')
+                if len(criterion) > 5:
+                    success_criteria.append(criterion)
+            elif "]" in line or "}" in line:
+                criteria_section = False
+
+    # Look for numbered lists
+    if not success_criteria:
+        success_criteria = [
+            match.strip().strip("\"'.,")
+            for match in _NUMBERED.findall(response_text)
+            if len(match.strip()) > 10
+        ]
+
+    return success_criteria[:MAX_SUCCESS_CRITERIA]
@@ -0,0 +1,206 @@
+"""
+Flow control for the websocket <-> LiveRequestQueue bridge.
+
+Each direction of a session gets a ``FlowChannel``: a bounded queue whose
+drop policy depends on the mime type. Video frames are droppable and a new
+frame replaces a pending one, so the model always gets the freshest frame;
+audio, text and control messages are never dropped and instead make the
+producer wait, which pushes back on the client (upstream) or on the agent
+stream (downstream) of that session only.
+
+Channels record queue depth, drops and enqueue-to-dequeue lag, collected
+per session in a ``FlowRegistry``. ``PendingRequests`` counts what the
+upstream forwarder has sent that the model hasn't taken, so the forwarder
+stops while the model connection falls behind.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+BLOCK = "block"
+DROP_STALE = "drop_stale"
+
+DEFAULT_POLICIES = {
+    "image/jpeg": DROP_STALE,
+}
+
+# Weight of the newest sample in the lag moving average
+LAG_EWMA_ALPHA = 0.2
+
+
+class FlowChannel:
+    """Bounded queue with per-mime drop policies and lag metrics."""
+
+    def __init__(self, name, maxsize=64, policies=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.policies = DEFAULT_POLICIES if policies is None else policies
+        self._items = deque()
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = {}
+        self.max_depth = 0
+        self.lag_avg = 0.0
+        self.lag_max = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _policy(self, mime_type):
+        return self.policies.get(mime_type, BLOCK)
+
+    def _drop(self, index):
+        mime_type = self._items[index][0]
+        del self._items[index]
+        self.dropped[mime_type] = self.dropped.get(mime_type, 0) + 1
+
+    def _find(self, mime_type=None):
+        """Index of the oldest droppable item (of mime_type, if given), or -1"""
+        for index, (queued_mime, _, _) in enumerate(self._items):
+            if mime_type is None:
+                if self._policy(queued_mime) == DROP_STALE:
+                    return index
+            elif queued_mime == mime_type:
+                return index
+        return -1
+
+    async def put(self, mime_type, item):
+        """
+        Enqueues an item. Droppable items replace a pending item of the same
+        mime type, or are dropped when the channel is full; everything else
+        evicts a droppable item or waits for space.
+        Returns False if the item was dropped.
+        """
+        async with self._changed:
+            if self._policy(mime_type) == DROP_STALE:
+                stale = self._find(mime_type)
+                if stale != -1:
+                    self._drop(stale)
+                elif len(self._items) >= self.maxsize:
+                    self.dropped[mime_type] = self.dropped.get(mime_type, 0) + 1
+                    return False
+            else:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    droppable = self._find()
+                    if droppable != -1:
+                        self._drop(droppable)
+                        break
+                    await self._changed.wait()
+            if self._closed:
+                return False
+            self._items.append((mime_type, item, time.monotonic()))
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._changed.notify_all()
+            return True
+
+    async def get(self):
+        """Returns (mime_type, item); raises ChannelClosed once closed and drained"""
+        async with self._changed:
+            while not self._items:
+                if self._closed:
+                    raise ChannelClosed(self.name)
+                await self._changed.wait()
+            mime_type, item, enqueued_at = self._items.popleft()
+            self.dequeued += 1
+            lag = time.monotonic() - enqueued_at
+            self.lag_avg += LAG_EWMA_ALPHA * (lag - self.lag_avg)
+            self.lag_max = max(self.lag_max, lag)
+            self._changed.notify_all()
+            return mime_type, item
+
+    async def close(self):
+        """Wakes every waiter; pending items can still be drained with get()"""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def stats(self):
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "dropped": dict(self.dropped),
+            "lag_avg_ms": round(self.lag_avg * 1000, 2),
+            "lag_max_ms": round(self.lag_max * 1000, 2),
+        }
+
+
+class ChannelClosed(Exception):
+    """Raised by FlowChannel.get after the channel is closed and drained."""
+
+
+class PendingRequests:
+    """
+    Requests the bridge sent to a LiveRequestQueue that the model connection
+    hasn't taken yet. The runner takes them through the queue's get(), which
+    this wraps, so it must be installed (``PendingRequests.of``) before the
+    runner starts reading.
+    """
+
+    def __init__(self, live_request_queue):
+        get = getattr(live_request_queue, "get", None)
+        if get is None:
+            raise TypeError(f"{type(live_request_queue).__name__} has no get(); can't track pending requests")
+        self.pending = 0
+        self._taken = asyncio.Event()
+
+        async def tracked_get():
+            request = await get()
+            # Requests sent around the bridge (e.g. close) aren't counted
+            self.pending = max(self.pending - 1, 0)
+            self._taken.set()
+            return request
+
+        tracked_get.pending_requests = self
+        live_request_queue.get = tracked_get
+
+    @classmethod
+    def of(cls, live_request_queue):
+        """The tracker for live_request_queue, installed on first use"""
+        tracker = getattr(getattr(live_request_queue, "get", None), "pending_requests", None)
+        return tracker if tracker is not None else cls(live_request_queue)
+
+    def sent(self):
+        self.pending += 1
+
+    async def wait(self, limit):
+        """Waits while `limit` or more requests are pending, i.e. while the model isn't keeping up"""
+        while self.pending >= limit:
+            self._taken.clear()
+            await self._taken.wait()
+
+
+class FlowRegistry:
+    """Per-session upstream/downstream channels, for metrics."""
+
+    def __init__(self):
+        self._sessions = {}
+
+    def open(self, session_id, upstream_size=32, downstream_size=64, policies=None):
+        """Creates the channel pair for a session"""
+        channels = (
+            FlowChannel("upstream", upstream_size, policies),
+            FlowChannel("downstream", downstream_size, policies),
+        )
+        self._sessions[session_id] = channels
+        return channels
+
+    def close(self, session_id, channels=None):
+        """
+        Forgets a session's channels; with channels given, only if they are
+        still the registered ones, so a reconnect's channels are kept.
+        """
+        if channels is None or self._sessions.get(session_id) is channels:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        return {
+            session_id: {"upstream": upstream.stats(), "downstream": downstream.stats()}
+            for session_id, (upstream, downstream) in self._sessions.items()
+        }
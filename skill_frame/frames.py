@@ -0,0 +1,126 @@
+"""
+Near-duplicate filtering and adaptive rate for image/jpeg uploads.
+
+Screen-share content is mostly static, so forwarding every 1 fps frame to
+the model wastes bandwidth and input tokens. ``FrameFilter`` reduces each
+frame to a tiny grayscale thumbnail (Pillow's JPEG draft mode decodes at
+1/8 scale, so this is cheap) and compares it with the last forwarded frame.
+Frames that barely changed are dropped; frames that did change are
+forwarded no more often than an interval that shrinks while the content is
+busy and grows while it is calm. A keepalive frame is still forwarded every
+``keepalive`` seconds so the model's view never goes stale.
+
+Without Pillow, frames are compared by content hash, which still drops
+exact duplicates.
+"""
+
+import hashlib
+import io
+import time
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional
+    Image = None
+
+THUMBNAIL_SIZE = (16, 12)
+
+# Weight of the newest change score in the activity moving average
+ACTIVITY_EWMA_ALPHA = 0.3
+
+
+def frame_signature(jpeg_bytes):
+    """
+    Returns a comparable signature: ("thumbnail", grayscale pixels) or
+    ("hash", digest) when Pillow isn't installed or the frame can't be decoded.
+    """
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(jpeg_bytes)) as image:
+                image.draft("L", (THUMBNAIL_SIZE[0] * 8, THUMBNAIL_SIZE[1] * 8))
+                return ("thumbnail", image.convert("L").resize(THUMBNAIL_SIZE).tobytes())
+        except (OSError, ValueError):
+            pass
+    return ("hash", hashlib.blake2b(jpeg_bytes, digest_size=16).digest())
+
+
+def frame_difference(previous, current):
+    """0.0 for identical frames up to 1.0 for completely different ones"""
+    if previous is None:
+        return 1.0
+    if previous[0] != "thumbnail" or current[0] != "thumbnail":
+        # Hashes only tell equal from different
+        return 0.0 if previous == current else 1.0
+    pixels = current[1]
+    return sum(abs(a - b) for a, b in zip(previous[1], pixels)) / (255.0 * len(pixels))
+
+
+class _SourceState:
+    __slots__ = ("signature", "last_forward", "activity")
+
+    def __init__(self):
+        self.signature = None
+        self.last_forward = float("-inf")
+        self.activity = 1.0
+
+
+class FrameFilter:
+    """Per-session image/jpeg filter; tracks state separately per source (camera/screen)."""
+
+    def __init__(
+        self, threshold=0.02, min_interval=1.0, max_interval=5.0, keepalive=15.0, busy_activity=0.1, jitter=0.2
+    ):
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.keepalive = keepalive
+        self.busy_activity = busy_activity
+        # Frames captured at min_interval arrive a little early or late
+        self.jitter = jitter
+        self._sources = {}
+        self.received = 0
+        self.forwarded = 0
+        self.dropped_duplicate = 0
+        self.dropped_rate = 0
+
+    def interval(self, source="unknown"):
+        """Current minimum time between forwarded frames for a source"""
+        state = self._sources.get(source)
+        activity = state.activity if state else 1.0
+        calm = 1.0 - min(activity / self.busy_activity, 1.0)
+        return self.min_interval + (self.max_interval - self.min_interval) * calm
+
+    def accept(self, jpeg_bytes, source="unknown", now=None):
+        """Returns True if the frame should be forwarded to the model"""
+        now = time.monotonic() if now is None else now
+        self.received += 1
+        state = self._sources.get(source)
+        if state is None:
+            state = self._sources[source] = _SourceState()
+
+        signature = frame_signature(jpeg_bytes)
+        difference = frame_difference(state.signature, signature)
+        state.activity += ACTIVITY_EWMA_ALPHA * (difference - state.activity)
+        elapsed = now - state.last_forward
+
+        if elapsed < self.keepalive:
+            if difference < self.threshold:
+                self.dropped_duplicate += 1
+                return False
+            if elapsed < self.interval(source) - self.jitter:
+                self.dropped_rate += 1
+                return False
+
+        state.signature = signature
+        state.last_forward = now
+        self.forwarded += 1
+        return True
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "forwarded": self.forwarded,
+            "dropped_duplicate": self.dropped_duplicate,
+            "dropped_rate": self.dropped_rate,
+            "interval_s": {source: round(self.interval(source), 2) for source in self._sources},
+        }
@@ -0,0 +1,128 @@
+"""
+Binary websocket framing for the /ws/{session_id} bridge.
+
+A binary frame is a fixed 8-byte header followed by the raw payload:
+
+    byte 0     protocol version
+    byte 1     mime type code (see MIME_CODES)
+    byte 2     source code (see SOURCE_CODES), 0 when unknown
+    byte 3     audio/pcm sample rate code (see SAMPLE_RATE_CODES), 0 when
+               unknown (the model's 16 kHz is assumed); 0 for other types
+    bytes 4-7  sequence number, unsigned big-endian
+
+Text messages and control messages (turn_complete, interrupted) stay on the
+JSON text framing, so old clients keep working unchanged. Its media messages
+carry base64 data; ``encode_audio_message`` and ``decode_text_message``
+convert them and may run in the offload pool.
+"""
+
+import base64
+import json
+import struct
+import time
+
+from .metrics import BASE64_DECODE, BASE64_ENCODE, JSON_DECODE, JSON_ENCODE
+
+PROTOCOL_VERSION = 1
+
+HEADER = struct.Struct(">BBBBI")
+HEADER_SIZE = HEADER.size
+
+MIME_CODES = {
+    "audio/pcm": 1,
+    "image/jpeg": 2,
+    # Server to client only, when negotiated (see audio_out.py)
+    "audio/opus": 3,
+}
+MIME_TYPES = {code: mime_type for mime_type, code in MIME_CODES.items()}
+
+SOURCE_CODES = {
+    "unknown": 0,
+    "camera": 1,
+    "screen": 2,
+}
+SOURCES = {code: source for source, code in SOURCE_CODES.items()}
+
+SAMPLE_RATE_CODES = {
+    8000: 1,
+    11025: 2,
+    12000: 3,
+    16000: 4,
+    22050: 5,
+    24000: 6,
+    32000: 7,
+    44100: 8,
+    48000: 9,
+}
+SAMPLE_RATES = {code: rate for rate, code in SAMPLE_RATE_CODES.items()}
+
+# Sent as a JSON text frame right after accept() when the client asked for
+# binary framing, so the client knows it can switch.
+HELLO_MESSAGE = {
+    "mime_type": "application/x-skill-frame-protocol",
+    "binary": True,
+    "version": PROTOCOL_VERSION,
+}
+
+
+class FrameError(ValueError):
+    """Raised when a binary frame cannot be decoded."""
+
+
+def encode_frame(mime_type, payload, seq=0, source="unknown", sample_rate=None):
+    """Encodes a payload with the binary frame header"""
+    try:
+        mime_code = MIME_CODES[mime_type]
+    except KeyError:
+        raise FrameError(f"Mime type not supported in binary frames: {mime_type}")
+    source_code = SOURCE_CODES.get(source, 0)
+    rate_code = SAMPLE_RATE_CODES.get(sample_rate, 0)
+    return HEADER.pack(PROTOCOL_VERSION, mime_code, source_code, rate_code, seq & 0xFFFFFFFF) + bytes(payload)
+
+
+def decode_frame(frame):
+    """
+    Decodes a binary frame.
+    Returns (mime_type, seq, metadata, payload) where payload is a memoryview
+    into the frame, so no copy is made until the caller needs one.
+    """
+    if len(frame) < HEADER_SIZE:
+        raise FrameError(f"Binary frame too short: {len(frame)} bytes")
+    version, mime_code, source_code, rate_code, seq = HEADER.unpack_from(frame)
+    if version != PROTOCOL_VERSION:
+        raise FrameError(f"Unsupported binary frame version: {version}")
+    mime_type = MIME_TYPES.get(mime_code)
+    if mime_type is None:
+        raise FrameError(f"Unknown mime type code: {mime_code}")
+    metadata = {"source": SOURCES.get(source_code, "unknown")}
+    if rate_code:
+        if rate_code not in SAMPLE_RATES:
+            raise FrameError(f"Unknown sample rate code: {rate_code}")
+        metadata["sample_rate"] = SAMPLE_RATES[rate_code]
+    return mime_type, seq, metadata, memoryview(frame)[HEADER_SIZE:]
+
+
+def encode_audio_message(audio_data):
+    """The JSON text frame for agent audio, base64 encoded"""
+    started = time.perf_counter()
+    encoded = base64.b64encode(audio_data).decode("ascii")
+    encoded_at = time.perf_counter()
+    payload = json.dumps({"mime_type": "audio/pcm", "data": encoded})
+    BASE64_ENCODE.observe(encoded_at - started)
+    JSON_ENCODE.observe(time.perf_counter() - encoded_at)
+    return payload
+
+
+def decode_text_message(text):
+    """Parses a JSON client message into (mime_type, data, metadata), base64 decoding media"""
+    started = time.perf_counter()
+    message = json.loads(text)
+    JSON_DECODE.observe(time.perf_counter() - started)
+    mime_type = message["mime_type"]
+    data = message["data"]
+    metadata = message.get("metadata", {})
+    if mime_type in ("audio/pcm", "image/jpeg"):
+        started = time.perf_counter()
+        data = base64.b64decode(data)
+        BASE64_DECODE.observe(time.perf_counter() - started)
+    return mime_type, data, metadata
@@ -0,0 +1,318 @@
+"""
+One-shot (non-live) role-play scenario generation.
+
+POST /roleplay only needs a single JSON document, so instead of opening a
+bidirectional live session it sends one generate_content request with a
+JSON response schema derived from SCENARIO_SCHEMA. ScenarioEngine bounds how
+many requests run at once, which also makes batches of prompts safe to fan
+out. FakeScenarioModel stands in for the real model in offline tests and
+benchmarks.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import time
+
+from .incremental import IncrementalObjectParser
+from .logs import ROLEPLAY, get_logger, summarize
+from .metrics import ROLEPLAY_SECONDS
+
+log = get_logger(ROLEPLAY)
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+SCENARIO_PROMPT = """
+        Create a detailed Learning-style role play scenario based on this request: \"{prompt}\"
+
+        IMPORTANT: Respond ONLY with a valid JSON object as described below. Do not include markdown, code blocks, or any text before or after the JSON.
+
+        All array elements (like \"success_criteria\") must be valid, double-quoted strings on a single line. Do not break strings across lines. Ensure the JSON is valid and minified (no unnecessary whitespace or line breaks inside strings).
+
+        Use this format:
+        {{
+            "title": "A professional title for the scenario",
+            "author": "AI Learning Coach",
+            "description": "A detailed 2-3 sentence description of the scenario context and objectives",
+            "success_criteria": ["criterion 1", "criterion 2", "criterion 3", "criterion 4", "criterion 5"],
+            "user_name": "You",
+            "user_role": "A specific professional role relevant to the scenario",
+            "user_avatar": "👤",
+            "ai_name": "A realistic name for the AI character",
+            "ai_role": "The role the AI will play",
+            "ai_avatar": "An appropriate emoji like 🧑‍💼 or 👩‍💻",
+            "ai_description": "2-3 sentences describing the AI character's personality and approach",
+            "chat_prompt": "A detailed prompt to initialize the role play conversation with context and opening"
+        }}
+
+        Make it realistic, professional, and engaging for workplace skill development.
+
+        Response format: Respond ONLY with a valid JSON object as described above.
+        """
+
+
+def build_scenario_prompt(prompt):
+    """Returns the scenario generation instruction for a learner prompt"""
+    return SCENARIO_PROMPT.format(prompt=prompt)
+
+
+def clean_llm_response(text):
+    """Strips whitespace and markdown code fences around an LLM JSON response"""
+    cleaned = text.strip()
+    if cleaned.startswith('```json'):
+        cleaned = cleaned[len('```json'):].strip()
+    if cleaned.startswith('```'):
+        cleaned = cleaned[len('```'):].strip()
+    if cleaned.endswith('```'):
+        cleaned = cleaned[:-3].strip()
+    return cleaned
+
+
+def response_schema(schema):
+    """
+    Converts a JSON schema into the OpenAPI subset accepted as a Gemini
+    response_schema (type, properties, items, required).
+    """
+    converted = {"type": schema["type"].upper()}
+    if "properties" in schema:
+        converted["properties"] = {
+            name: response_schema(prop) for name, prop in schema["properties"].items()
+        }
+        # Keep the model's output in the same key order as the schema
+        converted["property_ordering"] = list(schema["properties"])
+    if "items" in schema:
+        converted["items"] = response_schema(schema["items"])
+    if "required" in schema:
+        converted["required"] = list(schema["required"])
+    return converted
+
+
+class GenaiScenarioModel:
+    """Generates scenario JSON with a single non-streaming Gemini request."""
+
+    def __init__(self, schema, model=None, client=None):
+        self.model = model or os.environ.get("SCENARIO_MODEL", DEFAULT_MODEL)
+        self.schema = response_schema(schema)
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client()
+        return self._client
+
+    async def generate(self, text):
+        from google.genai.types import GenerateContentConfig
+
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=text,
+            config=GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=self.schema,
+            ),
+        )
+        return response.text or ""
+
+    async def generate_stream(self, text):
+        """Yields the response text in chunks as the model produces it"""
+        from google.genai.types import GenerateContentConfig
+
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=text,
+            config=GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=self.schema,
+            ),
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeScenarioModel:
+    """Offline stand-in for GenaiScenarioModel with configurable latency."""
+
+    def __init__(self, latency=0.0, responses=None, chunk_size=32):
+        self.latency = latency
+        self.responses = list(responses or [])
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    async def generate(self, text):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._response(text)
+
+    async def generate_stream(self, text):
+        """Yields the response in chunk_size pieces, spreading latency across them"""
+        self.calls += 1
+        response = self._response(text)
+        chunks = [response[i:i + self.chunk_size] for i in range(0, len(response), self.chunk_size)]
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+    def _response(self, text):
+        if self.responses:
+            return self.responses[(self.calls - 1) % len(self.responses)]
+        topic = text.split('request: "', 1)[-1].split('"', 1)[0]
+        return json.dumps({
+            "title": f"Practice: {topic}",
+            "author": "AI Learning Coach",
+            "description": f"A practice conversation about {topic}.",
+            "success_criteria": [
+                "State the goal of the conversation",
+                "Ask clarifying questions",
+                "Agree on next steps",
+            ],
+            "user_name": "You",
+            "user_role": "Professional",
+            "user_avatar": "👤",
+            "ai_name": "Alex",
+            "ai_role": "Counterpart",
+            "ai_avatar": "🧑‍💼",
+            "ai_description": "Alex is direct and expects concise answers.",
+            "chat_prompt": f"Let's start a role play about: {topic}.",
+        })
+
+
+class IncompleteScenario(Exception):
+    """A scenario with fields filled from defaults; served, but never cached."""
+
+    def __init__(self, scenario, defaulted):
+        super().__init__(f"Scenario fields defaulted: {', '.join(defaulted)}")
+        self.scenario = scenario
+        self.defaulted = defaulted
+
+
+class ScenarioEngine:
+    """
+    Turns learner prompts into validated scenarios with a one-shot model.
+    parse(cleaned_text, prompt) is the repo's scenario parser and returns
+    (scenario, defaulted fields); fallback(prompt) builds a default scenario
+    when generation fails outright. Scenarios with defaulted fields, or from
+    an empty response, are returned but not cached. Large responses are
+    parsed through offload (an Offloader) if given.
+    """
+
+    def __init__(self, model, parse, fallback, concurrency=4, cache=None, offload=None):
+        self.model = model
+        self.parse = parse
+        self.fallback = fallback
+        self.cache = cache
+        self.offload = offload
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _parse(self, llm_response, prompt):
+        """The parsed scenario; raises instead of returning one the cache mustn't keep"""
+        text = clean_llm_response(llm_response)
+        if not text.strip():
+            # e.g. a safety block
+            raise ValueError("Empty model response")
+        if self.offload is None:
+            scenario, defaulted = self.parse(text, prompt)
+        else:
+            scenario, defaulted = await self.offload.run("parse", len(text), self.parse, text, prompt)
+        if defaulted:
+            raise IncompleteScenario(scenario, defaulted)
+        return scenario
+
+    async def generate(self, prompt):
+        """Generates one scenario, served from the cache when one is configured"""
+        try:
+            if self.cache is not None:
+                return await self.cache.get_or_create(prompt, lambda: self._generate(prompt))
+            return await self._generate(prompt)
+        except IncompleteScenario as e:
+            log.warning("Not caching scenario: %s", e)
+            # Coalesced requests share the exception
+            return copy.deepcopy(e.scenario)
+        except Exception as e:
+            log.error("Failed to generate scenario via LLM: %s", e)
+            return self.fallback(prompt)
+
+    async def _generate(self, prompt):
+        async with self._semaphore:
+            started = time.perf_counter()
+            llm_response = await self.model.generate(build_scenario_prompt(prompt))
+            ROLEPLAY_SECONDS.labels("llm").observe(time.perf_counter() - started)
+        log.debug("Raw response: %s", summarize(llm_response, 1000))
+        started = time.perf_counter()
+        scenario = await self._parse(llm_response, prompt)
+        ROLEPLAY_SECONDS.labels("parse").observe(time.perf_counter() - started)
+        return scenario
+
+    async def _generate_streamed(self, prompt, fields):
+        """_generate on the model's stream, putting (name, value) on fields as they complete"""
+        parser = IncrementalObjectParser()
+        # The semaphore covers the model stream only; fields is unbounded,
+        # so a slow reader never holds it
+        async with self._semaphore:
+            started = time.perf_counter()
+            async for chunk in self.model.generate_stream(build_scenario_prompt(prompt)):
+                for field in parser.feed(chunk):
+                    fields.put_nowait(field)
+            ROLEPLAY_SECONDS.labels("llm").observe(time.perf_counter() - started)
+        llm_response = parser.text()
+        log.debug("Raw response: %s", summarize(llm_response, 1000))
+        started = time.perf_counter()
+        scenario = await self._parse(llm_response, prompt)
+        ROLEPLAY_SECONDS.labels("parse").observe(time.perf_counter() - started)
+        return scenario
+
+    async def generate_stream(self, prompt):
+        """
+        Yields ("field", name, value) as top-level fields complete, then
+        ("scenario", scenario) with the fully parsed scenario. Shares the
+        cache and single-flight of generate: cached scenarios, and requests
+        coalesced onto one already generating, are replayed field by field.
+        """
+        fields = asyncio.Queue()
+        if self.cache is not None:
+            generation = self.cache.get_or_create(prompt, lambda: self._generate_streamed(prompt, fields))
+        else:
+            generation = self._generate_streamed(prompt, fields)
+        # Runs to the end even if the reader goes away, so the scenario is
+        # still cached and handed to coalesced requests
+        task = asyncio.ensure_future(generation)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        streamed = False
+        while True:
+            get = asyncio.ensure_future(fields.get())
+            try:
+                done, _ = await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not get.done():
+                    get.cancel()
+            if get not in done:
+                break
+            streamed = True
+            yield ("field", *get.result())
+        while not fields.empty():
+            yield ("field", *fields.get_nowait())
+
+        try:
+            scenario = task.result()
+        except IncompleteScenario as e:
+            log.warning("Not caching scenario: %s", e)
+            scenario = copy.deepcopy(e.scenario)
+        except Exception as e:
+            log.error("Failed to generate scenario via LLM: %s", e)
+            yield ("scenario", self.fallback(prompt))
+            return
+        if not streamed:
+            for name, value in scenario.items():
+                yield ("field", name, value)
+        yield ("scenario", scenario)
+
+    async def generate_many(self, prompts):
+        """Generates scenarios for many prompts, at most `concurrency` at a time"""
+        return await asyncio.gather(*(self.generate(prompt) for prompt in prompts))
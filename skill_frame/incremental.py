@@ -0,0 +1,118 @@
+"""
+Incremental parsing of a JSON object as LLM text chunks arrive.
+
+``IncrementalObjectParser.feed`` takes each partial text event and returns
+the top-level fields whose values became complete, so callers can forward
+the title and description before the rest of the object is generated.
+Chunks are kept in a list and joined once at the end, and only the
+unconsumed tail is buffered, so long responses don't cost quadratic string
+concatenation.
+
+Streaming output is best-effort: leading prose and code fences are skipped,
+and if the text stops looking like JSON the parser goes quiet. The full
+text from ``text()`` is still what the repo's robust parser sees at the end.
+"""
+
+import json
+
+_WHITESPACE = " \t\r\n"
+# A value can only become complete once one of these characters arrives
+_TERMINATORS = frozenset('"]},')
+
+_decoder = json.JSONDecoder()
+
+
+class IncrementalObjectParser:
+    """Emits (field, value) pairs of a streamed top-level JSON object."""
+
+    def __init__(self, fields=None):
+        self.fields = set(fields) if fields is not None else None
+        self.failed = False
+        self._chunks = []
+        self._buffer = ""
+        self._started = False
+        self._done = False
+        self._key = None
+
+    def feed(self, chunk):
+        """Adds a text chunk and returns the list of newly completed (field, value) pairs"""
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+        if self.failed or self._done:
+            return []
+        self._buffer += chunk
+        # Nothing can complete unless the chunk could end a value (or starts the object)
+        if self._started and not _TERMINATORS.intersection(chunk):
+            return []
+        return self._scan()
+
+    def text(self):
+        """The full text fed so far"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def _scan(self):
+        completed = []
+        buf = self._buffer
+        pos = 0
+        n = len(buf)
+
+        if not self._started:
+            start = buf.find("{")
+            if start == -1:
+                # Keep only what could still precede the object
+                self._buffer = ""
+                return completed
+            self._started = True
+            pos = start + 1
+
+        while True:
+            while pos < n and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= n:
+                break
+
+            if self._key is None:
+                ch = buf[pos]
+                if ch == ",":
+                    pos += 1
+                    continue
+                if ch == "}":
+                    self._done = True
+                    pos += 1
+                    break
+                if ch != '"':
+                    self.failed = True
+                    break
+                try:
+                    key, end = _decoder.raw_decode(buf, pos)
+                except ValueError:
+                    break  # key not complete yet
+                colon = end
+                while colon < n and buf[colon] in _WHITESPACE:
+                    colon += 1
+                if colon >= n:
+                    break
+                if buf[colon] != ":":
+                    self.failed = True
+                    break
+                self._key = key
+                pos = colon + 1
+                continue
+
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                break  # value not complete yet (or malformed; the final parse handles it)
+            # A bare number is only complete once something follows it
+            if end >= n and isinstance(value, (int, float)):
+                break
+            if self.fields is None or self._key in self.fields:
+                completed.append((self._key, value))
+            self._key = None
+            pos = end
+
+        self._buffer = buf[pos:]
+        return completed
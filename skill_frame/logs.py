@@ -0,0 +1,128 @@
+"""
+Logging for the streaming hot path.
+
+Records are handed to a QueueHandler and written by a QueueListener thread,
+so the asyncio loop never blocks on stdout. Each subsystem has its own
+logger and level, set from the environment:
+
+    LOG_LEVEL            default level for every subsystem (INFO)
+    LOG_LEVEL_WS         websocket bridge
+    LOG_LEVEL_ROLEPLAY   /roleplay generation
+    LOG_LEVEL_PARSER     LLM JSON parsing
+
+Pass payloads through ``summarize`` / ``summarize_event`` as logging args so
+they are only formatted (and truncated) when the record is actually emitted.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+WS = "skill_frame.ws"
+ROLEPLAY = "skill_frame.roleplay"
+PARSER = "skill_frame.parser"
+
+SUBSYSTEMS = {
+    WS: "LOG_LEVEL_WS",
+    ROLEPLAY: "LOG_LEVEL_ROLEPLAY",
+    PARSER: "LOG_LEVEL_PARSER",
+}
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+DEFAULT_LIMIT = 200
+
+_listener = None
+
+
+def configure_logging(stream=None):
+    """Installs the queue-backed handler and per-subsystem levels (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    default_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger("skill_frame")
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(default_level)
+    root.propagate = False
+
+    for name, env_var in SUBSYSTEMS.items():
+        logging.getLogger(name).setLevel(os.environ.get(env_var, default_level).upper())
+    return _listener
+
+
+def get_logger(name):
+    """Returns the logger for a subsystem"""
+    return logging.getLogger(name)
+
+
+class LazySummary:
+    """Lazy, truncated str() of a value for use as a logging argument."""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=DEFAULT_LIMIT):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text)} chars)"
+
+    __repr__ = __str__
+
+
+class LazyEventSummary:
+    """Lazy one-line summary of an ADK live event that never renders audio bytes."""
+
+    __slots__ = ("event", "limit")
+
+    def __init__(self, event, limit=DEFAULT_LIMIT):
+        self.event = event
+        self.limit = limit
+
+    def __str__(self):
+        event = self.event
+        fields = []
+        if getattr(event, "turn_complete", None):
+            fields.append("turn_complete")
+        if getattr(event, "interrupted", None):
+            fields.append("interrupted")
+        if getattr(event, "partial", None):
+            fields.append("partial")
+        content = getattr(event, "content", None)
+        for part in (content and content.parts) or ():
+            if part.inline_data:
+                size = len(part.inline_data.data or b"")
+                fields.append(f"{part.inline_data.mime_type}: {size} bytes")
+            elif part.text:
+                fields.append(f"text: {LazySummary(part.text, self.limit)}")
+        return f"Event({', '.join(fields)})"
+
+    __repr__ = __str__
+
+
+def summarize(value, limit=DEFAULT_LIMIT):
+    """Wraps a value so it is rendered truncated, and only if the record is emitted"""
+    return LazySummary(value, limit)
+
+
+def summarize_event(event, limit=DEFAULT_LIMIT):
+    """Wraps an ADK event so it is rendered as a short summary, and only if emitted"""
+    return LazyEventSummary(event, limit)
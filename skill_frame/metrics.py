@@ -0,0 +1,313 @@
+"""
+In-process metrics, rendered in the Prometheus text format at /metrics.
+
+Recording is a dict lookup and a locked addition (plus a bisect for
+histograms), with label children resolved once where the hot paths are, so
+there is nothing to pay for when no one scrapes. The lock makes children
+safe to update from the offload threads. Values that already live elsewhere
+(pool sizes, RSS, event-loop lag) are read by collectors only when
+``render()`` runs.
+"""
+
+import asyncio
+import bisect
+import collections
+import math
+import threading
+import time
+
+CODEC_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05)
+OFFLOAD_BUCKETS = (1e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Children are updated from offload threads too, and += isn't atomic
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        """The child for these label values; keep it around on hot paths"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield self.name, _format_labels(self.label_names, values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.label_names, values, ("le", _format_value(float(bound)))),
+                    cumulative,
+                )
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, child.count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def counter_values(self):
+        """{(counter name, label values): value} for every counter child"""
+        return {
+            (metric.name, values): child.value
+            for metric in self._metrics if isinstance(metric, Counter)
+            for values, child in list(metric._children.items())
+        }
+
+    def add_counts(self, counts):
+        """Adds counter_values()-style increments, e.g. made in a worker process"""
+        metrics = {metric.name: metric for metric in self._metrics if isinstance(metric, Counter)}
+        for (name, values), amount in counts.items():
+            if name in metrics:
+                metrics[name].labels(*values).inc(amount)
+
+    def collector(self, collect):
+        """Registers collect(), which returns gauges as [(name, documentation, {labels: value})]"""
+        self._collectors.append(collect)
+        return collect
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collect in self._collectors:
+            for name, documentation, values in collect():
+                lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+                for labels, value in values.items():
+                    names = tuple(key for key, _ in labels)
+                    lines.append(f"{name}{_format_labels(names, [v for _, v in labels])} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+WS_SESSIONS = REGISTRY.gauge("skill_frame_ws_sessions", "Open websocket sessions", ["mode"])
+WS_MESSAGES = REGISTRY.counter(
+    "skill_frame_ws_messages_total", "Websocket messages by direction and mime type", ["direction", "mime_type"]
+)
+WS_BYTES = REGISTRY.counter(
+    "skill_frame_ws_bytes_total", "Websocket payload bytes by direction and mime type", ["direction", "mime_type"]
+)
+CODEC_SECONDS = REGISTRY.histogram(
+    "skill_frame_codec_seconds", "Time spent in JSON and base64 encoding/decoding", ["op"], CODEC_BUCKETS
+)
+ROLEPLAY_SECONDS = REGISTRY.histogram(
+    "skill_frame_roleplay_seconds", "Scenario generation time by phase", ["phase"], LATENCY_BUCKETS
+)
+PARSE_STRATEGY = REGISTRY.counter(
+    "skill_frame_parse_strategy_total", "Which parsing strategy produced the result", ["parser", "strategy"]
+)
+
+SESSION_SETUP_SECONDS = REGISTRY.histogram(
+    "skill_frame_session_setup_seconds",
+    "Time from websocket connect until the agent session runs, including admission",
+    ["prewarmed"],
+    LATENCY_BUCKETS,
+)
+FIRST_RESPONSE_SECONDS = REGISTRY.histogram(
+    "skill_frame_first_response_seconds",
+    "Time from a session's first client message to its first agent message",
+    ["prewarmed"],
+    LATENCY_BUCKETS,
+)
+
+OFFLOAD_SECONDS = REGISTRY.histogram(
+    "skill_frame_offload_seconds",
+    "CPU-heavy calls by op and where they ran (inline on the event loop or in a pool)",
+    ["op", "where"],
+    OFFLOAD_BUCKETS,
+)
+OFFLOAD_RECOVERED = REGISTRY.counter(
+    "skill_frame_offload_recovered_seconds_total", "Time offloaded calls ran in a pool instead of the event loop", ["op"]
+)
+
+
+class FirstResponseTimer:
+    """Observes, once, the time from the first request() to the first response() after it"""
+
+    __slots__ = ("histogram", "started", "done")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = None
+        self.done = False
+
+    def request(self):
+        if self.started is None:
+            self.started = time.perf_counter()
+
+    def response(self):
+        if self.started is not None and not self.done:
+            self.done = True
+            self.histogram.observe(time.perf_counter() - self.started)
+
+
+# Hot-path children, resolved once
+JSON_ENCODE = CODEC_SECONDS.labels("json_encode")
+JSON_DECODE = CODEC_SECONDS.labels("json_decode")
+BASE64_ENCODE = CODEC_SECONDS.labels("base64_encode")
+BASE64_DECODE = CODEC_SECONDS.labels("base64_decode")
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how late a periodic sleep wakes up."""
+
+    def __init__(self, interval=0.1, window=600):
+        self.interval = interval
+        self._samples = collections.deque(maxlen=window)
+        self._task = None
+        self.max_lag = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self):
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 2),
+            "p99_ms": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
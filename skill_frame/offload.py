@@ -0,0 +1,141 @@
+"""
+CPU-heavy steps, moved off the event loop when they are big enough to matter.
+
+Parsing an LLM response (json-repair, field extraction, schema validation),
+decoding a large base64 JSON frame, computing a video frame's signature or
+encoding agent audio to Opus runs synchronously, and inline every such call
+stalls the other sessions on the worker, audio included. ``Offloader.run``
+hands a call to a worker pool when its payload is at least the threshold set
+for its op, and runs it inline otherwise: for small payloads the pool hop
+costs more than the work.
+
+Pools (``OFFLOAD_POOL``):
+
+- ``thread`` (default): a dedicated thread pool. JPEG decoding, zlib and
+  libopus release the GIL; pure-Python parsing doesn't, but the loop still
+  gets the GIL every switch interval instead of waiting for the whole parse.
+- ``process``: ops in ``process_ops`` (parsing) run in worker processes, in
+  parallel with the loop. Their function must be importable by module name
+  from a module without import-time side effects (e.g. parsing.py, not
+  main.py, which every worker would import), and their counters are merged
+  back. Byte-heavy ops stay on threads, since copying their payload to a
+  process costs about as much as the work.
+- ``inline``: no offloading.
+
+Each call is timed in ``skill_frame_offload_seconds{op,where}``;
+``skill_frame_offload_recovered_seconds_total{op}`` adds up the time
+offloaded calls ran in a pool, i.e. the event-loop time recovered.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .metrics import OFFLOAD_RECOVERED, OFFLOAD_SECONDS, REGISTRY
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def _timed_counted(fn, *args):
+    """_timed in a worker process, plus the counters fn incremented there"""
+    before = REGISTRY.counter_values()
+    result, elapsed = _timed(fn, *args)
+    counts = {key: value - before.get(key, 0) for key, value in REGISTRY.counter_values().items()}
+    return result, elapsed, {key: value for key, value in counts.items() if value}
+
+
+class Offloader:
+    """
+    Runs calls inline or in a pool by payload size. thresholds maps op ->
+    minimum payload size to offload; ops without a threshold always run
+    inline.
+    """
+
+    def __init__(self, mode=THREAD, workers=None, thresholds=None, process_ops=("parse",)):
+        if mode not in (INLINE, THREAD, PROCESS):
+            raise ValueError(f"Unknown offload pool: {mode}")
+        self.mode = mode
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.thresholds = dict(thresholds or {})
+        self.process_ops = tuple(process_ops)
+        self._threads = None
+        self._processes = None
+        self._inline = {}
+        self._offloaded = {}
+
+    def _children(self, op, where):
+        cache = self._inline if where == INLINE else self._offloaded
+        children = cache.get(op)
+        if children is None:
+            children = cache[op] = (OFFLOAD_SECONDS.labels(op, where), OFFLOAD_RECOVERED.labels(op))
+        return children
+
+    def offloads(self, op, size):
+        threshold = self.thresholds.get(op)
+        return self.mode != INLINE and threshold is not None and size >= threshold
+
+    async def run(self, op, size, fn, *args):
+        """fn(*args), in a pool if size (e.g. payload bytes) reaches op's threshold"""
+        if not self.offloads(op, size):
+            seconds, _ = self._children(op, INLINE)
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                seconds.observe(time.perf_counter() - started)
+
+        loop = asyncio.get_running_loop()
+        if self.mode == PROCESS and op in self.process_ops:
+            where = PROCESS
+            result, elapsed, counts = await loop.run_in_executor(
+                self._process_pool(), functools.partial(_timed_counted, fn, *args)
+            )
+            REGISTRY.add_counts(counts)
+        else:
+            where = THREAD
+            result, elapsed = await loop.run_in_executor(
+                self._thread_pool(), functools.partial(_timed, fn, *args)
+            )
+        seconds, recovered = self._children(op, where)
+        seconds.observe(elapsed)
+        recovered.inc(elapsed)
+        return result
+
+    def _thread_pool(self):
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix="offload")
+        return self._threads
+
+    def _process_pool(self):
+        if self._processes is None:
+            # spawn: forking a process that runs threads and an event loop isn't safe
+            self._processes = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._processes
+
+    def close(self):
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+    def stats(self):
+        ops = {}
+        for where, cache in ((INLINE, self._inline), ("offloaded", self._offloaded)):
+            for op, (seconds, _) in cache.items():
+                entry = ops.setdefault(op, {"threshold": self.thresholds.get(op)})
+                entry[f"{where}_calls"] = entry.get(f"{where}_calls", 0) + seconds.count
+                entry[f"{where}_seconds"] = round(entry.get(f"{where}_seconds", 0) + seconds.sum, 4)
+        return {"mode": self.mode, "workers": self.workers, "ops": ops}
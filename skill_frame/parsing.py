@@ -0,0 +1,228 @@
+"""
+Parsing LLM responses into scenarios and analyses.
+
+A response is tried as JSON, then through json-repair, then field by field
+(see extraction.py), validating against the schema at each step; scenario
+fields that still fail fall back to defaults. Large responses are parsed
+through the offload pool, so this module is imported by worker processes
+and must stay free of import-time side effects.
+"""
+
+import json
+
+from json_repair import repair_json
+
+from .extraction import extract_fields, extract_success_criteria
+from .logs import PARSER, get_logger, summarize
+from .metrics import PARSE_STRATEGY
+from .validation import SchemaValidationError, SchemaValidator
+
+parser_log = get_logger(PARSER)
+
+# JSON Schema for scenario validation
+SCENARIO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "minLength": 1},
+        "author": {"type": "string", "minLength": 1},
+        "description": {"type": "string", "minLength": 1},
+        "success_criteria": {
+            "type": "array",
+            "items": {"type": "string", "minLength": 1},
+            "minItems": 3
+        },
+        "user_name": {"type": "string", "minLength": 1},
+        "user_role": {"type": "string", "minLength": 1},
+        "user_avatar": {"type": "string", "minLength": 1},
+        "ai_name": {"type": "string", "minLength": 1},
+        "ai_role": {"type": "string", "minLength": 1},
+        "ai_avatar": {"type": "string", "minLength": 1},
+        "ai_description": {"type": "string", "minLength": 1},
+        "chat_prompt": {"type": "string", "minLength": 1}
+    },
+    "required": ["title", "author", "description", "success_criteria", "user_name", "user_role", "user_avatar", "ai_name", "ai_role", "ai_avatar", "ai_description", "chat_prompt"]
+}
+
+# JSON Schema for the role-play analysis the frontend renders
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "strengths": {
+            "type": "array",
+            "items": {"type": "string", "minLength": 1},
+            "minItems": 1
+        },
+        "improvements": {
+            "type": "array",
+            "items": {"type": "string", "minLength": 1},
+            "minItems": 1
+        },
+        "detailed_feedback": {"type": "string", "minLength": 1}
+    },
+    "required": ["strengths", "improvements", "detailed_feedback"]
+}
+
+# Validators compiled once at import time
+SCENARIO_VALIDATOR = SchemaValidator(SCENARIO_SCHEMA)
+ANALYSIS_VALIDATOR = SchemaValidator(ANALYSIS_SCHEMA)
+
+# Scenario fields extracted as plain strings by the key-by-key fallback
+STRING_FIELDS = [field for field, prop in SCENARIO_SCHEMA["properties"].items() if prop["type"] == "string"]
+
+
+def default_scenario(prompt):
+    """Default scenario for a prompt, used when the LLM output is missing or unusable"""
+    return {
+        'title': f"Professional Role Play: {prompt}" if prompt else "Role Play Scenario",
+        'author': "AI Learning Coach",
+        'description': f"Practice this important workplace scenario: {prompt}. This exercise will help you develop key communication and professional skills.",
+        'success_criteria': [
+            "Communicate clearly and professionally",
+            "Listen actively and respond appropriately", 
+            "Maintain composure and confidence",
+            "Achieve your conversation objectives",
+            "Build positive rapport with the other party"
+        ],
+        'user_name': "You",
+        'user_role': "Professional",
+        'user_avatar': "👤",
+        'ai_name': "Alex",
+        'ai_role': "Role Play Partner",
+        'ai_avatar': "🧑‍💼",
+        'ai_description': f"Alex is an experienced professional who will help you practice: {prompt}. They provide realistic responses and constructive feedback.",
+        'chat_prompt': f"Let's start a role play about: {prompt}. I'll play the role of your conversation partner. Please set the scene and begin when you're ready."
+    }
+
+
+def repair_llm_json(response_text, validator, string_fields, array_fields=(), array_fallbacks=None, parser="scenario"):
+    """
+    Shared parsing strategies for LLM JSON: direct parsing, json-repair, then
+    single-pass extraction of only the fields that failed validation.
+    array_fallbacks maps an array field to fallback(response_text, items) for
+    lists the extractor couldn't read.
+    Returns (parsed, errors); parsed may be partial when errors is not empty.
+    The strategy that succeeded is counted under parser in /metrics.
+    """
+    parser_log.debug("Starting to parse response of length: %d", len(response_text))
+    
+    # Best partial parse so far and the fields it failed on
+    parsed_object = {}
+    failed_fields = validator.fields
+    
+    # Strategy 1: Try direct JSON parsing
+    try:
+        parsed = json.loads(response_text)
+        errors = validator.field_errors(parsed)
+        if not errors:
+            parser_log.info("Direct JSON parsing successful")
+            PARSE_STRATEGY.labels(parser, "direct").inc()
+            return parsed, errors
+        parser_log.debug("Direct parsing failed validation: %s", summarize(errors))
+        if isinstance(parsed, dict):
+            parsed_object, failed_fields = parsed, list(errors)
+    except json.JSONDecodeError as e:
+        parser_log.debug("Direct parsing failed: %s", summarize(e))
+    
+    # Strategy 2: Try json-repair library
+    if not parsed_object:
+        try:
+            parsed = json.loads(repair_json(response_text))
+            errors = validator.field_errors(parsed)
+            if not errors:
+                parser_log.info("JSON repair successful")
+                PARSE_STRATEGY.labels(parser, "repair").inc()
+                return parsed, errors
+            parser_log.debug("JSON repair failed validation: %s", summarize(errors))
+            if isinstance(parsed, dict):
+                parsed_object, failed_fields = parsed, list(errors)
+        except json.JSONDecodeError as e:
+            parser_log.debug("JSON repair failed: %s", summarize(e))
+    
+    # Strategy 3: Single-pass key-by-key extraction of the fields that failed
+    parser_log.debug("Attempting key-by-key extraction of %d fields", len(failed_fields))
+    for field in failed_fields:
+        parsed_object.pop(field, None)
+    extracted = extract_fields(
+        response_text,
+        [field for field in failed_fields if field in string_fields],
+        [field for field in failed_fields if field in array_fields],
+    )
+    for field, value in extracted.items():
+        parser_log.debug("Extracted %s: %s", field, summarize(value, 50))
+    
+    # Array fields get another chance from their fallback, e.g. bullet lists
+    for field, fallback in (array_fallbacks or {}).items():
+        if field in failed_fields:
+            items = fallback(response_text, extracted.pop(field, None))
+            if items:
+                extracted[field] = items
+                parser_log.debug("Extracted %s: %d items", field, len(items))
+    parsed_object.update(extracted)
+    errors = validator.field_errors(parsed_object)
+    if not errors:
+        PARSE_STRATEGY.labels(parser, "extract").inc()
+    return parsed_object, errors
+
+
+def parse_scenario_response(response_text, prompt):
+    """
+    Robust JSON parsing function that extracts fields individually and constructs a clean JSON object.
+    Uses multiple fallback strategies to handle malformed JSON responses; when a parse only
+    partly validates, only the fields that failed are re-extracted.
+    Returns (scenario, defaulted) where defaulted lists the fields filled in
+    from default_scenario because the response had no usable value for them.
+    """
+    scenario, errors = repair_llm_json(
+        response_text,
+        SCENARIO_VALIDATOR,
+        STRING_FIELDS,
+        ["success_criteria"],
+        # Special handling for success_criteria array - most problematic field
+        {"success_criteria": extract_success_criteria},
+    )
+    if not errors:
+        return scenario, []
+    
+    # Strategy 4: Fill missing or still-invalid fields with defaults based on prompt
+    PARSE_STRATEGY.labels("scenario", "defaults").inc()
+    default_values = default_scenario(prompt)
+    defaulted = []
+    for field in errors:
+        if field in default_values:
+            scenario[field] = default_values[field]
+            defaulted.append(field)
+            parser_log.debug("Using default for %s", field)
+    
+    # Final validation
+    errors = SCENARIO_VALIDATOR.field_errors(scenario)
+    if errors:
+        parser_log.error("Final validation failed: %s", summarize(errors))
+        # Return the constructed scenario anyway - it's better than nothing
+        return scenario, defaulted
+    parser_log.info("Key-by-key extraction with defaults successful")
+    return scenario, defaulted
+
+
+def parse_llm_json_response(response_text, prompt):
+    """parse_scenario_response without the list of defaulted fields"""
+    return parse_scenario_response(response_text, prompt)[0]
+
+
+def parse_llm_analysis_response(response_text):
+    """
+    Parses the role-play analysis with the same strategies as scenarios.
+    There are no sensible defaults for feedback, so an analysis that still
+    doesn't validate raises SchemaValidationError.
+    """
+    analysis, errors = repair_llm_json(
+        response_text,
+        ANALYSIS_VALIDATOR,
+        ["detailed_feedback"],
+        ["strengths", "improvements"],
+        parser="analysis",
+    )
+    if errors:
+        parser_log.error("Analysis validation failed: %s", summarize(errors))
+        PARSE_STRATEGY.labels("analysis", "failed").inc()
+        raise SchemaValidationError(errors)
+    return analysis
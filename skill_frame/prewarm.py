@@ -0,0 +1,252 @@
+"""
+Speculative live sessions, started before the client connects.
+
+Getting the pooled session, the runner and the upstream model connection
+ready used to start only when /ws/{session_id} connected, so the learner
+paid for it before the first reply. The role-play details page now asks for
+a session once the learner reaches for the Start button: ``PrewarmRegistry``
+starts it for that session id and opens the model connection by reading the
+agent stream in the background. The websocket claims it and starts with
+nothing left to set up; a session that isn't claimed within ``ttl`` is torn
+down.
+
+A pre-warmed session holds an upstream model connection, so it holds a
+slot in its own, small admission pool that counts against the live total.
+It never queues for one. The websocket that claims it takes the slot over as
+its live slot (``AdmissionController.transfer``), or queues like any other
+connection if its live pool is full.
+"""
+
+import asyncio
+import time
+
+from .logs import WS, get_logger
+from .metrics import REGISTRY
+
+log = get_logger(WS)
+
+PREWARM = REGISTRY.counter("skill_frame_prewarm_total", "Pre-warmed live sessions by outcome", ["outcome"])
+
+# Outcomes
+STARTED = "started"
+CLAIMED = "claimed"
+EXPIRED = "expired"
+DISCARDED = "discarded"
+MISMATCHED = "mismatched"
+FAILED = "failed"
+
+_END = object()
+
+
+class BufferedStream:
+    """
+    Reads an async iterator from a background task into a bounded queue,
+    so it starts (and opens its connection) before anyone iterates it.
+    """
+
+    def __init__(self, source, maxsize=64):
+        self._source = source
+        self._queue = asyncio.Queue(maxsize)
+        self._task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            async for item in self._source:
+                await self._queue.put((item, None))
+        except Exception as e:
+            await self._queue.put((_END, e))
+        else:
+            await self._queue.put((_END, None))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item, error = await self._queue.get()
+        if item is _END:
+            # Stay at the end for later reads
+            self._queue.put_nowait((item, None))
+            if error is not None:
+                raise error
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self, timeout=5.0):
+        self._task.cancel()
+        await asyncio.wait({self._task}, timeout=timeout)
+        if self._task.done():
+            await self._source.aclose()
+
+
+class Prewarmed:
+    """A started live session waiting for its websocket."""
+
+    def __init__(self, session_id, is_audio, slot, expires):
+        self.session_id = session_id
+        self.is_audio = is_audio
+        self.slot = slot
+        self.expires = expires
+        self.created = time.monotonic()
+        self.live_events = None
+        self.live_request_queue = None
+        self.task = None
+        self.outcome = None
+
+
+class PrewarmRegistry:
+    """
+    Pre-warmed sessions by session id. start_session(session_id, is_audio)
+    returns (live_events, live_request_queue) like start_agent_session;
+    release_session(session_id) gives the pooled session back when one is
+    torn down unclaimed. Each session holds its pre-warm admission slot until
+    it is claimed or torn down; each records one outcome.
+    """
+
+    def __init__(self, start_session, release_session, ttl=30.0, sweep_interval=5.0):
+        self.start_session = start_session
+        self.release_session = release_session
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._entries = {}
+        self._sweeper = None
+        self.outcomes = {}
+
+    def _count(self, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        PREWARM.labels(outcome).inc()
+
+    def _end(self, entry, outcome):
+        """Records how entry ended; False if it already had an outcome"""
+        if entry.outcome is not None:
+            return False
+        entry.outcome = outcome
+        self._count(outcome)
+        return True
+
+    async def prewarm(self, session_id, is_audio, slot):
+        """
+        Starts a session in the background; returns False if one in the same
+        mode was already there (its TTL is extended and slot released).
+        """
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            if entry.is_audio == is_audio:
+                entry.expires = time.monotonic() + self.ttl
+                slot.release()
+                return False
+            del self._entries[session_id]
+            await self._teardown(entry, MISMATCHED)
+        entry = self._entries[session_id] = Prewarmed(session_id, is_audio, slot, time.monotonic() + self.ttl)
+        entry.task = asyncio.create_task(self._start(entry), name=f"{session_id}:prewarm")
+        self._count(STARTED)
+        return True
+
+    async def _start(self, entry):
+        started = time.perf_counter()
+        try:
+            live_events, live_request_queue = await self.start_session(entry.session_id, entry.is_audio)
+        except Exception:
+            log.exception("Pre-warming session %s failed", entry.session_id)
+            if self._entries.get(entry.session_id) is entry:
+                del self._entries[entry.session_id]
+            entry.slot.release()
+            self._end(entry, FAILED)
+            return
+        entry.live_request_queue = live_request_queue
+        entry.live_events = BufferedStream(live_events)
+        log.info("Pre-warmed session %s in %.2fs", entry.session_id, time.perf_counter() - started)
+
+    async def claim(self, session_id, is_audio):
+        """
+        The pre-warmed session for session_id, waiting for it to start, or
+        None. A session in the other mode is left for a later claim (or its
+        TTL): a text-mode reconnect doesn't cost the audio session its head
+        start.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None or entry.is_audio != is_audio:
+            return None
+        del self._entries[session_id]
+        try:
+            await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            # The websocket went away while the session was starting
+            asyncio.ensure_future(self._teardown(entry, DISCARDED))
+            raise
+        if entry.live_events is None:
+            return None
+        self._end(entry, CLAIMED)
+        return entry
+
+    async def abandon(self, entry):
+        """Tears down a claimed session its websocket didn't use, e.g. when it wasn't admitted"""
+        await self._teardown(entry, DISCARDED)
+
+    async def discard(self, session_id):
+        """Tears down session_id's pre-warmed session, if any; returns whether there was one"""
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return False
+        await self._teardown(entry, DISCARDED)
+        return True
+
+    async def _teardown(self, entry, outcome):
+        if not entry.task.done():
+            entry.task.cancel()
+            await asyncio.wait({entry.task})
+        if entry.live_events is not None:
+            entry.live_request_queue.close()
+            try:
+                await entry.live_events.aclose()
+            except Exception as e:
+                log.debug("Closing pre-warmed stream %s: %s", entry.session_id, e)
+            await self.release_session(entry.session_id)
+        entry.slot.release()
+        if self._end(entry, outcome):
+            log.info("Pre-warmed session %s %s", entry.session_id, outcome)
+
+    async def expire(self):
+        """Tears down sessions past their TTL; returns how many"""
+        now = time.monotonic()
+        expired = [entry for entry in self._entries.values() if entry.expires <= now]
+        for entry in expired:
+            if self._entries.get(entry.session_id) is entry:
+                del self._entries[entry.session_id]
+                await self._teardown(entry, EXPIRED)
+        return len(expired)
+
+    def start(self):
+        """Starts the background TTL sweeper"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        """Stops the sweeper and tears down every unclaimed session"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        while self._entries:
+            _, entry = self._entries.popitem()
+            await self._teardown(entry, DISCARDED)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.expire()
+            except Exception:
+                log.exception("Pre-warm sweep failed")
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "waiting": len(self._entries),
+            "starting": sum(entry.live_events is None for entry in self._entries.values()),
+            "ttl": self.ttl,
+            "outcomes": dict(self.outcomes),
+            "oldest_s": round(max((now - e.created for e in self._entries.values()), default=0), 1),
+        }
@@ -0,0 +1,396 @@
+"""
+Shared Runner and session pool.
+
+One Runner is built per agent and reused for every connection; sessions are
+tracked so they can be released when a websocket disconnects or a /roleplay
+request completes, and evicted once they have been idle for too long.
+
+With a shared session store (``build_session_service`` with a database URL,
+e.g. ``sqlite:///.cache/sessions.db``) several uvicorn workers can serve the
+same sessions: a reconnect that lands on another worker resumes the stored
+conversation. ``SessionLeases`` records which worker last used each session
+so a worker never deletes a session another worker is still using, and so
+reconnects that miss their previous worker show up in the stats. A proxy in
+front of the workers can keep sessions sticky by hashing the session id in
+the /ws/{session_id} path.
+"""
+
+import asyncio
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .logs import WS, get_logger
+
+log = get_logger(WS)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def build_session_service(url=None):
+    """In-memory session service, or a shared database-backed one for a database URL"""
+    if not url or url == "memory":
+        from google.adk.sessions.in_memory_session_service import InMemorySessionService
+
+        return InMemorySessionService()
+    from google.adk.sessions.database_session_service import DatabaseSessionService
+
+    if url.startswith("sqlite:///"):
+        Path(url[len("sqlite:///"):]).parent.mkdir(parents=True, exist_ok=True)
+    return DatabaseSessionService(db_url=url)
+
+
+class SessionLeases:
+    """Which worker last used each session, shared between workers through SQLite."""
+
+    def __init__(self, path, worker_id=WORKER_ID):
+        self.path = path
+        self.worker_id = worker_id
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_leases ("
+            "session_id TEXT NOT NULL, worker TEXT NOT NULL, user_id TEXT NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (session_id, worker))"
+        )
+        self._lock = asyncio.Lock()
+
+    def _claim(self, session_id, user_id, now):
+        row = self._conn.execute(
+            "SELECT worker FROM session_leases WHERE session_id = ? AND worker != ? "
+            "ORDER BY last_used DESC LIMIT 1",
+            (session_id, self.worker_id),
+        ).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO session_leases (session_id, worker, user_id, last_used) VALUES (?, ?, ?, ?)",
+            (session_id, self.worker_id, user_id, now),
+        )
+        return row[0] if row else None
+
+    def _touch(self, session_ids, now):
+        self._conn.executemany(
+            "UPDATE session_leases SET last_used = ? WHERE session_id = ? AND worker = ?",
+            [(now, session_id, self.worker_id) for session_id in session_ids],
+        )
+
+    def _busy_elsewhere(self, session_id, since):
+        row = self._conn.execute(
+            "SELECT 1 FROM session_leases WHERE session_id = ? AND worker != ? AND last_used >= ? LIMIT 1",
+            (session_id, self.worker_id, since),
+        ).fetchone()
+        return row is not None
+
+    def _expired(self, since):
+        return self._conn.execute(
+            "SELECT session_id, MIN(user_id) FROM session_leases GROUP BY session_id HAVING MAX(last_used) < ?",
+            (since,),
+        ).fetchall()
+
+    def _remove(self, session_id):
+        self._conn.execute("DELETE FROM session_leases WHERE session_id = ?", (session_id,))
+
+    async def _run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    async def claim(self, session_id, user_id):
+        """Records this worker as using the session; returns the other worker that used it last, if any"""
+        return await self._run(self._claim, session_id, user_id, time.time())
+
+    async def touch(self, session_ids):
+        await self._run(self._touch, list(session_ids), time.time())
+
+    async def busy_elsewhere(self, session_id, idle_timeout):
+        """True if another worker used the session within idle_timeout"""
+        return await self._run(self._busy_elsewhere, session_id, time.time() - idle_timeout)
+
+    async def expired(self, idle_timeout):
+        """(session_id, user_id) of sessions no worker has used within idle_timeout"""
+        return await self._run(self._expired, time.time() - idle_timeout)
+
+    async def remove(self, session_id):
+        await self._run(self._remove, session_id)
+
+    def close(self):
+        self._conn.close()
+
+
+class _KeyedLocks:
+    """asyncio locks by key, dropped once nobody holds or waits for them"""
+
+    def __init__(self):
+        self._locks = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+
+class _PooledSession:
+    __slots__ = ("user_id", "in_use", "last_used")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    """
+    Hands out sessions from one session service and one shared Runner.
+    agent and session_service may be zero-argument callables, called when
+    they are first needed so the SDKs can be loaded after startup.
+    """
+
+    def __init__(
+        self,
+        app_name,
+        agent,
+        session_service,
+        idle_timeout=300.0,
+        sweep_interval=30.0,
+        leases=None,
+        on_delete=None,
+        runner=None,
+    ):
+        self.app_name = app_name
+        self._agent = agent
+        self._session_service = session_service
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        # Set when the session store is shared with other workers
+        self.leases = leases
+        # Called with the session id after a session is deleted from the store
+        self.on_delete = on_delete
+        # A runner passed in (e.g. the load benchmark's fake) replaces the ADK Runner
+        self._runner = runner
+        # The warm-up thread and the event loop may both build these first;
+        # reentrant because the runner builds the other two
+        self._build_lock = threading.RLock()
+        self._sessions = {}
+        # Per session id, so store round-trips for one session don't queue the others
+        self._locks = _KeyedLocks()
+        self._sweeper = None
+        self.created = 0
+        self.evicted = 0
+        self.resumed = 0
+        self.moved = 0
+
+    @property
+    def agent(self):
+        if callable(self._agent):
+            with self._build_lock:
+                if callable(self._agent):
+                    self._agent = self._agent()
+        return self._agent
+
+    @property
+    def session_service(self):
+        if callable(self._session_service):
+            with self._build_lock:
+                if callable(self._session_service):
+                    self._session_service = self._session_service()
+        return self._session_service
+
+    @property
+    def runner(self):
+        """The shared Runner, built on first use"""
+        if self._runner is None:
+            with self._build_lock:
+                if self._runner is None:
+                    from google.adk.runners import Runner
+
+                    self._runner = Runner(
+                        app_name=self.app_name,
+                        agent=self.agent,
+                        session_service=self.session_service,
+                    )
+        return self._runner
+
+    @runner.setter
+    def runner(self, runner):
+        self._runner = runner
+
+    async def acquire(self, session_id, user_id=None):
+        """Returns the session for session_id, creating it if needed, and marks it in use"""
+        user_id = user_id or session_id
+        # Only this session id waits on its store and lease round-trips
+        async with self._locks.hold(session_id):
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                user_id = entry.user_id
+            if self.leases is not None:
+                previous = await self.leases.claim(session_id, user_id)
+                if previous is not None:
+                    self.moved += 1
+                    log.info("Session %s moved here from worker %s", session_id, previous)
+            # The session may already exist in a shared store even if this worker hasn't seen it
+            session = await self.session_service.get_session(
+                app_name=self.app_name, user_id=user_id, session_id=session_id
+            )
+            if session is None:
+                session = await self.session_service.create_session(
+                    app_name=self.app_name, user_id=user_id, session_id=session_id
+                )
+                self.created += 1
+            elif entry is None:
+                self.resumed += 1
+            if entry is None:
+                entry = self._sessions[session_id] = _PooledSession(user_id)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            return session
+
+    async def lookup(self, session_id):
+        """Returns the stored session for session_id without marking it in use, or None"""
+        entry = self._sessions.get(session_id)
+        return await self.session_service.get_session(
+            app_name=self.app_name,
+            user_id=entry.user_id if entry is not None else session_id,
+            session_id=session_id,
+        )
+
+    async def release(self, session_id, discard=False):
+        """
+        Marks a session as no longer in use.
+        With discard=True the session is deleted right away; otherwise it is
+        kept until it has been idle for idle_timeout, so a reconnect with the
+        same session id keeps its history.
+        """
+        async with self._locks.hold(session_id):
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            entry.in_use = max(entry.in_use - 1, 0)
+            entry.last_used = time.monotonic()
+            if discard and entry.in_use == 0:
+                await self._delete(session_id, entry)
+                return
+        if self.leases is not None:
+            await self.leases.touch([session_id])
+
+    async def evict_idle(self, now=None):
+        """Deletes sessions that are not in use and have been idle past idle_timeout"""
+        now = time.monotonic() if now is None else now
+
+        def idle(entry):
+            return entry.in_use == 0 and now - entry.last_used >= self.idle_timeout
+
+        evicted = 0
+        for session_id, entry in [item for item in self._sessions.items() if idle(item[1])]:
+            async with self._locks.hold(session_id):
+                # It may have been acquired or released while we waited
+                if self._sessions.get(session_id) is entry and idle(entry):
+                    await self._delete(session_id, entry)
+                    evicted += 1
+        if self.leases is not None:
+            # Keep leases of sessions in use here fresh, and clean up sessions
+            # left behind by workers that are gone
+            await self.leases.touch(
+                [session_id for session_id, entry in self._sessions.items() if entry.in_use]
+            )
+            for session_id, user_id in await self.leases.expired(self.idle_timeout):
+                async with self._locks.hold(session_id):
+                    if session_id not in self._sessions:
+                        await self._delete_stored(session_id, user_id)
+                        self.evicted += 1
+        if evicted:
+            log.info("Evicted %d idle sessions", evicted)
+        return evicted
+
+    async def _delete(self, session_id, entry):
+        del self._sessions[session_id]
+        if self.leases is not None and await self.leases.busy_elsewhere(session_id, self.idle_timeout):
+            # Another worker picked the session up; only forget it here
+            return
+        self.evicted += 1
+        await self._delete_stored(session_id, entry.user_id)
+
+    async def _delete_stored(self, session_id, user_id):
+        await self.session_service.delete_session(
+            app_name=self.app_name, user_id=user_id, session_id=session_id
+        )
+        if self.leases is not None:
+            await self.leases.remove(session_id)
+        if self.on_delete is not None:
+            self.on_delete(session_id)
+
+    def start(self):
+        """Starts the background idle sweeper"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        """
+        Stops the sweeper and deletes every pooled session. With a shared store
+        sessions are kept for other workers and expire through their sweepers.
+        """
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        if self.leases is not None:
+            self._sessions.clear()
+            self.leases.close()
+            return
+        for session_id in list(self._sessions):
+            async with self._locks.hold(session_id):
+                entry = self._sessions.get(session_id)
+                if entry is not None:
+                    await self._delete(session_id, entry)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                log.error("Idle session sweep failed: %s", e)
+
+    def stats(self):
+        """Session counts and process memory use"""
+        in_use = sum(1 for entry in self._sessions.values() if entry.in_use)
+        return {
+            "sessions": len(self._sessions),
+            "in_use": in_use,
+            "idle": len(self._sessions) - in_use,
+            "created": self.created,
+            "evicted": self.evicted,
+            "resumed": self.resumed,
+            "moved_from_other_worker": self.moved,
+            "worker": WORKER_ID,
+            "shared_store": self.leases is not None,
+            "rss_bytes": _rss_bytes(),
+            "cpu_seconds": round(time.process_time(), 3),
+        }
+
+
+def _rss_bytes():
+    """Current resident set size, or peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
@@ -0,0 +1,170 @@
+"""
+Structured lifecycle for the tasks of a websocket session.
+
+``asyncio.gather`` keeps the other tasks running when one of them fails, so
+a client disconnect used to leave the agent stream, and the live model
+connection behind it, running until the session idled out. The
+``SessionSupervisor`` runs a session's tasks as a group: the first one to
+finish, fail or go idle ends the session, and the rest are cancelled and
+awaited before the session's resources are released. Tasks that ignore
+cancellation for longer than ``cancel_timeout`` are counted as leaked.
+
+On server shutdown ``drain()`` asks every session to stop and waits for
+them, so connections close with a proper code instead of being dropped.
+"""
+
+import asyncio
+import time
+
+from .logs import WS, get_logger
+
+log = get_logger(WS)
+
+# Why a supervised session ended
+FINISHED = "finished"
+FAILED = "failed"
+IDLE = "idle_timeout"
+SHUTDOWN = "shutdown"
+CANCELLED = "cancelled"
+
+
+class SupervisedSession:
+    """One running session; touch() marks activity for the idle timeout."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.started = time.monotonic()
+        self.last_activity = self.started
+        self.tasks = {}
+        self.reason = None
+        self._stop = asyncio.Event()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def stop(self, reason=SHUTDOWN):
+        if self.reason is None:
+            self.reason = reason
+        self._stop.set()
+
+
+class SessionSupervisor:
+    """
+    Runs each session's tasks as one unit. Exceptions of the types in
+    expected (e.g. a client disconnect) end a session quietly; anything else
+    is logged with its traceback.
+    """
+
+    def __init__(self, idle_timeout=0, cancel_timeout=5.0, expected=()):
+        self.idle_timeout = idle_timeout
+        self.cancel_timeout = cancel_timeout
+        self.expected = tuple(expected)
+        # Every running session, including overlapping ones with the same id
+        # while a client reconnects
+        self._sessions = set()
+        self.draining = False
+        self.started = 0
+        self.ended = {}
+        self.leaked_tasks = 0
+
+    def session(self, session_id):
+        """Registers a session before its tasks start, so they can touch() it"""
+        session = SupervisedSession(session_id)
+        self._sessions.add(session)
+        if self.draining:
+            session.stop()
+        return session
+
+    async def run(self, session, coroutines):
+        """
+        Runs coroutines ({name: coroutine}) until the first one returns or
+        raises, the session idles out or is stopped, then cancels the rest.
+        Returns the reason the session ended.
+        """
+        self.started += 1
+        for name, coroutine in coroutines.items():
+            session.tasks[asyncio.create_task(coroutine, name=f"{session.session_id}:{name}")] = name
+        stop = asyncio.create_task(self._watch(session))
+        try:
+            done, _ = await asyncio.wait(set(session.tasks) | {stop}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop:
+                    self._record(session, task)
+        except asyncio.CancelledError:
+            session.reason = session.reason or CANCELLED
+            raise
+        finally:
+            stop.cancel()
+            await self._cancel(session)
+            self._sessions.discard(session)
+            self.ended[session.reason] = self.ended.get(session.reason, 0) + 1
+        return session.reason
+
+    def _record(self, session, task):
+        name = session.tasks[task]
+        if task.cancelled():
+            error = None
+        else:
+            error = task.exception()
+        if error is None or isinstance(error, self.expected):
+            session.reason = session.reason or FINISHED
+            log.debug("Session %s: %s ended (%s)", session.session_id, name, type(error).__name__ if error else "done")
+        else:
+            session.reason = session.reason or FAILED
+            log.error("Session %s: %s failed", session.session_id, name, exc_info=error)
+
+    async def _watch(self, session):
+        """Returns when the session is stopped or has been idle for idle_timeout"""
+        if not self.idle_timeout:
+            await session._stop.wait()
+            return
+        while not session._stop.is_set():
+            remaining = session.last_activity + self.idle_timeout - time.monotonic()
+            if remaining <= 0:
+                log.info("Session %s idle for %.0fs, closing", session.session_id, self.idle_timeout)
+                session.stop(IDLE)
+                return
+            try:
+                await asyncio.wait_for(session._stop.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _cancel(self, session):
+        pending = [task for task in session.tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            _, still_running = await asyncio.wait(pending, timeout=self.cancel_timeout)
+            for task in still_running:
+                self.leaked_tasks += 1
+                log.warning("Session %s: %s ignored cancellation", session.session_id, session.tasks[task])
+        # Retrieve exceptions so they aren't reported as never retrieved
+        for task in session.tasks:
+            if task.done() and not task.cancelled():
+                task.exception()
+
+    async def drain(self, timeout=10.0):
+        """Stops every session and waits up to timeout for them to end"""
+        self.draining = True
+        for session in list(self._sessions):
+            session.stop(SHUTDOWN)
+        deadline = time.monotonic() + timeout
+        while self._sessions and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._sessions:
+            log.warning("%d sessions still running after drain", len(self._sessions))
+
+    def stats(self):
+        tasks = [task for session in self._sessions for task in session.tasks]
+        now = time.monotonic()
+        return {
+            "active_sessions": len(self._sessions),
+            "active_tasks": sum(not task.done() for task in tasks),
+            "process_tasks": len(asyncio.all_tasks()),
+            "started": self.started,
+            "ended": dict(self.ended),
+            "leaked_tasks": self.leaked_tasks,
+            "idle_timeout": self.idle_timeout,
+            "oldest_idle_s": round(max((now - s.last_activity for s in self._sessions), default=0), 1),
+            "draining": self.draining,
+        }
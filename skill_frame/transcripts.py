@@ -0,0 +1,190 @@
+"""
+Per-session conversation transcripts.
+
+Transcriptions and text events are appended as they flow through the
+websocket bridge. Partial events are folded into the open turn of their
+speaker (whether the model streams deltas or cumulative text), and the turn
+is committed once with its final text and start/end timestamps when the
+speaker changes, a final event arrives or the turn completes.
+
+Each transcript keeps its most recent turns in memory. Older turns spill to
+a JSONL file with an in-memory index of line offsets, so the last N turns can
+be read back with one seek however long the session ran.
+"""
+
+import json
+import os
+import re
+import time
+from collections import deque
+from pathlib import Path
+
+USER = "user"
+AGENT = "agent"
+
+_UNSAFE = re.compile(r"[^\w.-]")
+
+
+class Transcript:
+    """Committed turns of one session plus the turns still being spoken."""
+
+    def __init__(self, session_id, max_memory_turns=200, spill_path=None):
+        self.session_id = session_id
+        self.max_memory_turns = max_memory_turns
+        self.spill_path = spill_path
+        # Committed turns as (role, text, start, end), oldest first
+        self._recent = deque()
+        # role -> [text, start, end] for turns that aren't committed yet
+        self._open = {}
+        self._spill = None
+        self._offsets = []
+        self.updated = time.time()
+
+    def __len__(self):
+        return len(self._offsets) + len(self._recent)
+
+    def partial(self, role, text, now=None):
+        """Adds a partial (streaming) text event"""
+        if not text:
+            return
+        now = time.time() if now is None else now
+        self._switch(role)
+        current = self._open.get(role)
+        if current is None:
+            self._open[role] = [text, now, now]
+        else:
+            if text.startswith(current[0]):
+                # Cumulative partials repeat the text so far
+                current[0] = text
+            else:
+                current[0] += text
+            current[2] = now
+        self.updated = now
+
+    def final(self, role, text, now=None):
+        """Adds the final text of a turn and commits it"""
+        now = time.time() if now is None else now
+        self._switch(role)
+        current = self._open.pop(role, None)
+        start = current[1] if current else now
+        text = (text or (current[0] if current else "")).strip()
+        if text:
+            self._commit(role, text, start, now)
+        self.updated = now
+
+    def end_turn(self, now=None):
+        """Commits every open turn, e.g. on turn_complete or interrupted"""
+        for role in list(self._open):
+            self._close(role)
+        self.updated = time.time() if now is None else now
+
+    def _switch(self, role):
+        # A new speaker closes the other speaker's turn
+        for other in [r for r in self._open if r != role]:
+            self._close(other)
+
+    def _close(self, role):
+        text, start, end = self._open.pop(role)
+        text = text.strip()
+        if text:
+            self._commit(role, text, start, end)
+
+    def _commit(self, role, text, start, end):
+        if self._recent and self._recent[-1][0] == role and self._recent[-1][1] == text:
+            return  # the same final text delivered twice
+        self._recent.append((role, text, round(start, 3), round(end, 3)))
+        if len(self._recent) > self.max_memory_turns:
+            oldest = self._recent.popleft()
+            # Without a spill file only the most recent turns are kept
+            if self.spill_path is not None:
+                self._write_spill(oldest)
+
+    def _write_spill(self, turn):
+        if self._spill is None:
+            Path(self.spill_path).parent.mkdir(parents=True, exist_ok=True)
+            self._spill = open(self.spill_path, "a+b")
+        self._spill.seek(0, os.SEEK_END)
+        self._offsets.append(self._spill.tell())
+        self._spill.write(json.dumps(turn, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def _read_spilled(self, first):
+        if first >= len(self._offsets):
+            return []
+        self._spill.flush()
+        self._spill.seek(self._offsets[first])
+        return [tuple(json.loads(line)) for line in self._spill.read().splitlines()]
+
+    def last(self, n=None, include_open=False):
+        """The last n committed turns (all if n is None) as dicts, oldest first"""
+        turns = list(self._recent)
+        total = len(self)
+        wanted = total if n is None else min(n, total)
+        if wanted > len(turns):
+            turns = self._read_spilled(total - wanted) + turns
+        turns = turns[len(turns) - wanted:] if wanted else []
+        result = [{"role": role, "text": text, "start": start, "end": end} for role, text, start, end in turns]
+        if include_open:
+            result += [
+                {"role": role, "text": text, "start": round(start, 3), "end": round(end, 3), "partial": True}
+                for role, (text, start, end) in sorted(self._open.items(), key=lambda item: item[1][1])
+            ]
+        return result
+
+    def close(self, delete=False):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if delete and self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            "turns": len(self),
+            "in_memory": len(self._recent),
+            "spilled": len(self._offsets),
+            "open": len(self._open),
+            "updated": round(self.updated, 3),
+        }
+
+
+class TranscriptStore:
+    """Transcripts by session id, spilling long ones under directory."""
+
+    def __init__(self, directory=None, max_memory_turns=200):
+        self.directory = Path(directory) if directory else None
+        self.max_memory_turns = max_memory_turns
+        self._transcripts = {}
+
+    def get(self, session_id, create=True):
+        """The transcript for a session, created on first use (None if create=False and missing)"""
+        transcript = self._transcripts.get(session_id)
+        if transcript is None and create:
+            spill_path = None
+            if self.directory is not None:
+                spill_path = self.directory / f"{_UNSAFE.sub('_', str(session_id))}.jsonl"
+                # Start fresh if a previous process left a file behind
+                if spill_path.exists():
+                    spill_path.unlink()
+            transcript = self._transcripts[session_id] = Transcript(session_id, self.max_memory_turns, spill_path)
+        return transcript
+
+    def last(self, session_id, n=None, include_open=False):
+        """The last n turns of a session; empty if it has no transcript"""
+        transcript = self._transcripts.get(session_id)
+        return transcript.last(n, include_open) if transcript is not None else []
+
+    def discard(self, session_id):
+        """Drops a session's transcript and its spill file"""
+        transcript = self._transcripts.pop(session_id, None)
+        if transcript is not None:
+            transcript.close(delete=True)
+
+    def close(self):
+        for transcript in self._transcripts.values():
+            transcript.close()
+
+    def stats(self):
+        return {session_id: transcript.stats() for session_id, transcript in self._transcripts.items()}
@@ -0,0 +1,177 @@
+"""
+Compiled JSON schema validation with per-field errors.
+
+``SchemaValidator`` turns a schema into plain Python checks once, at import
+time, instead of building a jsonschema validator on every call. Only the
+keywords our schemas use are compiled (type, properties, required, items,
+minLength/maxLength, minItems/maxItems); a schema using anything else falls
+back to a jsonschema validator that is still built only once.
+
+Errors are reported per top-level field so callers can repair just the
+fields that failed.
+"""
+
+_TYPES = {
+    "string": lambda v: isinstance(v, str),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+SUPPORTED_KEYWORDS = {
+    "type", "properties", "required", "items",
+    "minLength", "maxLength", "minItems", "maxItems",
+    "title", "description",
+}
+
+# Key used in field_errors() for errors about the instance as a whole
+ROOT = ""
+
+
+class SchemaValidationError(ValueError):
+    """Raised by SchemaValidator.validate; field_errors maps field -> message."""
+
+    def __init__(self, field_errors):
+        self.field_errors = field_errors
+        super().__init__("; ".join(f"{field or '<root>'}: {msg}" for field, msg in field_errors.items()))
+
+
+def _is_supported(schema):
+    if not isinstance(schema, dict) or not set(schema) <= SUPPORTED_KEYWORDS:
+        return False
+    if schema.get("type", "object") not in _TYPES:
+        return False
+    if "items" in schema and not _is_supported(schema["items"]):
+        return False
+    return all(_is_supported(prop) for prop in schema.get("properties", {}).values())
+
+
+def _compile(schema):
+    """Returns check(value) -> error message or None"""
+    checks = []
+
+    type_name = schema.get("type")
+    if type_name is not None:
+        is_type = _TYPES[type_name]
+        checks.append(lambda v: None if is_type(v) else f"expected {type_name}, got {type(v).__name__}")
+
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+        checks.append(lambda v: None if len(v) >= min_length else f"shorter than {min_length} characters")
+    if "maxLength" in schema:
+        max_length = schema["maxLength"]
+        checks.append(lambda v: None if len(v) <= max_length else f"longer than {max_length} characters")
+    if "minItems" in schema:
+        min_items = schema["minItems"]
+        checks.append(lambda v: None if len(v) >= min_items else f"fewer than {min_items} items")
+    if "maxItems" in schema:
+        max_items = schema["maxItems"]
+        checks.append(lambda v: None if len(v) <= max_items else f"more than {max_items} items")
+
+    if "items" in schema:
+        check_item = _compile(schema["items"])
+
+        def check_items(v):
+            for index, item in enumerate(v):
+                error = check_item(item)
+                if error:
+                    return f"item {index}: {error}"
+            return None
+
+        checks.append(check_items)
+
+    if "properties" in schema or "required" in schema:
+        check_fields = _compile_fields(schema)
+
+        def check_object(v):
+            # properties/required only constrain objects
+            if not isinstance(v, dict):
+                return None
+            errors = check_fields(v)
+            if errors:
+                field, error = next(iter(errors.items()))
+                return f"{field}: {error}"
+            return None
+
+        checks.append(check_object)
+
+    def check(value):
+        # Checks run in order and stop at the first failure, so the type check
+        # guards the length/item checks that follow it
+        for c in checks:
+            error = c(value)
+            if error:
+                return error
+        return None
+
+    return check
+
+
+def _compile_fields(schema):
+    """Returns check_fields(obj) -> {field: error} for an object schema"""
+    required = tuple(schema.get("required", ()))
+    properties = tuple((name, _compile(prop)) for name, prop in schema.get("properties", {}).items())
+
+    def check_fields(obj):
+        errors = {}
+        for name in required:
+            if name not in obj:
+                errors[name] = "is required"
+        for name, check in properties:
+            if name in obj and name not in errors:
+                error = check(obj[name])
+                if error:
+                    errors[name] = error
+        return errors
+
+    return check_fields
+
+
+class SchemaValidator:
+    """A schema compiled once, reporting errors per top-level field."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = list(schema.get("properties", {}))
+        if schema.get("type") == "object" and _is_supported(schema):
+            self._check_fields = _compile_fields(schema)
+            self._jsonschema = None
+        else:
+            from jsonschema.validators import validator_for
+
+            cls = validator_for(schema)
+            cls.check_schema(schema)
+            self._check_fields = None
+            self._jsonschema = cls(schema)
+
+    def field_errors(self, instance):
+        """Returns {field: message} for every failing field; empty when valid"""
+        if self._jsonschema is not None:
+            return self._jsonschema_field_errors(instance)
+        if not isinstance(instance, dict):
+            return {ROOT: f"expected object, got {type(instance).__name__}"}
+        return self._check_fields(instance)
+
+    def _jsonschema_field_errors(self, instance):
+        errors = {}
+        for error in self._jsonschema.iter_errors(instance):
+            if error.path:
+                field = error.path[0]
+            elif error.validator == "required":
+                field = next((f for f in error.validator_value if f not in instance and f not in errors), ROOT)
+            else:
+                field = ROOT
+            errors.setdefault(field, error.message)
+        return errors
+
+    def is_valid(self, instance):
+        return not self.field_errors(instance)
+
+    def validate(self, instance):
+        """Raises SchemaValidationError if instance doesn't match the schema"""
+        errors = self.field_errors(instance)
+        if errors:
+            raise SchemaValidationError(errors)
@@ -0,0 +1,102 @@
+"""
+Deferred loading of the heavy SDKs.
+
+Importing google.adk, google.genai and building the agent takes seconds,
+and used to happen at import time, before uvicorn could accept a
+connection. ``Warmup`` runs those steps once, in order, in a worker thread,
+and records how long each one took and how many modules it imported.
+
+Modes (``STARTUP_WARMUP``):
+
+- ``background``: start warming up as soon as the app starts; static pages
+  and health checks are served meanwhile, and requests that need the SDKs
+  wait for it.
+- ``lazy``: warm up on the first request that needs the SDKs.
+- ``eager``: warm up at import time, as before.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+
+from .logs import WS, get_logger
+
+log = get_logger(WS)
+
+COLD = "cold"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class Warmup:
+    """Runs named loader steps once, off the event loop, and reports their timing."""
+
+    def __init__(self, steps, mode="background"):
+        self.steps = list(steps)
+        self.mode = mode
+        self.state = COLD
+        self.error = None
+        self.profile = []
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._future = None
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def run(self):
+        """Runs the steps in the calling thread if they haven't run yet; raises if one failed"""
+        with self._lock:
+            if self.state == COLD:
+                self._run_steps()
+        if self.state == FAILED:
+            raise RuntimeError(f"Warm-up failed: {self.error}")
+
+    def _run_steps(self):
+        self.state = WARMING
+        self.started = time.time()
+        try:
+            for name, step in self.steps:
+                modules = len(sys.modules)
+                started = time.perf_counter()
+                step()
+                self.profile.append({
+                    "step": name,
+                    "seconds": round(time.perf_counter() - started, 4),
+                    "modules_imported": len(sys.modules) - modules,
+                })
+        except Exception as e:
+            self.state = FAILED
+            self.error = f"{name}: {e}"
+            log.exception("Warm-up step %s failed", name)
+        else:
+            self.state = READY
+            log.info("Warm-up done in %.2fs", sum(step["seconds"] for step in self.profile))
+        finally:
+            self.finished = time.time()
+
+    def start(self):
+        """Starts warming up in a worker thread; returns the future to await"""
+        if self._future is None:
+            self._future = asyncio.get_running_loop().run_in_executor(None, self.run)
+        return self._future
+
+    async def wait(self):
+        """Waits until the SDKs are loaded, starting the warm-up if needed"""
+        if self.state == READY:
+            return
+        # Shielded so a cancelled request doesn't cancel the shared warm-up
+        await asyncio.shield(self.start())
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "state": self.state,
+            "error": self.error,
+            "seconds": round(self.finished - self.started, 3) if self.finished and self.started else None,
+            "steps": list(self.profile),
+        }
@@ -29,6 +29,42 @@ const ws_url =
 let websocket = null;
 let is_audio = false;
 
+// Binary framing (see skill_frame/framing.py): 8-byte header + raw payload.
+// Only used after the server confirms support with a protocol hello.
+const FRAME_PROTOCOL_VERSION = 1;
+const FRAME_HEADER_SIZE = 8;
+const FRAME_MIME_CODES = { "audio/pcm": 1, "image/jpeg": 2 };
+const FRAME_MIME_TYPES = { 1: "audio/pcm", 2: "image/jpeg", 3: "audio/opus" };
+const FRAME_SOURCE_CODES = { unknown: 0, camera: 1, screen: 2 };
+const FRAME_SAMPLE_RATE_CODES = {
+  8000: 1, 11025: 2, 12000: 3, 16000: 4, 22050: 5, 24000: 6, 32000: 7, 44100: 8, 48000: 9,
+};
+let useBinaryFraming = false;
+let binaryFrameSeq = 0;
+
+// Compressed agent audio (see skill_frame/audio_out.py): asked for when the
+// browser can decode Opus with WebCodecs; the server answers with the codec
+// it picked, and PCM stays the fallback.
+const CODEC_MIME_TYPE = "application/x-skill-frame-codec";
+const OPUS_DECODER_CONFIG = { codec: "opus", sampleRate: 24000, numberOfChannels: 1 };
+let preferOpus = false;
+let opusDecoder = null;
+let opusDecoderConfig = null;
+let opusTimestamp = 0;
+let opusFrameUs = 20000;
+if (typeof AudioDecoder !== "undefined") {
+  AudioDecoder.isConfigSupported(OPUS_DECODER_CONFIG)
+    .then((support) => { preferOpus = support.supported === true; })
+    .catch(() => { preferOpus = false; });
+}
+
+// Admission control: the server may queue a connection until a session slot
+// is free. Nothing is sent before it confirms admission.
+const ADMISSION_MIME_TYPE = "application/x-skill-frame-admission";
+const DEFAULT_RECONNECT_DELAY_MS = 5000;
+let sessionAdmitted = false;
+let reconnectDelayMs = DEFAULT_RECONNECT_DELAY_MS;
+
 // Initialize system flags
 window.textModeReady = false;
 window.analysisInProgress = false;
@@ -222,32 +258,62 @@ function showChat() {
 // WebSocket handlers
 function connectWebsocket() {
   // Connect websocket
-  const wsUrlWithAudio = ws_url + "?is_audio=" + is_audio;
+  const wsUrlWithAudio = ws_url + "?is_audio=" + is_audio + "&binary=true" +
+    (preferOpus ? "&audio_codec=opus" : "");
   console.log("🔌 Connecting to WebSocket:", wsUrlWithAudio);
   
+  useBinaryFraming = false;
+  sessionAdmitted = false;
   websocket = new WebSocket(wsUrlWithAudio);
+  websocket.binaryType = "arraybuffer";
 
   // Handle connection open
   websocket.onopen = function () {
     // Connection opened messages
     console.log("✅ WebSocket connection opened successfully");
     console.log("🎯 Audio mode:", is_audio ? "ENABLED" : "DISABLED");
-    updateChatStatus("Connected - Ready to chat");
-
-    // Enable the Send button
-    document.getElementById("sendButton").disabled = false;
-    addSubmitHandler();
+    updateChatStatus("Connected - Waiting for a session");
+    // The server attaches this connection to the pre-warmed session, if any
+    prewarmRequested = null;
   };
 
   // Handle incoming messages
   websocket.onmessage = function (event) {
+    // Binary frames carry raw audio, no JSON or Base64 involved
+    if (event.data instanceof ArrayBuffer) {
+      handleBinaryFrame(event.data);
+      return;
+    }
+
     // Parse the incoming message
     const message_from_server = JSON.parse(event.data);
     console.log("[AGENT TO CLIENT] ", message_from_server);
 
+    // Server confirmed it supports binary framing
+    if (message_from_server.mime_type == "application/x-skill-frame-protocol") {
+      useBinaryFraming = message_from_server.binary === true &&
+        message_from_server.version === FRAME_PROTOCOL_VERSION;
+      console.log("🔌 Binary framing:", useBinaryFraming ? "ENABLED" : "DISABLED");
+      return;
+    }
+
+    if (handleCodecMessage(message_from_server)) {
+      return;
+    }
+
+    if (handleAdmissionMessage(message_from_server, function () {
+      updateChatStatus("Connected - Ready to chat");
+      // Enable the Send button
+      document.getElementById("sendButton").disabled = false;
+      addSubmitHandler();
+    })) {
+      return;
+    }
+
     // Handle interruption - clear audio buffer immediately
     if (message_from_server.interrupted && message_from_server.interrupted === true) {
       console.log("🚫 Server-side interruption detected - clearing audio buffer");
+      resetOpusDecoder();
       if (audioPlayerNode) {
         audioPlayerNode.port.postMessage({ command: 'endOfAudio' });
       }
@@ -386,10 +452,13 @@ function connectWebsocket() {
     
     // Only auto-reconnect if we're not in analysis mode AND not during manual reconnection
     if (!window.analysisInProgress && !window.manualReconnectionInProgress) {
+      // A busy server says when to come back
+      const delay = reconnectDelayMs;
+      reconnectDelayMs = DEFAULT_RECONNECT_DELAY_MS;
       setTimeout(function () {
         console.log("🔄 Attempting to reconnect WebSocket...");
         connectWebsocket();
-      }, 5000);
+      }, delay);
     } else {
       console.log("🔄 Skipping auto-reconnect (analysis or manual reconnection in progress)");
     }
@@ -439,14 +508,179 @@ function addSubmitHandler() {
   };
 }
 
+// The PDF viewer reports the page on screen; the server sends its text to the agent
+window.onPdfPageVisible = function (documentId, page) {
+  sendMessage({
+    mime_type: "application/x-skill-frame-page",
+    data: { document_id: documentId, page: page },
+  });
+};
+
+// Ask the server to start the live session ahead of the websocket (e.g.
+// when the learner reaches for Start); the next connection in the same mode
+// attaches to it. Best effort: failures only cost the head start. Asked at
+// most once per mode until the websocket opens or the page is left.
+let prewarmRequested = null;
+window.prewarmLiveSession = function (audio) {
+  if (prewarmRequested === audio) return;
+  prewarmRequested = audio;
+  fetch(`/sessions/${sessionId}/prewarm?is_audio=${audio}`, { method: "POST" })
+    .then((response) => response.json())
+    .then((result) => console.log("🔥 Pre-warm:", result))
+    .catch((error) => console.warn("⚠️ Pre-warm failed:", error));
+};
+
+window.discardPrewarmedSession = function () {
+  prewarmRequested = null;
+  fetch(`/sessions/${sessionId}/prewarm`, { method: "DELETE" }).catch(() => {});
+};
+
+// Handle an admission control frame; returns true if the message was one
+function handleAdmissionMessage(message, onAdmitted) {
+  if (message.mime_type != ADMISSION_MIME_TYPE) {
+    return false;
+  }
+  if (message.status == "queued") {
+    console.log("⏳ Waiting for a session slot:", message.position, "of", message.queued);
+    updateChatStatus(`Server busy - you are number ${message.position} in line`);
+  } else if (message.status == "admitted") {
+    console.log("✅ Session admitted");
+    sessionAdmitted = true;
+    onAdmitted();
+    // A new connection doesn't know which page is on screen
+    if (window.pdfViewer) {
+      window.pdfViewer.reportVisiblePage();
+    }
+  } else if (message.status == "rejected") {
+    console.warn("🚫 Session rejected:", message.reason, "retry after", message.retry_after);
+    const retryAfter = message.retry_after || DEFAULT_RECONNECT_DELAY_MS / 1000;
+    reconnectDelayMs = Math.max(retryAfter * 1000, 1000);
+    updateChatStatus(`Server busy - retrying in ${Math.ceil(retryAfter)}s`);
+  }
+  return true;
+}
+
 // Send a message to the server as a JSON string
 function sendMessage(message) {
-  if (websocket && websocket.readyState == WebSocket.OPEN) {
+  if (websocket && websocket.readyState == WebSocket.OPEN && sessionAdmitted) {
     const messageJson = JSON.stringify(message);
     websocket.send(messageJson);
   }
 }
 
+// Send raw bytes with the binary frame header
+function sendBinaryFrame(mimeType, payload, source = "unknown", sampleRate = null) {
+  if (websocket && websocket.readyState == WebSocket.OPEN && sessionAdmitted) {
+    const body = new Uint8Array(payload);
+    const frame = new Uint8Array(FRAME_HEADER_SIZE + body.byteLength);
+    const header = new DataView(frame.buffer);
+    header.setUint8(0, FRAME_PROTOCOL_VERSION);
+    header.setUint8(1, FRAME_MIME_CODES[mimeType]);
+    header.setUint8(2, FRAME_SOURCE_CODES[source] || 0);
+    header.setUint8(3, FRAME_SAMPLE_RATE_CODES[sampleRate] || 0);
+    header.setUint32(4, binaryFrameSeq >>> 0);
+    binaryFrameSeq = (binaryFrameSeq + 1) >>> 0;
+    frame.set(body, FRAME_HEADER_SIZE);
+    websocket.send(frame.buffer);
+  }
+}
+
+// Handle a binary frame from the server
+function handleBinaryFrame(buffer) {
+  if (buffer.byteLength < FRAME_HEADER_SIZE) {
+    console.warn("⚠️ Dropping short binary frame:", buffer.byteLength);
+    return;
+  }
+  const header = new DataView(buffer, 0, FRAME_HEADER_SIZE);
+  const mimeType = FRAME_MIME_TYPES[header.getUint8(1)];
+  if (mimeType == "audio/pcm" && audioPlayerNode) {
+    audioPlayerNode.port.postMessage(buffer.slice(FRAME_HEADER_SIZE));
+    updateChatStatus("Playing audio response...");
+  } else if (mimeType == "audio/opus" && opusDecoder) {
+    decodeOpusPackets(buffer);
+    updateChatStatus("Playing audio response...");
+  }
+}
+
+// Handle the server's codec choice; returns true if the message was one
+function handleCodecMessage(message) {
+  if (message.mime_type != CODEC_MIME_TYPE) {
+    return false;
+  }
+  closeOpusDecoder();
+  if (message.audio == "opus") {
+    startOpusDecoder(message);
+  }
+  console.log("🔈 Agent audio codec:", message.audio);
+  return true;
+}
+
+function startOpusDecoder(message) {
+  opusDecoderConfig = {
+    codec: "opus",
+    sampleRate: message.sample_rate,
+    numberOfChannels: message.channels || 1,
+  };
+  opusFrameUs = (message.frame_ms || 20) * 1000;
+  opusTimestamp = 0;
+  opusDecoder = new AudioDecoder({
+    output: (audioData) => {
+      const samples = new Float32Array(audioData.numberOfFrames);
+      audioData.copyTo(samples, { planeIndex: 0, format: "f32-planar" });
+      audioData.close();
+      if (audioPlayerNode) {
+        audioPlayerNode.port.postMessage(samples, [samples.buffer]);
+      }
+    },
+    error: (error) => {
+      // Reconnect and get PCM instead
+      console.warn("⚠️ Opus decoding failed, falling back to PCM:", error);
+      preferOpus = false;
+      opusDecoder = null;
+      if (websocket) {
+        websocket.close();
+      }
+    },
+  });
+  opusDecoder.configure(opusDecoderConfig);
+}
+
+// A frame's payload is Opus packets, each prefixed with a 16-bit big-endian length
+function decodeOpusPackets(buffer) {
+  const view = new DataView(buffer);
+  let offset = FRAME_HEADER_SIZE;
+  while (offset + 2 <= buffer.byteLength) {
+    const length = view.getUint16(offset);
+    offset += 2;
+    if (offset + length > buffer.byteLength) {
+      console.warn("⚠️ Dropping truncated Opus packet");
+      return;
+    }
+    opusDecoder.decode(new EncodedAudioChunk({
+      type: "key",
+      timestamp: opusTimestamp,
+      data: new Uint8Array(buffer, offset, length),
+    }));
+    opusTimestamp += opusFrameUs;
+    offset += length;
+  }
+}
+
+// Drop audio still in the decoder, e.g. after an interruption
+function resetOpusDecoder() {
+  if (opusDecoder && opusDecoder.state == "configured") {
+    opusDecoder.reset();
+    opusDecoder.configure(opusDecoderConfig);
+  }
+}
+
+function closeOpusDecoder() {
+  if (opusDecoder && opusDecoder.state != "closed") {
+    opusDecoder.close();
+  }
+  opusDecoder = null;
+}
+
 // Decode Base64 data to Array
 function base64ToArray(base64) {
   const binaryString = window.atob(base64);
@@ -615,10 +849,18 @@ function audioRecorderHandler(pcmData) {
   
   // Only send audio data if VAD detects speech
   if (shouldSendAudio) {
-    sendMessage({
-      mime_type: "audio/pcm",
-      data: arrayBufferToBase64(pcmData),
-    });
+    if (useBinaryFraming) {
+      // The server resamples if the browser didn't honor the requested 16 kHz
+      const sampleRate = audioRecorderContext ? audioRecorderContext.sampleRate : 16000;
+      sendBinaryFrame("audio/pcm", pcmData, "unknown", sampleRate);
+    } else {
+      sendMessage({
+        mime_type: "audio/pcm",
+        data: arrayBufferToBase64(pcmData),
+        // The server resamples if the browser didn't honor the requested 16 kHz
+        metadata: { sample_rate: audioRecorderContext ? audioRecorderContext.sampleRate : 16000 },
+      });
+    }
     console.log(`[CLIENT TO AGENT] sent %s bytes (VAD: SPEECH)`, pcmData.byteLength);
   } else {
     // Log silence detection (less frequently to avoid spam)
@@ -1025,8 +1267,8 @@ function stopAudioForAnalysis() {
     audioPlayerNode = null;
   }
   
-  // Now reconnect WebSocket in text mode with same session ID
-  reconnectForAnalysis();
+  // The analysis is generated on the server from the stored conversation, so
+  // no text-mode reconnect is needed (reconnectForAnalysis is the fallback)
 }
 
 // Reconnect WebSocket in text mode while preserving session ID
@@ -1052,18 +1294,12 @@ function reconnectForAnalysis() {
   const wsUrlTextMode = "ws://" + window.location.host + "/ws/" + currentSessionId + "?is_audio=false";
   console.log("🔌 Connecting to WebSocket in text mode:", wsUrlTextMode);
   
+  sessionAdmitted = false;
   websocket = new WebSocket(wsUrlTextMode);
   
   // Handle connection open
   websocket.onopen = function () {
     console.log("✅ WebSocket reconnected in text mode successfully");
-    updateChatStatus("Connected in text mode - Ready for analysis");
-    
-    // Clear manual reconnection flag and set text mode ready
-    window.manualReconnectionInProgress = false;
-    window.textModeReady = true;
-    
-    console.log("🎯 Text mode connection established, session history preserved");
   };
   
   // Reuse the existing WebSocket message handlers from connectWebsocket()
@@ -1072,6 +1308,18 @@ function reconnectForAnalysis() {
     const message_from_server = JSON.parse(event.data);
     console.log("[AGENT TO CLIENT] ", message_from_server);
 
+    if (handleAdmissionMessage(message_from_server, function () {
+      updateChatStatus("Connected in text mode - Ready for analysis");
+      
+      // Clear manual reconnection flag and set text mode ready
+      window.manualReconnectionInProgress = false;
+      window.textModeReady = true;
+      
+      console.log("🎯 Text mode connection established, session history preserved");
+    })) {
+      return;
+    }
+
     // Handle interruption
     if (message_from_server.interrupted && message_from_server.interrupted === true) {
       console.log("🚫 Server-side interruption detected");
@@ -1211,8 +1459,46 @@ function startRolePlayAnalysis() {
   // Prepare analysis data
   const analysisData = prepareAnalysisData();
   
-  // Send analysis request immediately (no step progression)
-  waitForTextModeAndSendAnalysis(analysisData);
+  // Ask the server to analyze the stored conversation
+  requestServerAnalysis(analysisData);
+}
+
+// Request the analysis from the server, which builds it from the conversation stored with the session
+async function requestServerAnalysis(analysisData) {
+  // The live connection isn't needed for analysis; its session stays on the server
+  if (websocket && websocket.readyState === WebSocket.OPEN) {
+    websocket.close();
+  }
+  
+  try {
+    const response = await fetch(`/roleplay/${sessionId}/analysis`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ scenario: analysisData.scenario, duration: analysisData.duration }),
+    });
+    
+    if (response.status === 404 || response.status === 409) {
+      // Nothing stored for this session: fall back to asking the live agent in text mode
+      console.warn(`⚠️ Server analysis unavailable (${response.status}), falling back to text-mode analysis`);
+      reconnectForAnalysis();
+      waitForTextModeAndSendAnalysis(analysisData);
+      return;
+    }
+    if (!response.ok) {
+      throw new Error(`Analysis request failed: ${response.status}`);
+    }
+    
+    const analysisResult = await response.json();
+    if (window.analysisComplete) {
+      return;
+    }
+    console.log("✅ Server analysis received");
+    resetSystemAfterAnalysis();
+    renderDynamicFeedbackPage(analysisResult);
+  } catch (error) {
+    console.error("❌ Error requesting analysis:", error);
+    showAnalysisError("Failed to process analysis. Please try again.");
+  }
 }
 
 // Prepare analysis data based on AI's conversation memory
@@ -1935,6 +2221,7 @@ window.stopAudioForAnalysis = stopAudioForAnalysis;
 window.reconnectForAnalysis = reconnectForAnalysis;
 window.waitForTextModeAndSendAnalysis = waitForTextModeAndSendAnalysis;
 window.startRolePlayAnalysis = startRolePlayAnalysis;
+window.requestServerAnalysis = requestServerAnalysis;
 window.handleAnalysisResponse = handleAnalysisResponse;
 window.resetSystemAfterAnalysis = resetSystemAfterAnalysis;
 window.renderDynamicFeedbackPage = renderDynamicFeedbackPage;
@@ -2259,7 +2546,7 @@ function captureAndSendFrame() {
     
     // Resize if needed
     let { width, height } = canvasElement;
-    let base64Data; // Declare at function level to avoid scope issues
+    let sourceCanvas = canvasElement;
     
     if (width > maxWidth || height > maxHeight) {
       const ratio = Math.min(maxWidth / width, maxHeight / height);
@@ -2273,36 +2560,38 @@ function captureAndSendFrame() {
       tempCanvas.height = height;
       
       tempContext.drawImage(canvasElement, 0, 0, width, height);
-      
-      // Convert resized canvas to base64
-      const imageData = tempCanvas.toDataURL('image/jpeg', quality);
-      base64Data = imageData.split(',')[1];
-      
-      sendMessage({
-        mime_type: "image/jpeg",
-        data: base64Data,
-        metadata: {
-          source: currentVideoMode,
-          width: width,
-          height: height
-        }
-      });
-    } else {
-      // Use original size
-      const imageData = canvasElement.toDataURL('image/jpeg', quality);
-      base64Data = imageData.split(',')[1];
-      
-      sendMessage({
-        mime_type: "image/jpeg",
-        data: base64Data,
-        metadata: {
-          source: currentVideoMode,
-          width: width,
-          height: height
+      sourceCanvas = tempCanvas;
+    }
+    
+    if (useBinaryFraming) {
+      // Send the encoded JPEG bytes directly, skipping the data URL and Base64
+      const mode = currentVideoMode;
+      sourceCanvas.toBlob((blob) => {
+        if (!blob) {
+          return;
         }
-      });
+        blob.arrayBuffer().then((buffer) => {
+          sendBinaryFrame("image/jpeg", buffer, mode);
+          console.log(`[CLIENT TO AGENT] sent ${mode} image: ${buffer.byteLength} bytes`);
+        });
+      }, 'image/jpeg', quality);
+      return;
     }
     
+    // Convert canvas to base64
+    const imageData = sourceCanvas.toDataURL('image/jpeg', quality);
+    const base64Data = imageData.split(',')[1];
+    
+    sendMessage({
+      mime_type: "image/jpeg",
+      data: base64Data,
+      metadata: {
+        source: currentVideoMode,
+        width: width,
+        height: height
+      }
+    });
+    
     console.log(`[CLIENT TO AGENT] sent ${currentVideoMode} image: ${base64Data.length} chars`);
     
   } catch (error) {
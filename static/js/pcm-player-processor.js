@@ -22,6 +22,12 @@ class PCMPlayerProcessor extends AudioWorkletProcessor {
           return;
         }
   
+        // Decoded Opus arrives as float samples already
+        if (event.data instanceof Float32Array) {
+          this._enqueueFloat(event.data);
+          return;
+        }
+
         // Decode the base64 data to int16 array.
         const int16Samples = new Int16Array(event.data);
   
@@ -47,6 +53,17 @@ class PCMPlayerProcessor extends AudioWorkletProcessor {
       }
     }
   
+    // Push incoming float samples into our ring buffer.
+    _enqueueFloat(floatSamples) {
+      for (let i = 0; i < floatSamples.length; i++) {
+        this.buffer[this.writeIndex] = floatSamples[i];
+        this.writeIndex = (this.writeIndex + 1) % this.bufferSize;
+        if (this.writeIndex === this.readIndex) {
+          this.readIndex = (this.readIndex + 1) % this.bufferSize;
+        }
+      }
+    }
+  
     // The system calls `process()` ~128 samples at a time (depending on the browser).
     // We fill the output buffers from our ring buffer.
     process(inputs, outputs, parameters) {
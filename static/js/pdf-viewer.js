@@ -13,6 +13,9 @@ class PDFViewer {
     this.scale = 1.0;
     this.canvas = null;
     this.ctx = null;
+    // Server-side text index of the open document (see /documents)
+    this.documentId = null;
+    this.pageReportTimer = null;
     
     this.init();
   }
@@ -180,6 +183,9 @@ class PDFViewer {
       `;
 
       const arrayBuffer = await file.arrayBuffer();
+      // Index the text on the server; pdf.js takes ownership of the buffer
+      this.documentId = null;
+      this.indexDocument(arrayBuffer.slice(0), file.name);
       this.pdfDoc = await pdfjsLib.getDocument(arrayBuffer).promise;
       
       // Update UI
@@ -237,6 +243,7 @@ class PDFViewer {
       
       // Update page number display
       document.getElementById('pageNumInput').value = num;
+      this.schedulePageReport();
       
       // If there was a pending page render, do it now
       if (this.pageNumPending !== null) {
@@ -381,6 +388,39 @@ class PDFViewer {
     }
   }
 
+  // Upload the document once so the agent gets page text instead of screenshots
+  async indexDocument(buffer, name) {
+    try {
+      const response = await fetch(`/documents?name=${encodeURIComponent(name)}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/pdf' },
+        body: buffer
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const info = await response.json();
+      this.documentId = info.document_id;
+      console.log('PDF indexed:', info.document_id, 'Pages:', info.pages);
+      this.schedulePageReport();
+    } catch (error) {
+      console.warn('PDF text index unavailable:', error);
+    }
+  }
+
+  // Report the visible page once the learner has stayed on it for a moment
+  schedulePageReport() {
+    clearTimeout(this.pageReportTimer);
+    if (!this.documentId) return;
+    this.pageReportTimer = setTimeout(() => this.reportVisiblePage(), 1500);
+  }
+
+  reportVisiblePage() {
+    if (this.documentId && window.onPdfPageVisible) {
+      window.onPdfPageVisible(this.documentId, this.pageNum);
+    }
+  }
+
   // Public method to get PDF info
   getPDFInfo() {
     if (!this.pdfDoc) return null;